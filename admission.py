@@ -0,0 +1,135 @@
+import time
+from typing import Callable, NamedTuple
+
+
+class RateLimit(NamedTuple):
+    rate: float  # Comandos por segundo, em regime
+    burst: int  # Comandos aceitos de uma vez, acima da taxa
+
+
+# Classe de cada comando limitado; comandos fora da tabela (ex.: -sair, -confirmar) não são limitados
+COMMAND_CLASSES = {
+    '-msg': 'mensagem',
+    '-msgt': 'global',
+    '-listarusuarios': 'listagem',
+    '-listargrupos': 'listagem',
+    '-listarusrgrupo': 'listagem',
+    '-historico': 'listagem',
+    '-stats': 'listagem',
+    '-criargrupo': 'grupo',
+    '-entrargrupo': 'grupo',
+    '-sairgrupo': 'grupo',
+}
+DEFAULT_LIMITS = {
+    'mensagem': RateLimit(50, 200),
+    'global': RateLimit(1, 5),
+    'listagem': RateLimit(2, 10),
+    'grupo': RateLimit(5, 20),
+}
+# Classes cujo custo cresce com o total de usuários; são descartadas primeiro em sobrecarga
+EXPENSIVE_CLASSES = frozenset(('global', 'listagem'))
+
+
+class TokenBucket:
+    __slots__ = ('limit', 'tokens', 'updated')
+
+    def __init__(self, limit: RateLimit, now: float):
+        self.limit = limit
+        self.tokens = float(limit.burst)
+        self.updated = now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.limit.burst, self.tokens + (now - self.updated) * self.limit.rate)
+        self.updated = now
+
+    def take(self, now: float) -> bool:
+        self._refill(now)
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def retry_after(self) -> float:
+        """Segundos até o próximo comando ser aceito."""
+        return max(0.0, (1 - self.tokens) / self.limit.rate)
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.limit.burst
+
+
+class AdmissionControl:
+    """
+    Controle de admissão antes do dispatcher:
+
+    - Limite por usuário e por classe de comando (token bucket): um cliente que envia rápido demais
+      recebe um ERROR com o tempo de espera, sem afetar os demais.
+    - Sobrecarga: se a soma das filas de saída passar de overload_queue_depth, ou a duração média
+      dos comandos passar de overload_latency segundos, comandos das classes caras (globais e
+      listagens) são recusados até a carga voltar ao normal.
+
+    queue_depth é a função que informa a soma das filas de saída; o Server a define ao receber
+    o AdmissionControl.
+    """
+
+    def __init__(self, limits: dict[str, RateLimit] = None, overload_queue_depth: int = 100_000,
+                 overload_latency: float = 0.1, check_interval: float = 0.5):
+        self.limits = DEFAULT_LIMITS if limits is None else limits
+        self.overload_queue_depth = overload_queue_depth
+        self.overload_latency = overload_latency
+        self.check_interval = check_interval
+        self.queue_depth: Callable[[], int] | None = None
+        self.latency = 0.0  # Média móvel exponencial da duração dos comandos, em segundos
+        self._observed = False
+        self.overloaded = False
+        self.rejected = 0
+        self.shed = 0
+        self._checked = 0.0
+        self._buckets = {}  # {username: {classe: TokenBucket}}
+
+    def admit(self, username: str, message: str) -> str | None:
+        """:return: None se o comando pode ser executado, ou a mensagem de erro para o cliente."""
+        verb = message.partition(' ')[0]
+        command_class = COMMAND_CLASSES.get(verb)
+        limit = self.limits.get(command_class)
+        if limit is None:
+            return None
+        now = time.monotonic()
+        if command_class in EXPENSIVE_CLASSES and self._is_overloaded(now):
+            self.shed += 1
+            return f'Servidor sobrecarregado: {verb} está temporariamente indisponível. Tente novamente mais tarde.'
+        buckets = self._buckets.get(username)
+        if buckets is None:
+            buckets = self._buckets[username] = {}
+        bucket = buckets.get(command_class)
+        if bucket is None:
+            bucket = buckets[command_class] = TokenBucket(limit, now)
+        if bucket.take(now):
+            return None
+        self.rejected += 1
+        return f'Limite de comandos {verb} excedido. Tente novamente em {bucket.retry_after():.1f}s.'
+
+    def observe(self, duration: float):
+        """Registra a duração de um comando executado."""
+        self.latency += (duration - self.latency) * 0.05
+        self._observed = True
+
+    def forget(self, username: str):
+        """Descarta os limites de um usuário que saiu, a menos que ele ainda esteja sendo limitado."""
+        buckets = self._buckets.get(username)
+        if buckets is not None:
+            now = time.monotonic()
+            if all(bucket.full(now) for bucket in list(buckets.values())):
+                self._buckets.pop(username, None)
+
+    def _is_overloaded(self, now: float) -> bool:
+        # Somar as filas percorre todas as conexões: reavaliado no máximo a cada check_interval
+        if now - self._checked >= self.check_interval:
+            self._checked = now
+            if not self._observed:
+                # Sem comandos executados desde a última verificação (ex.: todos recusados): a média decai
+                self.latency /= 2
+            self._observed = False
+            depth = self.queue_depth() if self.queue_depth is not None else 0
+            self.overloaded = depth > self.overload_queue_depth or self.latency > self.overload_latency
+        return self.overloaded
@@ -0,0 +1,168 @@
+import asyncio
+
+from admission import AdmissionControl
+from broadcast_log import BroadcastLog
+from compression import Compression
+from connection import StreamConnection
+from group_history import GroupHistory
+from log import ensure_configured, logger
+from protocol import RECV_BUFFER_SIZE
+from offline_store import SegmentLogOfflineStore
+from resumption import SessionResumption
+from server import REPLAY_MAX_INFLIGHT, Server
+from state_store import StateStore
+
+try:
+    import resource
+except ImportError:  # Windows não possui o módulo resource
+    resource = None
+
+
+class AsyncServer(Server):
+    """
+    Servidor baseado em asyncio: todas as conexões e handlers de comando rodam em um único
+    event loop, sem uma thread por cliente. Fala o mesmo protocolo do Server.
+    """
+    # Comandos que podem bloquear (ex.: esperar uma resposta do broker), executados por _run_blocking
+    blocking_commands = frozenset()
+
+    def run(self):
+        ensure_configured()
+        AsyncServer._raise_open_files_limit()
+        try:
+            asyncio.run(self._serve())
+        except KeyboardInterrupt:
+            logger.warning("Servidor interrompido manualmente. Fechando conexões...")
+
+    async def _serve(self):
+        self._start_server()
+        self.server_socket.setblocking(False)
+        self.fanout.use_loop(asyncio.get_running_loop())
+        try:
+            server = await asyncio.start_server(self._handle_connection, sock=self.server_socket)
+            unix_servers = []
+            for unix_socket in self.unix_sockets:
+                unix_socket.setblocking(False)
+                unix_servers.append(await asyncio.start_unix_server(self._handle_connection, sock=unix_socket))
+            if self.metrics is not None:
+                loop = asyncio.get_running_loop()
+                self.metrics.gauge('tasks', lambda: len(asyncio.all_tasks(loop)), 'Tarefas do event loop')
+            if self.lifecycle.enabled or self.resumption is not None:
+                asyncio.get_running_loop().create_task(self._reap_idle_connections_async())
+            try:
+                async with server:
+                    await server.serve_forever()
+            finally:
+                for unix_server in unix_servers:
+                    unix_server.close()
+        finally:
+            self._shutdown()
+
+    async def _reap_idle_connections_async(self):
+        while not self._stopping.is_set():
+            await asyncio.sleep(self._sweep_interval())
+            self._sweep_connections()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        connection = StreamConnection(writer, **self._connection_options())
+        self.lifecycle.track(connection)
+        address = connection.address
+        logger.info("Nova conexão de %s", address, extra={'address': address})
+        try:
+            username, pending = await self._receive_username_async(reader, connection)
+            if not username:
+                return
+            # Uma sessão retomada já está registrada e recebeu as mensagens perdidas
+            if self.registry.username_of(connection) is None:
+                if not await self._run_blocking(self._register_client, connection, username, address):
+                    return
+                await self._replay_offline_messages_async(connection, username)
+            await self._handle_client_messages_async(reader, connection, pending)
+        except Exception as e:
+            logger.error("Erro ao lidar com o cliente %s: %s", address, e, extra={'address': address})
+            if self.registry.username_of(connection) is not None or not connection.closed:
+                self._remove_client(connection)
+        finally:
+            self.lifecycle.untrack(connection)
+
+    async def _receive_username_async(self, reader: asyncio.StreamReader,
+                                      connection: StreamConnection) -> tuple[str, list[str]]:
+        messages = []
+        while not messages:
+            data = await reader.read(RECV_BUFFER_SIZE)
+            if not data:
+                break
+            messages = connection.feed(data)
+        return self._validate_username(connection, messages)
+
+    async def _replay_offline_messages_async(self, connection: StreamConnection, username: str):
+        chunks = self._pending_chunks(username)
+        try:
+            while (chunk := await self._run_blocking(next, chunks, None)) is not None:
+                Server.send_messages_safe(connection, chunk)
+                await connection.wait_for_capacity(REPLAY_MAX_INFLIGHT)
+                if connection.closed:
+                    break
+        finally:
+            chunks.close()
+
+    async def _handle_client_messages_async(self, reader: asyncio.StreamReader, connection: StreamConnection,
+                                            pending: list[str]):
+        username = self.clients.get(connection, "Desconhecido")
+        try:
+            messages = pending
+            while await self._process_messages_async(connection, username, messages):
+                data = await reader.read(RECV_BUFFER_SIZE)
+                if not data:
+                    # EOF: o cliente fechou a conexão
+                    break
+                messages = connection.feed(data)
+        except (ConnectionResetError, ConnectionAbortedError, BrokenPipeError):
+            logger.warning("Conexão perdida com %s.", username, extra={'user': username})
+        except Exception:
+            logger.exception("Erro inesperado com %s", username, extra={'user': username})
+            self._send_error_response(connection, "Erro interno no servidor.")
+        finally:
+            self._remove_client(connection)
+
+    async def _process_messages_async(self, connection: StreamConnection, username: str, messages: list[str]) -> bool:
+        """Como Server._process_messages, mas aguarda a fila de saída e o fan-out sem bloquear o event loop."""
+        for message in messages:
+            if connection.queue_depth > self.queue_size // 2:
+                await connection.wait_for_capacity(self.queue_size // 4)
+            # Shards de fan-out acumulados: deixa o loop entregá-los antes de aceitar mais mensagens
+            await self.fanout.wait_for_capacity()
+            if not message:
+                continue
+            if message.partition(' ')[0] in self.blocking_commands:
+                keep_going = await self._run_blocking(self._process_message, connection, username, message)
+            else:
+                keep_going = self._process_message(connection, username, message)
+            if not keep_going:
+                return False
+        return True
+
+    async def _run_blocking(self, function, *args):
+        """Executa uma chamada que pode bloquear; aqui nenhuma bloqueia, então ela roda no próprio loop."""
+        return function(*args)
+
+    @staticmethod
+    def _raise_open_files_limit():
+        """Cada conexão consome um descritor de arquivo; eleva o limite soft até o hard."""
+        if resource is None:
+            return
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if hard == resource.RLIM_INFINITY or soft < hard:
+            try:
+                resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+            except (ValueError, OSError):
+                pass
+
+
+if __name__ == '__main__':
+    server = AsyncServer('localhost', 50001, offline_store=SegmentLogOfflineStore('offline_data'),
+                         idle_timeout=90, heartbeat_interval=30, state_store=StateStore('state_data'),
+                         admission=AdmissionControl(), group_history=GroupHistory(directory='history_data'),
+                         resumption=SessionResumption(), compression=Compression(),
+                         broadcast_log=BroadcastLog(directory='broadcast_data'))
+    server.run()
@@ -0,0 +1,57 @@
+"""
+Micro-benchmark do custo de interpretar um comando: a cadeia de match/substring com
+extract_command_parts usada antes (cada -msg era dividido duas vezes) contra a divisão
+única e a busca por verbo do CommandDispatcher.
+
+Uso: python benchmarks/bench_commands.py [repetições]
+"""
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from commands import CommandDispatcher
+from utils import extract_command_parts
+
+COMMANDS = [
+    '-msg U Maria olá, tudo bem com você?',
+    '-msg G grupo1 mensagem para o grupo',
+    '-msgt T aviso para todos os usuários',
+    '-entrargrupo grupo1',
+    '-listarusuarios',
+]
+
+
+def parse_legacy(message: str):
+    """Reproduz a interpretação feita pelo servidor antes do dispatcher."""
+    if message in ('-sair', '-listarusuarios'):
+        return message
+    if message.startswith('-msg'):
+        return extract_command_parts(message, 4), extract_command_parts(message, 3)
+    if 'grupo' in message:
+        return message.split(' ', 1)[0], extract_command_parts(message, 2)
+    return None
+
+
+def build_dispatcher() -> CommandDispatcher:
+    dispatcher = CommandDispatcher(on_error=lambda client_socket, message: None)
+    handler = lambda client_socket, username, command: None  # noqa: E731
+    dispatcher.register('-msg', handler, arity=3)
+    dispatcher.register('-msgt', handler, arity=2)
+    dispatcher.register('-entrargrupo', handler, arity=1)
+    dispatcher.register('-listarusuarios', handler)
+    return dispatcher
+
+
+def main(number: int = 500_000):
+    dispatcher = build_dispatcher()
+    print(f'{"comando":<40} {"antes (ns)":>12} {"dispatcher (ns)":>16}')
+    for message in COMMANDS:
+        namespace = {'parse_legacy': parse_legacy, 'parse': dispatcher.parse, 'message': message}
+        old = timeit.timeit('parse_legacy(message)', globals=namespace, number=number) / number * 1e9
+        new = timeit.timeit('parse(message)', globals=namespace, number=number) / number * 1e9
+        print(f'{message[:40]:<40} {old:>12.0f} {new:>16.0f}')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,163 @@
+"""
+Micro-benchmarks dos caminhos quentes do Server, executados diretamente nos handlers, sem
+sockets: as conexões são NullConnection, que passam pelo mesmo Connection.send (fila e
+codificação) e descartam os dados como um writer instantâneo.
+
+Os resultados (ns por operação, o melhor de --repeat medições) podem ser gravados como
+baseline em JSON; com --compare, o script termina com código 1 se algum benchmark ficar mais
+de --threshold % mais lento que o baseline. Compare apenas resultados da mesma máquina.
+
+Uso:
+    python benchmarks/bench_server.py --save baseline.json
+    python benchmarks/bench_server.py --compare baseline.json --threshold 10
+    python benchmarks/bench_server.py --filter group
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import timeit
+from functools import partial
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+import log
+from connection import Connection
+from fanout import FanoutPool
+from server import Server
+from utils import extract_command_parts
+
+GROUP_SIZES = (10, 1_000, 10_000)
+OFFLINE_USERS = 100_000
+MESSAGE = 'olá, tudo bem? mensagem de tamanho típico para o benchmark'
+
+
+class NullConnection(Connection):
+    """Conexão sem transporte: os dados enfileirados são descartados a cada envio."""
+
+    def _wake_writer(self):
+        self.outbound.clear()
+
+    def abort(self):
+        self.closed = True
+
+
+def build_server(users: int) -> tuple[Server, list[NullConnection]]:
+    """Server com users usuários conectados (Usuario00000, ...), sem iniciar o socket de escuta."""
+    # Limiar infinito: o fan-out é medido inline, sem depender do agendamento das threads de entrega
+    server = Server('localhost', 0, fanout=FanoutPool(threshold=sys.maxsize))
+    server.server_socket.close()
+    connections = []
+    for index in range(users):
+        username = f'Usuario{index:05d}'
+        connection = NullConnection(('127.0.0.1', index))
+        server.registry.connect(connection, username)
+        server.all_users.add(username)
+        connections.append(connection)
+    return server, connections
+
+
+def bench_extract_command_parts():
+    return partial(extract_command_parts, f'-msg U Maria {MESSAGE}', 4)
+
+
+def bench_dispatch_private():
+    """-msg U inteiro: admissão desligada, dispatcher, handler e entrega a um usuário conectado."""
+    server, connections = build_server(1_000)
+    return partial(server._process_message, connections[0], 'Usuario00000', f'-msg U Usuario00999 {MESSAGE}')
+
+
+def bench_private_lookup():
+    """Busca do destinatário e entrega em _send_private_message, com 10 mil usuários conectados."""
+    server, connections = build_server(10_000)
+    return partial(server._send_private_message, 'Usuario00000', 'Usuario05000', connections[0], MESSAGE)
+
+
+def bench_group_fanout(members: int):
+    server, connections = build_server(members)
+    server.registry.create_group('grupo', 'Usuario00000')
+    for index in range(1, members):
+        server.registry.join_group('grupo', f'Usuario{index:05d}')
+    return partial(server._handle_group_message, 'grupo', 'Usuario00000', connections[0], MESSAGE)
+
+
+def bench_disconnected_users():
+    """Mensagem para todos os desconectados, com OFFLINE_USERS usuários conhecidos."""
+    server, _ = build_server(0)
+    server.all_users.update(f'Offline{index:06d}' for index in range(OFFLINE_USERS))
+    return partial(server.handle_message_disconnected_users, 'Usuario00000', MESSAGE, suppress_print=True)
+
+
+BENCHMARKS = {
+    'extract_command_parts': bench_extract_command_parts,
+    'dispatch_private_message': bench_dispatch_private,
+    'private_recipient_lookup': bench_private_lookup,
+    **{f'group_fanout_{size}': partial(bench_group_fanout, size) for size in GROUP_SIZES},
+    f'disconnected_users_{OFFLINE_USERS}': bench_disconnected_users,
+}
+
+
+def measure(function, repeat: int) -> tuple[float, int]:
+    """:return: O melhor tempo por operação em nanossegundos e o número de operações por medição."""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return best / number * 1e9, number
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """:return: Os benchmarks que regrediram mais que threshold %."""
+    regressions = []
+    print(f'\n{"benchmark":<32} {"baseline (ns)":>14} {"atual (ns)":>12} {"variação":>10}')
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            print(f'{name:<32} {"-":>14} {result["ns_per_op"]:>12.0f} {"novo":>10}')
+            continue
+        change = (result['ns_per_op'] / reference['ns_per_op'] - 1) * 100
+        regressed = change > threshold
+        if regressed:
+            regressions.append(name)
+        print(f'{name:<32} {reference["ns_per_op"]:>14.0f} {result["ns_per_op"]:>12.0f} {change:>+9.1f}%'
+              f'{"  REGRESSÃO" if regressed else ""}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='medições por benchmark; vale a mais rápida')
+    parser.add_argument('--filter', help='executa apenas os benchmarks cujo nome contém o texto')
+    parser.add_argument('--save', help='grava os resultados como baseline neste arquivo JSON')
+    parser.add_argument('--compare', help='baseline JSON com que os resultados são comparados')
+    parser.add_argument('--threshold', type=float, default=10.0, help='regressão máxima aceita, em %%')
+    args = parser.parse_args()
+
+    # Sem os registros INFO de cada mensagem: a thread que os formata disputaria o GIL com as medições
+    log.configure(level='WARNING', stream=open(os.devnull, 'w'))
+    results = {}
+    print(f'{"benchmark":<32} {"ns/op":>12} {"operações":>10}')
+    for name, setup in BENCHMARKS.items():
+        if args.filter and args.filter not in name:
+            continue
+        ns_per_op, number = measure(setup(), args.repeat)
+        results[name] = {'ns_per_op': round(ns_per_op, 1), 'number': number}
+        print(f'{name:<32} {ns_per_op:>12.0f} {number:>10}')
+    log.shutdown()
+
+    if args.save:
+        report = {'python': platform.python_version(), 'platform': platform.platform(),
+                  'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}
+        with open(args.save, 'w') as file:
+            json.dump(report, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)['results']
+        if regressions := compare(results, baseline, args.threshold):
+            print(f'\nRegressões acima de {args.threshold:g}%: {", ".join(regressions)}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+"""
+Gerador de carga headless: simula N usuários contra um servidor local e mede vazão e latência
+de entrega. Cada usuário simulado é um Client sem terminal (protocolo com framing), todos no mesmo
+event loop; os comandos são sorteados conforme o mix configurado.
+
+O resultado é impresso em JSON, para comparar engines e mudanças de protocolo na mesma máquina.
+
+Uso:
+    python benchmarks/loadgen.py --users 500 --duration 20 --engine asyncio
+    python benchmarks/loadgen.py --connect localhost:50001 --mix msg_u=50,msg_g=50
+    python benchmarks/loadgen.py --engine asyncio --unix /tmp/chat.sock
+    python benchmarks/loadgen.py --connect unix:/tmp/chat.sock
+    python benchmarks/loadgen.py --engine asyncio --compression
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+from client import UNIX_PREFIX, Client, parse_address
+
+DEFAULT_MIX = 'msg_u=40,msg_g=30,msgt_c=3,msgt_d=2,msgt_t=2,join=8,leave=7,reconnect=8'
+OPERATIONS = ('msg_u', 'msg_g', 'msgt_c', 'msgt_d', 'msgt_t', 'join', 'leave', 'reconnect')
+# Marcador incluído no texto das mensagens: operação e instante de envio em nanossegundos
+MARKER = 'LG|'
+
+ENGINES = {
+    'threaded': "from server import Server; Server('localhost', {port}{options}).run()",
+    'asyncio': "from async_server import AsyncServer; AsyncServer('localhost', {port}{options}).run()",
+    'cluster': "from cluster import run_cluster; run_cluster('localhost', {port}{options})",
+}
+
+
+def parse_mix(text: str) -> dict[str, float]:
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f'Operação desconhecida no mix: {name}')
+        mix[name] = float(weight)
+    return mix
+
+
+def percentile(samples: list[float], fraction: float) -> float | None:
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+class Stats:
+    def __init__(self):
+        self.sent = dict.fromkeys(OPERATIONS, 0)
+        self.latencies = {}  # {operação: [latências em ms]}
+        self.delivered = 0
+        self.errors = 0
+        self.login_failures = 0
+
+    def record_delivery(self, text: str, received_ns: int):
+        position = text.rfind(MARKER)
+        if position < 0:
+            return
+        try:
+            operation, sent_ns = text[position + len(MARKER):].split('|', 1)
+            latency = (received_ns - int(sent_ns)) / 1e6
+        except ValueError:
+            return
+        self.delivered += 1
+        self.latencies.setdefault(operation, []).append(latency)
+
+    def report(self, elapsed: float, users: int) -> dict:
+        latency = {}
+        for operation, samples in sorted(self.latencies.items()):
+            samples.sort()
+            latency[operation] = {
+                'count': len(samples),
+                'p50_ms': percentile(samples, 0.50),
+                'p99_ms': percentile(samples, 0.99),
+                'p999_ms': percentile(samples, 0.999),
+                'max_ms': samples[-1],
+            }
+        commands = sum(self.sent.values())
+        return {
+            'users': users,
+            'duration_s': round(elapsed, 3),
+            'commands_sent': commands,
+            'commands_per_s': round(commands / elapsed, 1) if elapsed else None,
+            'deliveries': self.delivered,
+            'deliveries_per_s': round(self.delivered / elapsed, 1) if elapsed else None,
+            'errors': self.errors,
+            'login_failures': self.login_failures,
+            'sent_by_operation': self.sent,
+            'latency': latency,
+        }
+
+
+class SimulatedUser:
+    """Usuário simulado: um Client sem terminal, enviando comandos sorteados."""
+
+    def __init__(self, name: str, host: str, port: int, stats: Stats):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.stats = stats
+        self.groups = set()
+        self.client = None
+
+    async def connect(self, attempts: int = 20) -> bool:
+        for _ in range(attempts):
+            # Um Client novo por sessão: o codec guarda o estado do protocolo da conexão
+            self.client = Client(self.host, self.port, on_message=self._handle)
+            if await self.client.connect(self.name):
+                return True
+            self.client = None
+            # A sessão anterior pode ainda não ter sido liberada pelo servidor
+            await asyncio.sleep(0.05)
+        self.stats.login_failures += 1
+        return False
+
+    async def disconnect(self):
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+
+    def _handle(self, header: str | None, text: str):
+        if header == 'ERROR':
+            self.stats.errors += 1
+        elif header is None:
+            self.stats.record_delivery(text, time.perf_counter_ns())
+
+    async def send(self, operation: str, command: str):
+        if self.client is None or self.client.writer.is_closing():
+            return
+        self.stats.sent[operation] += 1
+        try:
+            await self.client.send(command)
+        except ConnectionError:
+            self.stats.errors += 1
+
+
+class LoadGenerator:
+    def __init__(self, host: str, port: int, users: int, groups: int, mix: dict[str, float],
+                 rate: float, duration: float, seed: int = None):
+        self.host = host
+        self.port = port
+        self.stats = Stats()
+        self.users = [SimulatedUser(f'user{index}', host, port, self.stats) for index in range(users)]
+        self.group_names = [f'grupo{index}' for index in range(groups)]
+        self.operations = list(mix)
+        self.weights = list(mix.values())
+        self.rate = rate
+        self.duration = duration
+        self.random = random.Random(seed)
+
+    async def run(self) -> dict:
+        await self._setup()
+        started = time.perf_counter()
+        deadline = started + self.duration
+        interval = len(self.users) / self.rate if self.rate else 0
+        await asyncio.gather(*(self._drive(user, deadline, interval) for user in self.users))
+        # Aguarda as entregas em trânsito antes de encerrar
+        await asyncio.sleep(0.5)
+        elapsed = time.perf_counter() - started
+        await asyncio.gather(*(user.disconnect() for user in self.users))
+        return self.stats.report(elapsed, len(self.users))
+
+    async def _setup(self):
+        for batch_start in range(0, len(self.users), 200):
+            await asyncio.gather(*(user.connect() for user in self.users[batch_start:batch_start + 200]))
+        owner = self.users[0]
+        for group_name in self.group_names:
+            await owner.send('join', f'-criargrupo {group_name}')
+            owner.groups.add(group_name)
+        await asyncio.sleep(0.2)
+        for user in self.users[1:]:
+            for group_name in self.random.sample(self.group_names, min(2, len(self.group_names))):
+                await user.send('join', f'-entrargrupo {group_name}')
+                user.groups.add(group_name)
+        await asyncio.sleep(0.2)
+        self.stats.sent = dict.fromkeys(OPERATIONS, 0)
+        self.stats.errors = 0
+
+    async def _drive(self, user: SimulatedUser, deadline: float, interval: float):
+        # Início escalonado para não sincronizar todos os usuários
+        await asyncio.sleep(self.random.uniform(0, interval))
+        while time.perf_counter() < deadline:
+            operation = self.random.choices(self.operations, self.weights)[0]
+            await self._perform(user, operation)
+            await asyncio.sleep(self.random.expovariate(1 / interval) if interval else 0)
+
+    async def _perform(self, user: SimulatedUser, operation: str):
+        marker = f'{MARKER}{operation}|{time.perf_counter_ns()}'
+        match operation:
+            case 'msg_u':
+                recipient = self.random.choice(self.users).name
+                await user.send(operation, f'-msg U {recipient} {marker}')
+            case 'msg_g':
+                if user.groups:
+                    group_name = self.random.choice(sorted(user.groups))
+                    await user.send(operation, f'-msg G {group_name} {marker}')
+            case 'msgt_c' | 'msgt_d' | 'msgt_t':
+                await user.send(operation, f'-msgt {operation[-1].upper()} {marker}')
+            case 'join':
+                available = [name for name in self.group_names if name not in user.groups]
+                if available:
+                    group_name = self.random.choice(available)
+                    await user.send(operation, f'-entrargrupo {group_name}')
+                    user.groups.add(group_name)
+            case 'leave':
+                if user.groups:
+                    group_name = self.random.choice(sorted(user.groups))
+                    await user.send(operation, f'-sairgrupo {group_name}')
+                    user.groups.discard(group_name)
+            case 'reconnect':
+                self.stats.sent[operation] += 1
+                await user.disconnect()
+                await asyncio.sleep(self.random.uniform(0.01, 0.2))
+                await user.connect()
+
+
+def start_server(engine: str, port: int, unix_path: str = None, compression: bool = False) -> subprocess.Popen:
+    options = f', unix_paths=[{unix_path!r}]' if unix_path else ''
+    code = ENGINES[engine].format(port=port, options=options + (', compression=Compression()' if compression else ''))
+    if compression:
+        code = 'from compression import Compression; ' + code
+    process = subprocess.Popen([sys.executable, '-c', code], cwd=ROOT,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('localhost', port), timeout=0.2).close()
+            if unix_path is None or os.path.exists(unix_path):
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('O servidor não iniciou a tempo')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--groups', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=10.0, help='segundos de carga')
+    parser.add_argument('--rate', type=float, default=1000.0, help='comandos por segundo, somando todos os usuários')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='threaded',
+                        help='engine do servidor iniciado localmente')
+    parser.add_argument('--port', type=int, default=50101)
+    parser.add_argument('--connect', help='host:porta ou unix:/caminho de um servidor já em execução, em vez de '
+                                          'iniciar um')
+    parser.add_argument('--unix', help='caminho de um socket Unix em que o servidor iniciado também escuta; '
+                                       'os usuários simulados conectam-se por ele')
+    parser.add_argument('--compression', action='store_true',
+                        help='o servidor iniciado comprime os lotes grandes (os usuários simulados sempre a oferecem)')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--output', help='arquivo para gravar o JSON, além da saída padrão')
+    args = parser.parse_args()
+
+    if args.unix and args.engine == 'cluster':
+        parser.error('--unix não é suportado com --engine cluster (cada worker escuta em um caminho próprio)')
+    server = None
+    if args.connect:
+        host, port = parse_address(args.connect)
+    else:
+        host, port = (f'{UNIX_PREFIX}{args.unix}', None) if args.unix else ('localhost', args.port)
+        server = start_server(args.engine, args.port, args.unix, args.compression)
+    try:
+        generator = LoadGenerator(host, port, args.users, args.groups, args.mix, args.rate, args.duration, args.seed)
+        report = asyncio.run(generator.run())
+    finally:
+        if server is not None:
+            # Ctrl+C: o modo cluster repassa o sinal aos workers antes de sair
+            server.send_signal(signal.SIGINT)
+            try:
+                server.wait(15)
+            except subprocess.TimeoutExpired:
+                server.kill()
+    report['engine'] = None if args.connect else args.engine
+    report['transport'] = 'unix' if host.startswith(UNIX_PREFIX) else 'tcp'
+    report['compression'] = None if args.connect else args.compression
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output)
+
+
+if __name__ == '__main__':
+    main()
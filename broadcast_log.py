@@ -0,0 +1,283 @@
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+from offline_store import DEFAULT_CHUNK_SIZE, RECORD_HEADER, SEGMENT_SUFFIX, scan_records
+
+DEFAULT_SEGMENT_SIZE = 1024
+# Retenção padrão: mensagens mais velhas que o TTL, ou além das max_messages mais recentes, são
+# descartadas mesmo que algum usuário que nunca mais voltou ainda não as tenha lido
+DEFAULT_TTL = 7 * 24 * 60 * 60.0
+DEFAULT_MAX_MESSAGES = 100_000
+# Registro do journal de cursores: sequência (REMOVED quando o cursor foi consumido) e tamanho do nome
+CURSOR_RECORD = struct.Struct('!qH')
+CURSORS_FILE = 'cursors.journal'
+REMOVED = -1
+
+
+class _Segment:
+    __slots__ = ('first_seq', 'count', 'newest', 'entries')
+
+    def __init__(self, first_seq: int, entries: list | None):
+        self.first_seq = first_seq
+        self.count = 0
+        self.newest = 0.0  # Instante da mensagem mais recente, usado pelo TTL
+        # [(timestamp, mensagem), ...] no log em memória; None quando as mensagens ficam só em disco
+        self.entries = entries
+
+    @property
+    def last_seq(self) -> int:
+        return self.first_seq + self.count - 1
+
+
+class BroadcastLog:
+    """
+    Log compartilhado, numerado por sequência, das mensagens globais (-msgt D/T) destinadas a
+    usuários desconectados. Cada mensagem é gravada uma única vez; cada usuário desconectado
+    guarda apenas um cursor com a última sequência que já conhecia ao sair.
+
+    Segmentos que todos os cursores já ultrapassaram, mais velhos que o TTL ou além das
+    max_messages mais recentes (arredondado para segmentos inteiros) são descartados.
+
+    Com directory, os segmentos ficam em disco (no formato do SegmentLogOfflineStore) e apenas
+    seus contadores em memória; os cursores são gravados em um journal, então as mensagens e a
+    posição de cada usuário sobrevivem a um reinício.
+    """
+
+    def __init__(self, segment_size: int = DEFAULT_SEGMENT_SIZE, ttl: float = DEFAULT_TTL,
+                 max_messages: int = DEFAULT_MAX_MESSAGES, directory: str = None):
+        self.segment_size = segment_size
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self.directory = directory
+        self.last_seq = 0
+        self._segments = deque()
+        self._cursors = {}  # {username: última sequência conhecida}
+        self._lock = threading.Lock()
+        self._journal = None
+        self._journal_records = 0
+        self._recovered_tail = None  # Último segmento de uma execução anterior; não recebe novas mensagens
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._load()
+
+    def append(self, message: str) -> int:
+        with self._lock:
+            self.last_seq += 1
+            tail = self._segments[-1] if self._segments else None
+            if tail is None or tail.count >= self.segment_size or tail is self._recovered_tail:
+                self._collect()
+                tail = _Segment(self.last_seq, None if self.directory is not None else [])
+                self._segments.append(tail)
+            timestamp = time.time()
+            if tail.entries is not None:
+                tail.entries.append((timestamp, message))
+            else:
+                data = message.encode('utf-8')
+                with open(self._segment_path(tail.first_seq), 'ab') as segment:
+                    segment.write(RECORD_HEADER.pack(timestamp, len(data)) + data)
+            tail.count += 1
+            tail.newest = timestamp
+            return self.last_seq
+
+    def park(self, username: str):
+        """Registra o cursor do usuário que acabou de se desconectar."""
+        with self._lock:
+            if username in self._cursors:
+                # Replay interrompido: o cursor ainda marca a última mensagem entregue
+                return
+            self._cursors[username] = self.last_seq
+            self._write_cursor(username, self.last_seq)
+
+    def park_all(self, usernames):
+        """
+        Registra na sequência atual o cursor dos usuários que ainda não têm um, como os restaurados
+        de um snapshot: sem cursor, eles não receberiam as mensagens globais publicadas a partir daqui.
+        """
+        with self._lock:
+            missing = [username for username in usernames if username not in self._cursors]
+            if not missing:
+                return
+            self._cursors.update(dict.fromkeys(missing, self.last_seq))
+            if self._journal is not None:
+                self._rewrite_cursors()
+
+    def pending(self, username: str) -> int:
+        cursor = self._cursors.get(username)
+        if cursor is None or not self._segments:
+            return 0
+        return self.last_seq - max(cursor, self._segments[0].first_seq - 1)
+
+    def retained(self) -> int:
+        """Quantidade de mensagens ainda mantidas no log."""
+        return sum(segment.count for segment in list(self._segments))
+
+    def pop_chunks(self, username: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        Gera, em blocos, as mensagens publicadas depois que o usuário se desconectou.
+        O cursor só é removido ao fim do replay; se ele for interrompido (close()), o cursor fica
+        na última mensagem entregue e o restante continua guardado, como no OfflineStore.
+        """
+        with self._lock:
+            cursor = self._cursors.get(username)
+            if cursor is None:
+                return
+            # Cópia rasa: os segmentos não mudam de lugar, só recebem novas entradas no final
+            segments = list(self._segments)
+            last_seq = self.last_seq
+        expires_before = time.time() - self.ttl if self.ttl else None
+        chunk = []
+        delivered = cursor
+        finished = False
+        try:
+            for segment in segments:
+                if segment.first_seq > last_seq or segment.last_seq <= cursor:
+                    continue
+                start = max(cursor + 1 - segment.first_seq, 0)
+                end = last_seq - segment.first_seq + 1
+                for position, (timestamp, message) in enumerate(self._read(segment, start, end), start):
+                    if expires_before is not None and timestamp < expires_before:
+                        continue
+                    chunk.append(message)
+                    if len(chunk) >= chunk_size:
+                        # Um bloco entregue ao chamador conta como lido
+                        delivered = segment.first_seq + position
+                        yield chunk
+                        chunk = []
+            if chunk:
+                delivered = last_seq
+                yield chunk
+            finished = True
+        finally:
+            with self._lock:
+                if finished:
+                    self._cursors.pop(username, None)
+                    self._write_cursor(username, REMOVED)
+                elif delivered != cursor and username in self._cursors:
+                    self._cursors[username] = delivered
+                    self._write_cursor(username, delivered)
+
+    def _read(self, segment: _Segment, start: int, end: int):
+        """Gera (timestamp, mensagem) das posições [start, end) do segmento."""
+        if segment.entries is not None:
+            yield from segment.entries[start:end]
+            return
+        try:
+            for index, record in enumerate(scan_records(self._segment_path(segment.first_seq))):
+                if index >= end:
+                    return
+                if index >= start:
+                    yield record
+        except FileNotFoundError:
+            # Segmento descartado pela retenção durante a leitura
+            return
+
+    def collect(self):
+        with self._lock:
+            self._collect()
+
+    def _collect(self):
+        """Remove os segmentos que nenhum cursor ainda precisa ler, ou que saíram da retenção."""
+        if not self._segments:
+            return
+        oldest_cursor = min(self._cursors.values(), default=self.last_seq)
+        expires_before = time.time() - self.ttl if self.ttl else None
+        retained = sum(segment.count for segment in self._segments)
+        while self._segments:
+            segment = self._segments[0]
+            expired = expires_before is not None and segment.count and segment.newest < expires_before
+            # Conta com o segmento que está sendo aberto: o limite vale quando ele estiver cheio
+            over_limit = (self.max_messages is not None
+                          and retained + self.segment_size > self.max_messages)
+            if segment is self._segments[-1] and not expired:
+                # O segmento atual continua recebendo mensagens
+                break
+            if segment.last_seq > oldest_cursor and not expired and not over_limit:
+                break
+            self._segments.popleft()
+            retained -= segment.count
+            if self.directory is not None:
+                try:
+                    os.remove(self._segment_path(segment.first_seq))
+                except FileNotFoundError:
+                    pass
+
+    def close(self):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    # Disco
+
+    def _segment_path(self, first_seq: int) -> str:
+        return os.path.join(self.directory, f'{first_seq:012d}{SEGMENT_SUFFIX}')
+
+    def _load(self):
+        """Reconstrói os segmentos (lendo apenas os cabeçalhos), os cursores e a última sequência."""
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(SEGMENT_SUFFIX))
+        for name in names:
+            segment = _Segment(int(name[:-len(SEGMENT_SUFFIX)]), None)
+            for timestamp, _ in scan_records(os.path.join(self.directory, name), read_messages=False):
+                segment.count += 1
+                segment.newest = timestamp
+            if segment.count:
+                self._segments.append(segment)
+            else:
+                os.remove(os.path.join(self.directory, name))
+        if self._segments:
+            # Pode terminar em um registro incompleto, deixado por uma queda: as novas mensagens vão para outro
+            self._recovered_tail = self._segments[-1]
+        self._cursors = self._read_cursors()
+        # Os cursores guardam a última sequência mesmo depois que todos os segmentos foram descartados
+        self.last_seq = max(self._segments[-1].last_seq if self._segments else 0,
+                            max(self._cursors.values(), default=0))
+        self._rewrite_cursors()
+
+    def _read_cursors(self) -> dict[str, int]:
+        cursors = {}
+        try:
+            with open(os.path.join(self.directory, CURSORS_FILE), 'rb') as journal:
+                data = journal.read()
+        except FileNotFoundError:
+            return cursors
+        offset = 0
+        while offset + CURSOR_RECORD.size <= len(data):
+            seq, length = CURSOR_RECORD.unpack_from(data, offset)
+            offset += CURSOR_RECORD.size
+            if offset + length > len(data):
+                break  # Registro incompleto, deixado por uma queda do servidor
+            username = data[offset:offset + length].decode('utf-8')
+            offset += length
+            if seq == REMOVED:
+                cursors.pop(username, None)
+            else:
+                cursors[username] = seq
+        return cursors
+
+    def _write_cursor(self, username: str, seq: int):
+        if self._journal is None:
+            return
+        name = username.encode('utf-8')
+        self._journal.write(CURSOR_RECORD.pack(seq, len(name)) + name)
+        self._journal.flush()
+        self._journal_records += 1
+        if self._journal_records > 2 * len(self._cursors) + 1024:
+            self._rewrite_cursors()
+
+    def _rewrite_cursors(self):
+        """Compacta o journal, mantendo um registro por cursor ativo."""
+        path = os.path.join(self.directory, CURSORS_FILE)
+        if self._journal is not None:
+            self._journal.close()
+        with open(path + '.tmp', 'wb') as journal:
+            for username, seq in self._cursors.items():
+                name = username.encode('utf-8')
+                journal.write(CURSOR_RECORD.pack(seq, len(name)) + name)
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.replace(path + '.tmp', path)
+        self._journal = open(path, 'ab')
+        self._journal_records = len(self._cursors)
@@ -1,204 +1,280 @@
+import asyncio
+import os
 import platform
-import select
-import socket
 import sys
-import threading
-from threading import Thread
+from typing import Callable
 from colorama import Style, Fore
+from protocol import PRESENCE_HEADER, RESUME_COMMAND, SESSION_HEADER, MessageCodec, RECV_BUFFER_SIZE, format_response
 from utils import extract_command_parts
 
+UNIX_PREFIX = 'unix:'
+
+MSG_USAGE = ('Formato inválido para mensagem. Use: -msg tag <usuário|grupo> <mensagem>'
+             '\nSubstitua tag por U mensagem privada G grupo')
+MSGT_USAGE = ('Formato inválido para mensagem. Use: -msgt tag  <mensagem>'
+              '\nSubstitua tag por C mensagem para conectados, D mensagem'
+              '\npara desconectados ou T mensage para todos os usuários'
+              '\nconectados ou não')
+
 
 class Client:
+    """
+    Cliente do chat sobre asyncio: o socket e o stdin são atendidos pelo mesmo event loop,
+    sem polling. run() é o modo interativo; connect(), send() e close() permitem usar o
+    cliente sem terminal, com milhares de instâncias no mesmo processo (ex.: testes de carga).
+    """
 
-    def __init__(self, host: str, port: int):
+    def __init__(self, host: str, port: int = None, framed: bool = True,
+                 on_message: Callable[[str | None, str], None] = None, compression: bool = True):
+        # host 'unix:/caminho' conecta pelo socket Unix do servidor, sem porta
         self.host = host
         self.port = port
-        self.running = threading.Event()
-        self.running.set()
+        # framed=False usa o protocolo antigo, para servidores que não suportam framing
+        # compression oferece ao servidor a compressão das respostas e lotes grandes; ele decide se a usa
+        self.codec = MessageCodec(framed=framed, compression=compression)
+        # Chamado com (cabeçalho, mensagem) para cada mensagem recebida; o padrão é exibir no terminal
+        self.on_message = on_message or Client._print_message
+        self.login_response = None  # (cabeçalho, mensagem) recebidos em resposta ao nome de usuário
+        self.username = None
+        # Retomada de sessão: token recebido após o login e mensagens de chat recebidas desde então
+        self.session_token = None
+        self.received = 0
+        self.reader = None
+        self.writer = None
+        self._read_task = None
 
     def run(self):
-        client_socket = self._connect_to_server()
-        if not client_socket:
-            return
-        username = Client._get_username()
-        if not username:
-            return
-        if not Client._authenticate_user(client_socket, username):
-            return
-        self._start_message_threads(client_socket, username)
-
-    @staticmethod
-    def _get_username():
         try:
-            username = input('\nDigite seu nome de usuário: ').strip()
-            if not username:
-                print(Fore.RED + 'Nome de usuário inválido. Encerrando conexão.' + Style.RESET_ALL)
-            return username
+            asyncio.run(self._run_interactive())
         except KeyboardInterrupt:
-            print(Fore.YELLOW + '\nEntrada cancelada pelo usuário. Encerrando conexão...' + Style.RESET_ALL)
-            return None
-
-    def _connect_to_server(self) -> socket.socket | None:
-        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        try:
-            client_socket.connect((self.host, self.port))
-            return client_socket
-        except ConnectionRefusedError:
-            print(Fore.RED + '\nNão foi possível conectar ao servidor. Verifique se ele está ativo!' + Style.RESET_ALL)
-            return None
+            print(Fore.YELLOW + '\nConexão interrompida manualmente. Encerrando...' + Style.RESET_ALL)
 
     @staticmethod
-    def _authenticate_user(client_socket: socket.socket, username: str) -> bool:
-        try:
-            client_socket.send(username.encode('utf-8'))
-            response = client_socket.recv(1024).decode()
-            header = response[:10].strip()
-            message = response[10:]
-            if header == 'ERROR':
-                print(Fore.YELLOW + f'Erro recebido do servidor: {message}' + Style.RESET_ALL)
-                return False
-            elif header == 'OK':
-                print(Fore.GREEN + f'\n{message}' + Style.RESET_ALL)  # Mensagem de sucesso
-                return True
-            else:
-                print(Fore.RED + '\nResposta inesperada do servidor. Encerrando conexão.' + Style.RESET_ALL)
-                return False
-        except Exception as e:
-            print(Fore.RED + f'Erro ao enviar o nome de usuário. Encerrando conexão. \n{e}' + Style.RESET_ALL)
+    async def _get_username(lines) -> str:
+        # Lido pelo mesmo leitor do stdin usado depois para os comandos, que não pode perder linhas
+        print('\nDigite seu nome de usuário: ', end='', flush=True)
+        username = (await anext(lines, '')).strip()
+        if not username:
+            print(Fore.RED + 'Nome de usuário inválido. Encerrando conexão.' + Style.RESET_ALL)
+        return username
+
+    # Núcleo assíncrono, usado também sem terminal
+
+    async def connect(self, username: str) -> bool:
+        """
+        Conecta e envia o nome de usuário. Mensagens recebidas depois disso vão para on_message.
+        :return: True se o servidor aceitou o usuário; a resposta fica em login_response.
+        """
+        self.username = username
+        self.session_token = None
+        self.received = 0
+        return await self._open(username)
+
+    async def resume(self) -> bool:
+        """
+        Reconecta após uma queda da conexão e retoma a sessão, sem novo login: o servidor envia apenas
+        as mensagens que o cliente ainda não recebeu.
+        :return: False se o servidor não oferece a retomada ou a sessão expirou; use connect() nesse caso.
+        """
+        if self.session_token is None or not self.codec.framed:
             return False
+        if self.writer is not None:
+            self.writer.close()
+        if self._read_task is not None:
+            await asyncio.gather(self._read_task, return_exceptions=True)
+        # Um codec novo: o anterior pode ter ficado com um frame incompleto da conexão perdida
+        self.codec = MessageCodec(framed=True, compression=self.codec.compression)
+        return await self._open(f'{RESUME_COMMAND} {self.username} {self.session_token} {self.received}')
+
+    async def _open(self, login: str) -> bool:
+        if self.host.startswith(UNIX_PREFIX):
+            self.reader, self.writer = await asyncio.open_unix_connection(self.host[len(UNIX_PREFIX):])
+        else:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(self.codec.handshake(login))
+        responses = []
+        while not responses:
+            data = await self.reader.read(RECV_BUFFER_SIZE)
+            if not data:
+                break
+            responses = self.codec.decode(data)
+        self.login_response = responses[0] if responses else (None, '')
+        if self.login_response[0] != 'OK':
+            self.writer.close()
+            self.writer = None
+            return False
+        # Mensagens recebidas na mesma leitura (ex.: mensagens offline) são entregues em seguida
+        for header, message in responses[1:]:
+            self._deliver(header, message)
+        self._read_task = asyncio.create_task(self._receive_messages())
+        return True
+
+    async def send(self, command: str):
+        self.writer.write(self.codec.encode_command(command))
+        await self.writer.drain()
 
-    def _start_message_threads(self, client_socket: socket.socket, username: str):
+    async def send_many(self, commands):
+        """Envia vários comandos em uma única escrita (requer o protocolo com framing)."""
+        self.writer.write(self.codec.encode_commands(commands))
+        await self.writer.drain()
+
+    async def close(self):
+        """Pede a desconexão ao servidor e aguarda o fim da leitura."""
+        if self.writer is None:
+            return
         try:
-            thread_receive = Thread(target=Client._receive_message, args=[client_socket])
-            thread_send = Thread(target=self._send_messages, args=[client_socket, username])
+            await self.send('-sair')
+        except ConnectionError:
+            pass
+        self.writer.close()
+        if self._read_task is not None:
+            await asyncio.gather(self._read_task, return_exceptions=True)
+        self.writer = None
 
-            thread_receive.start()
-            thread_send.start()
+    async def wait_closed(self):
+        """Aguarda até que o servidor encerre a conexão."""
+        if self._read_task is not None:
+            await asyncio.gather(self._read_task, return_exceptions=True)
 
-            # Aguarda ambas as threads finalizarem
-            thread_receive.join()
-            thread_send.join()
-        except KeyboardInterrupt:
-            self.running.clear()  # Desativa a flag, indicando que o programa está encerrando
-            print(Fore.YELLOW + '\nEncerrando conexão...' + Style.RESET_ALL)
-            try:
-                client_socket.send('-sair'.encode('utf-8'))  # Envia comando de saída ao servidor
-            except (BrokenPipeError, OSError):
-                pass  # Se a conexão já estiver encerrada, não faz nada
-            finally:
-                client_socket.close()
-                print(Fore.YELLOW + '\nConexão interrompida manualmente. Encerrando...' + Style.RESET_ALL)
+    async def _receive_messages(self):
+        while data := await self.reader.read(RECV_BUFFER_SIZE):
+            for header, message in self.codec.decode(data):
+                self._deliver(header, message)
+            if replies := self.codec.take_replies():
+                # Responde aos heartbeats do servidor
+                self.writer.write(replies)
 
-    @staticmethod
-    def _receive_message(client_socket: socket.socket):
-        while True:
-            try:
-                message = client_socket.recv(1024).decode('utf-8')
-                if not message:
-                    break
-                print(Fore.YELLOW + message + Style.RESET_ALL)
-            except ConnectionResetError:
-                print(Fore.RED + '\nConexão perdida com o servidor!' + Style.RESET_ALL)
-                print('Pressione <Enter> para sair...')
-                client_socket.close()
-                break
-            except OSError as e:
-                print(Fore.RED + f'\nErro no socket: {e}' + Style.RESET_ALL)
-                break
+    def _deliver(self, header: str | None, message: str):
+        if header == SESSION_HEADER:
+            self.session_token = message
+            return
+        if header is None:
+            self.received += 1
+        self.on_message(header, message)
+
+    # Modo interativo
+
+    async def _run_interactive(self):
+        lines = Client._read_stdin()
+        try:
+            username = await Client._get_username(lines)
+            if username:
+                await self._run_session(username, lines)
+        finally:
+            await lines.aclose()
+
+    async def _run_session(self, username: str, lines):
+        try:
+            if not await self.connect(username):
+                header, message = self.login_response
+                if header == 'ERROR':
+                    print(Fore.YELLOW + f'Erro recebido do servidor: {message}' + Style.RESET_ALL)
+                else:
+                    print(Fore.RED + '\nResposta inesperada do servidor. Encerrando conexão.' + Style.RESET_ALL)
+                return
+        except OSError:
+            print(Fore.RED + '\nNão foi possível conectar ao servidor. Verifique se ele está ativo!' + Style.RESET_ALL)
+            return
+        print(Fore.GREEN + f'\n{self.login_response[1]}' + Style.RESET_ALL)  # Mensagem de sucesso
 
-    def _send_messages(self, client_socket: socket.socket, username: str):
+        input_task = asyncio.create_task(self._send_messages(username, lines))
         try:
-            while self.running.is_set():
-                # Usa select para verificar se há entrada disponível no stdin
-                message = Client.check_stdin()
-                if message is None:
-                    continue
-                if not message:
-                    print(Fore.RED + 'Mensagem vazia. Digite algo válido.' + Style.RESET_ALL)
-                    continue
-                if message == '-sair':
-                    client_socket.send(message.encode('utf-8'))
-                    print(Fore.YELLOW + f"{username} solicitou desconexão." + Style.RESET_ALL)
+            while True:
+                done, _ = await asyncio.wait({input_task, self._read_task}, return_when=asyncio.FIRST_COMPLETED)
+                if input_task in done:
+                    input_task.result()
                     break
-                if message == '-listargrupos':
-                    client_socket.send(message.encode('utf-8'))
-                    continue
-                if message.startswith('-criargrupo '):
-                    parts = message.split(' ', 1)  # Divide em 2 partes, o comando e o nome do grupo
-                    if not parts[1].strip():  # Verifica se o nome do grupo está vazio ou só tem espaços
-                        print(Fore.YELLOW
-                              + 'Erro: Nome do grupo não pode estar vazio. Use: -criargrupo <nome_do_grupo>'
-                              + Style.RESET_ALL)
-                        continue
-                    client_socket.send(message.encode('utf-8'))
-                    continue
-                if message.startswith('-entrargrupo'):
-                    parts = message.split(' ', 1)  # Divide em 2 partes, o comando e o nome do grupo
-                    if not parts[1].strip():  # Verifica se o nome do grupo está vazio ou só tem espaços
-                        print(Fore.YELLOW
-                              + 'Erro: Nome do grupo não pode estar vazio. Use: -entrargrupo <nome_do_grupo>'
-                              + Style.RESET_ALL)
-                        continue
-                    client_socket.send(message.encode('utf-8'))
-                    continue
-                    # Divide em até 3 partes: comando, "tag", username e mensagem
-                parts = extract_command_parts(message, 3)
-                if message[:5] == '-msgt' and not parts:
-                    print(
-                        Fore.YELLOW
-                        + 'Formato inválido para mensagem. Use: -msgt tag  <mensagem>'
-                        + '\nSubstitua tag por C mensagem para conectados, D mensagem'
-                        + '\npara desconectados ou T mensage para todos os usuários'
-                        + '\nconectados ou não'
-                        + Style.RESET_ALL
-                    )
-                    continue
-                # Divide em até 4 partes: comando, "tag", username e mensagem
-                parts = extract_command_parts(message, 4)
-                if message[:5] == '-msg' and not parts:
-                    print(
-                        Fore.YELLOW
-                        + 'Formato inválido para mensagem. Use: -msg tag <usuário|grupo> <mensagem>'
-                        + '\nSubstitua tag por U mensagem privada G grupo'
-                        + Style.RESET_ALL
-                    )
-                    continue
-                 
-                tags = ['U', 'G', 'C', 'D', 'T']
-                match message[:5]:
-                    case '-msg':
-                        parts = extract_command_parts(message, 4)
-                        if parts[1].upper() in tags:
-                            client_socket.send(message.encode('utf-8'))
-                            continue
-                    case '-msgt':
-                        parts = extract_command_parts(message, 3)
-                        if parts[1].upper() in tags:
-                            client_socket.send(message.encode('utf-8'))
-                            continue
-                            
-                client_socket.send(message.encode('utf-8'))
+                # O servidor encerrou a conexão sem que o usuário pedisse
+                print(Fore.RED + '\nConexão perdida com o servidor!' + Style.RESET_ALL)
+                if not await self._try_resume():
+                    break
+                print(Fore.GREEN + 'Sessão retomada.' + Style.RESET_ALL)
         except (ConnectionResetError, BrokenPipeError):
             print(Fore.RED + '\nErro ao enviar mensagem. Conexão encerrada!' + Style.RESET_ALL)
         finally:
-            client_socket.close()
+            input_task.cancel()
+            if self.writer is not None:
+                # Ctrl+C ou fim da entrada: avisa o servidor antes de sair
+                await asyncio.shield(self.close())
             print(Fore.YELLOW + "Conexão encerrada." + Style.RESET_ALL)
 
+    async def _try_resume(self) -> bool:
+        try:
+            return await self.resume()
+        except OSError:
+            return False
+
+    async def _send_messages(self, username: str, lines):
+        async for message in lines:
+            message = message.strip()
+            if not message:
+                print(Fore.RED + 'Mensagem vazia. Digite algo válido.' + Style.RESET_ALL)
+                continue
+            if message == '-sair':
+                print(Fore.YELLOW + f"{username} solicitou desconexão." + Style.RESET_ALL)
+                return
+            if warning := Client._validate_command(message):
+                print(Fore.YELLOW + warning + Style.RESET_ALL)
+                continue
+            await self.send(message)
+
     @staticmethod
-    def check_stdin():
-        if platform.system() == 'Windows':
-            import msvcrt
-            # No Windows, usa msvcrt para verificar se há dados no stdin
-            if msvcrt.kbhit():
-                return sys.stdin.readline().strip()
-            return None
-        # No Linux/macOS, usa select para verificar se há dados no stdin
-        if sys.stdin in select.select([sys.stdin], [], [], 0.1)[0]:
-            return input().strip()
+    def _validate_command(message: str) -> str | None:
+        """
+        Validação feita antes do envio, para não ocupar o servidor com comandos malformados.
+        :return: O aviso a ser exibido, ou None se o comando pode ser enviado.
+        """
+        verb, _, rest = message.partition(' ')
+        if verb in ('-criargrupo', '-entrargrupo') and not rest.strip():
+            return f'Erro: Nome do grupo não pode estar vazio. Use: {verb} <nome_do_grupo>'
+        if verb == '-msgt' and not extract_command_parts(message, 3):
+            return MSGT_USAGE
+        if verb == '-msg' and not extract_command_parts(message, 4):
+            return MSG_USAGE
         return None
 
+    @staticmethod
+    async def _read_stdin():
+        """Gera as linhas digitadas; o event loop só é acordado quando há entrada."""
+        loop = asyncio.get_running_loop()
+        if platform.system() != 'Windows':
+            reader = asyncio.StreamReader()
+            try:
+                transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+            except ValueError:
+                # stdin redirecionado de um arquivo comum, que não pode ser monitorado pelo event loop
+                transport = None
+            if transport is not None:
+                try:
+                    while line := await reader.readline():
+                        yield line.decode('utf-8')
+                finally:
+                    # O transporte deixa o descritor não bloqueante, o que afetaria o terminal depois
+                    os.set_blocking(sys.stdin.fileno(), True)
+                    transport.close()
+                return
+        # No Windows o stdin não pode ser registrado no event loop: a leitura bloqueante fica em uma thread
+        while line := await loop.run_in_executor(None, sys.stdin.readline):
+            yield line
+
+    @staticmethod
+    def _print_message(header: str | None, message: str):
+        if header == PRESENCE_HEADER:
+            message = f'{message[1:]} entrou.' if message.startswith('+') else f'{message[1:]} saiu.'
+        elif header:
+            message = format_response(header, message)
+        print(Fore.YELLOW + message + Style.RESET_ALL)
+
+
+def parse_address(address: str) -> tuple[str, int | None]:
+    """'host:porta' ou 'unix:/caminho' -> (host, porta), como aceitos pelo Client."""
+    if address.startswith(UNIX_PREFIX):
+        return address, None
+    host, _, port = address.rpartition(':')
+    return host, int(port)
+
 
 if __name__ == '__main__':
-    client = Client('localhost', 50001)
+    # Endereço opcional: python client.py [host:porta | unix:/caminho]
+    client = Client(*parse_address(sys.argv[1])) if len(sys.argv) > 1 else Client('localhost', 50001)
     client.run()
-    
\ No newline at end of file
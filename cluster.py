@@ -0,0 +1,757 @@
+"""
+Modo multi-processo: N workers aceitam conexões na mesma porta (SO_REUSEPORT) e um broker local,
+no processo principal, mantém o estado compartilhado e roteia as mensagens entre os workers por
+um socket Unix.
+
+- O broker é a autoridade sobre presença, grupos, mensagens offline e o log de mensagens globais.
+  Alterações (login, logout, criar/entrar/sair de grupo) são pedidas ao broker, que as aplica em
+  ordem e publica o evento para todos os workers.
+- Cada worker mantém uma réplica da presença e dos grupos, usada nas consultas (-listarusuarios,
+  -listarusrgrupo) e para decidir para onde vai cada mensagem. Usuários conectados a outro worker
+  aparecem no registry como RemoteSession, cujas mensagens seguem pelo broker até o worker dono.
+
+Requer um sistema com SO_REUSEPORT e sockets Unix (Linux, BSD, macOS).
+
+Uso:
+    python cluster.py [workers]
+"""
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import _thread
+
+from admission import AdmissionControl
+from async_server import AsyncServer
+from broadcast_log import BroadcastLog
+from compression import Compression
+from connection import Connection, OverflowPolicy, SocketConnection
+from envelope import Envelope
+from group_history import DEFAULT_FETCH_SIZE, GroupHistory, HistoryPage
+from log import ensure_configured, logger
+from offline_store import DEFAULT_CHUNK_SIZE, MemoryOfflineStore, OfflineStore, SegmentLogOfflineStore
+from protocol import MSG_COMMAND, RECV_BUFFER_SIZE, FrameDecoder, ProtocolError, encode_frame
+from registry import SessionRegistry
+from server import Server, remove_stale_socket
+from state_store import StateStore
+
+# Fila de saída das conexões do barramento: mensagens entre processos nunca são descartadas
+BUS_QUEUE_SIZE = 1 << 20
+REQUEST_TIMEOUT = 10.0
+# Threads do broker para leituras que podem envolver disco (replay, histórico)
+BROKER_IO_THREADS = 4
+# Reencaminhamentos de uma entrega antes de ela ser guardada como mensagem offline
+MAX_DELIVERY_HOPS = 2
+
+
+def _bus_options() -> dict:
+    return {'queue_size': BUS_QUEUE_SIZE, 'overflow_policy': OverflowPolicy.DISCONNECT}
+
+
+def _encode(payload: dict) -> bytes:
+    return encode_frame(MSG_COMMAND, json.dumps(payload, ensure_ascii=False))
+
+
+def _read_frames(connection: SocketConnection):
+    """Gera as mensagens JSON recebidas pela conexão do barramento até o EOF."""
+    decoder = FrameDecoder()
+    while data := connection.recv(RECV_BUFFER_SIZE):
+        for _, payload in decoder.feed(data):
+            yield json.loads(payload)
+
+
+class Broker:
+    """Estado compartilhado do cluster e roteamento das mensagens entre workers."""
+
+    def __init__(self, path: str, offline_store: OfflineStore = None, state_store: StateStore = None,
+                 group_history: GroupHistory = None, broadcast_log: BroadcastLog = None):
+        self.path = path
+        self.offline_messages = offline_store if offline_store is not None else MemoryOfflineStore()
+        self.broadcast_log = broadcast_log if broadcast_log is not None else BroadcastLog()
+        self.group_history = group_history if group_history is not None else GroupHistory()
+        self.presence = {}  # {username: id do worker}
+        self.groups = {}  # {group_name: {username: None}}
+        self.all_users = set()
+        self.workers = {}  # {id do worker: SocketConnection}
+        self._lock = threading.Lock()
+        # Replays abertos, avançados um bloco por pedido do worker: {(id do worker, id do pedido): (blocos, lock)}
+        self._replays = {}
+        self._cancelled_replays = set()  # replay_close recebido antes de o replay ser aberto
+        self._replays_lock = threading.Lock()
+        self._background = concurrent.futures.ThreadPoolExecutor(BROKER_IO_THREADS, thread_name_prefix='broker-io')
+        self.state_store = state_store
+        if state_store is not None:
+            users, groups = state_store.load()
+            self.all_users.update(users)
+            self.groups.update((group_name, dict.fromkeys(members)) for group_name, members in groups.items())
+            # Ninguém está conectado ainda: todos os usuários restaurados leem as mensagens globais pelo log
+            self.broadcast_log.park_all(users)
+            state_store.start(self._export_state)
+        self._operations = {
+            'connect': self._connect,
+            'disconnect': self._disconnect,
+            'create_group': self._create_group,
+            'join_group': self._join_group,
+            'leave_group': self._leave_group,
+            'deliver': self._deliver,
+            'broadcast': self._broadcast,
+            'store': self._store,
+            'log_broadcast': self._log_broadcast,
+            'history_append': self._history_append,
+        }
+        self._background_operations = {
+            'replay': self._replay,
+            'replay_next': self._replay_next,
+            'replay_close': self._replay_close,
+            'history_fetch': self._history_fetch,
+            'offline_pending': self._offline_pending,
+            'offline_backlog': self._offline_backlog,
+            'broadcast_retained': self._broadcast_retained,
+        }
+        self.server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    def start(self):
+        remove_stale_socket(self.path)
+        self.server_socket.bind(self.path)
+        self.server_socket.listen()
+        threading.Thread(target=self._accept_workers, daemon=True).start()
+
+    def close(self):
+        self.server_socket.close()
+        for connection in list(self.workers.values()):
+            connection.close()
+        self._background.shutdown(cancel_futures=True)
+        with self._replays_lock:
+            abandoned = list(self._replays.values())
+            self._replays.clear()
+        Broker._close_replays(abandoned)
+        self.offline_messages.close()
+        self.broadcast_log.close()
+        self.group_history.close()
+        if self.state_store is not None:
+            self.state_store.close()
+        try:
+            remove_stale_socket(self.path)
+        except FileExistsError:
+            pass  # O arquivo no caminho não é o socket do broker
+
+    def _accept_workers(self):
+        try:
+            while True:
+                worker_socket, _ = self.server_socket.accept()
+                threading.Thread(target=self._serve_worker, args=(worker_socket,), daemon=True).start()
+        except OSError:
+            # Socket fechado pelo close()
+            pass
+
+    def _serve_worker(self, worker_socket: socket.socket):
+        connection = SocketConnection(worker_socket, **_bus_options())
+        worker_id = None
+        try:
+            for request in _read_frames(connection):
+                operation = request['op']
+                if operation == 'hello':
+                    worker_id = request['worker']
+                    self._register_worker(worker_id, connection)
+                elif operation in self._background_operations:
+                    # Podem envolver disco: executadas fora do lock e desta thread, que segue lendo os pedidos
+                    self._background.submit(self._run_background, worker_id, connection, request)
+                else:
+                    with self._lock:
+                        self._operations[operation](worker_id, connection, request)
+        except (OSError, ProtocolError, ValueError) as e:
+            logger.error("Erro na comunicação com o worker %s: %s", worker_id, e)
+        finally:
+            self._drop_worker(worker_id, connection)
+
+    def _publish(self, event: dict, exclude: int = None):
+        data = _encode(event)
+        for worker_id, connection in self.workers.items():
+            if worker_id != exclude:
+                connection.send(data)
+
+    @staticmethod
+    def _reply(connection: Connection, request: dict, **fields):
+        connection.send(_encode({'id': request['id'], **fields}))
+
+    def _register_worker(self, worker_id: int, connection: SocketConnection):
+        with self._lock:
+            self.workers[worker_id] = connection
+            # Estado atual, antes de qualquer evento posterior a ele
+            connection.send(_encode({
+                'ev': 'snapshot',
+                'presence': self.presence,
+                'groups': {group_name: list(members) for group_name, members in self.groups.items()},
+                'all_users': list(self.all_users),
+            }))
+        logger.info("Worker %s conectado ao broker.", worker_id)
+
+    def _drop_worker(self, worker_id: int | None, connection: SocketConnection):
+        """Encerra as sessões de um worker que caiu ou foi finalizado."""
+        with self._lock:
+            if self.workers.get(worker_id) is connection:
+                del self.workers[worker_id]
+            for username in [username for username, owner in self.presence.items() if owner == worker_id]:
+                self._disconnect(worker_id, connection, {'user': username})
+        with self._replays_lock:
+            abandoned = [self._replays.pop(key) for key in list(self._replays) if key[0] == worker_id]
+            self._cancelled_replays = {key for key in self._cancelled_replays if key[0] != worker_id}
+        # As mensagens ainda não lidas voltam ao armazenamento
+        Broker._close_replays(abandoned)
+        connection.close()
+        if worker_id is not None:
+            logger.warning("Worker %s desconectado do broker.", worker_id)
+
+    def _export_state(self) -> tuple[list[str], dict[str, tuple]]:
+        with self._lock:
+            return list(self.all_users), {group_name: tuple(members) for group_name, members in self.groups.items()}
+
+    # Operações; executadas com self._lock
+
+    def _connect(self, worker_id: int, connection: Connection, request: dict):
+        username = request['user']
+        if username in self.presence:
+            Broker._reply(connection, request, ok=False)
+            return
+        self.presence[username] = worker_id
+        if self.state_store is not None and username not in self.all_users:
+            self.state_store.add_user(username)
+        self.all_users.add(username)
+        self._publish({'ev': 'online', 'user': username, 'worker': worker_id})
+        Broker._reply(connection, request, ok=True)
+
+    def _disconnect(self, worker_id: int, connection: Connection, request: dict):
+        username = request['user']
+        if self.presence.get(username) != worker_id:
+            return
+        del self.presence[username]
+        self.broadcast_log.park(username)
+        self._publish({'ev': 'offline', 'user': username, 'worker': worker_id})
+
+    def _create_group(self, worker_id: int, connection: Connection, request: dict):
+        group_name = request['group']
+        if group_name in self.groups:
+            Broker._reply(connection, request, ok=False)
+            return
+        self.groups[group_name] = {request['user']: None}
+        if self.state_store is not None:
+            self.state_store.create_group(group_name, request['user'])
+        self._publish({'ev': 'group', 'group': group_name, 'user': request['user']})
+        Broker._reply(connection, request, ok=True)
+
+    def _join_group(self, worker_id: int, connection: Connection, request: dict):
+        members = self.groups.get(request['group'])
+        if members is None or request['user'] in members:
+            Broker._reply(connection, request, ok=False)
+            return
+        members[request['user']] = None
+        if self.state_store is not None:
+            self.state_store.join_group(request['group'], request['user'])
+        self._publish({'ev': 'join', 'group': request['group'], 'user': request['user']})
+        Broker._reply(connection, request, ok=True)
+
+    def _leave_group(self, worker_id: int, connection: Connection, request: dict):
+        members = self.groups.get(request['group'])
+        if members is None or request['user'] not in members:
+            Broker._reply(connection, request, ok=False)
+            return
+        del members[request['user']]
+        if self.state_store is not None:
+            self.state_store.leave_group(request['group'], request['user'])
+        self._publish({'ev': 'leave', 'group': request['group'], 'user': request['user']})
+        Broker._reply(connection, request, ok=True)
+
+    def _deliver(self, worker_id: int, connection: Connection, request: dict):
+        """
+        Encaminha a mensagem aos workers dos destinatários, uma vez por worker com todos os seus
+        destinatários, e a guarda para os que já saíram.
+        """
+        hops = request.get('hops', 0)
+        by_owner = {}  # {id do worker: [usernames]}
+        for username in request['users']:
+            owner_id = self.presence.get(username)
+            if owner_id not in self.workers or hops >= MAX_DELIVERY_HOPS:
+                self.offline_messages.append(username, request['text'])
+                continue
+            by_owner.setdefault(owner_id, []).append(username)
+        for owner_id, usernames in by_owner.items():
+            self.workers[owner_id].send(_encode({'ev': 'deliver', 'users': usernames, 'text': request['text'],
+                                                 'hops': hops + 1}))
+
+    def _broadcast(self, worker_id: int, connection: Connection, request: dict):
+        self._publish({'ev': 'broadcast', 'text': request['text']}, exclude=worker_id)
+
+    def _store(self, worker_id: int, connection: Connection, request: dict):
+        self.offline_messages.append(request['user'], request['text'])
+
+    def _log_broadcast(self, worker_id: int, connection: Connection, request: dict):
+        self.broadcast_log.append(request['text'])
+
+    def _history_append(self, worker_id: int, connection: Connection, request: dict):
+        self.group_history.append(request['group'], request['text'])
+
+    # Operações executadas em self._background, fora do lock
+
+    def _run_background(self, worker_id: int, connection: Connection, request: dict):
+        try:
+            self._background_operations[request['op']](worker_id, connection, request)
+        except Exception as e:
+            logger.exception("Erro ao executar %s para o worker %s", request['op'], worker_id)
+            Broker._reply(connection, request, error=str(e))
+
+    def _replay(self, worker_id: int, connection: Connection, request: dict):
+        """
+        Abre o replay das mensagens guardadas para o usuário e envia o primeiro bloco. Os seguintes
+        são lidos (e removidos do armazenamento) só quando o worker pede, depois de enviar o anterior.
+        """
+        source = self.offline_messages if request['kind'] == 'offline' else self.broadcast_log
+        chunks = source.pop_chunks(request['user'], request.get('chunk_size', DEFAULT_CHUNK_SIZE))
+        key = (worker_id, request['id'])
+        with self._replays_lock:
+            if key in self._cancelled_replays or connection.closed:
+                # O worker desistiu (ou caiu) antes da abertura: nada foi lido
+                self._cancelled_replays.discard(key)
+                return
+            self._replays[key] = (chunks, threading.Lock())
+        self._replay_next(worker_id, connection, request)
+
+    def _replay_next(self, worker_id: int, connection: Connection, request: dict):
+        key = (worker_id, request['id'])
+        replay = self._replays.get(key)
+        chunk = None
+        try:
+            if replay is not None:
+                chunks, lock = replay
+                with lock:
+                    chunk = next(chunks, None)
+        finally:
+            if chunk is None:
+                with self._replays_lock:
+                    self._replays.pop(key, None)
+        if chunk is None:
+            Broker._reply(connection, request, done=True)
+        else:
+            Broker._reply(connection, request, chunk=chunk)
+
+    def _replay_close(self, worker_id: int, connection: Connection, request: dict):
+        """O worker interrompeu o replay (ex.: o cliente caiu): as mensagens não lidas voltam ao armazenamento."""
+        key = (worker_id, request['id'])
+        with self._replays_lock:
+            replay = self._replays.pop(key, None)
+            if replay is None:
+                self._cancelled_replays.add(key)
+                return
+        Broker._close_replays([replay])
+
+    @staticmethod
+    def _close_replays(replays: list):
+        for chunks, lock in replays:
+            with lock:
+                chunks.close()
+
+    def _history_fetch(self, worker_id: int, connection: Connection, request: dict):
+        page = self.group_history.fetch(request['group'], request['since'], request['limit'])
+        Broker._reply(connection, request, **page._asdict())
+
+    # Consultas das métricas dos workers
+
+    def _offline_pending(self, worker_id: int, connection: Connection, request: dict):
+        Broker._reply(connection, request, count=self.offline_messages.pending(request['user']))
+
+    def _offline_backlog(self, worker_id: int, connection: Connection, request: dict):
+        Broker._reply(connection, request, bytes=self.offline_messages.backlog_bytes())
+
+    def _broadcast_retained(self, worker_id: int, connection: Connection, request: dict):
+        Broker._reply(connection, request, count=self.broadcast_log.retained())
+
+
+class BusClient:
+    """Conexão de um worker com o broker: pedidos com resposta, envios sem resposta e eventos."""
+
+    def __init__(self, path: str, worker_id: int):
+        self.worker_id = worker_id
+        bus_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        bus_socket.connect(path)
+        self.connection = SocketConnection(bus_socket, **_bus_options())
+        self._ids = itertools.count(1)
+        self._requests = {}  # {id: queue.Queue com as respostas}
+        self._on_event = None
+        self._closing = False
+
+    def start(self, on_event):
+        """Apresenta o worker ao broker e passa a receber eventos, tratados por on_event(evento)."""
+        self._on_event = on_event
+        self.send('hello', worker=self.worker_id)
+        threading.Thread(target=self._read_loop, daemon=True).start()
+
+    def send(self, operation: str, **fields):
+        self.connection.send(_encode({'op': operation, **fields}))
+
+    def request(self, operation: str, **fields) -> dict:
+        replies = self._open(operation, fields)
+        try:
+            return BusClient._wait(replies)
+        finally:
+            self._requests.pop(fields['id'], None)
+
+    def stream(self, operation: str, **fields):
+        """
+        Gera os blocos de uma resposta em várias partes (ex.: mensagens offline). O broker só lê o
+        próximo bloco (operation_next) quando o anterior foi consumido; se a geração for
+        interrompida antes do fim, operation_close devolve o restante ao armazenamento.
+        """
+        replies = self._open(operation, fields)
+        request_id = fields['id']
+        finished = False
+        try:
+            while not (reply := BusClient._wait(replies)).get('done'):
+                yield reply['chunk']
+                self.send(f'{operation}_next', id=request_id)
+            finished = True
+        finally:
+            self._requests.pop(request_id, None)
+            if not finished:
+                self.send(f'{operation}_close', id=request_id)
+
+    @staticmethod
+    def _wait(replies: queue.Queue) -> dict:
+        try:
+            reply = replies.get(timeout=REQUEST_TIMEOUT)
+        except queue.Empty:
+            raise TimeoutError('O broker não respondeu a tempo') from None
+        if 'error' in reply:
+            raise OSError(f"Erro no broker: {reply['error']}")
+        return reply
+
+    def _open(self, operation: str, fields: dict) -> queue.Queue:
+        fields['id'] = next(self._ids)
+        replies = self._requests[fields['id']] = queue.Queue()
+        self.send(operation, **fields)
+        return replies
+
+    def _read_loop(self):
+        try:
+            for message in _read_frames(self.connection):
+                if 'id' in message:
+                    replies = self._requests.get(message['id'])
+                    if replies is not None:
+                        replies.put(message)
+                else:
+                    self._on_event(message)
+        except (OSError, ProtocolError, ValueError) as e:
+            if not self._closing:
+                logger.error("Erro na comunicação com o broker: %s", e)
+        if self._closing:
+            return
+        logger.critical("Conexão com o broker perdida; encerrando o worker %s.", self.worker_id)
+        # Sem o broker o worker não consegue rotear mensagens: encerra como em um Ctrl+C
+        _thread.interrupt_main()
+
+    def close(self):
+        self._closing = True
+        self.connection.close()
+
+
+class RemoteSession:
+    """Usuário conectado a outro worker; as mensagens para ele seguem pelo broker."""
+
+    closed = False
+    queue_depth = 0
+    dropped = 0
+
+    def __init__(self, bus: BusClient, username: str, worker_id: int):
+        self.bus = bus
+        self.username = username
+        self.worker_id = worker_id
+
+    def send_message(self, message):
+        self.bus.send('deliver', users=[self.username], text=str(message))
+
+    def send_messages(self, messages):
+        for message in messages:
+            self.send_message(message)
+
+    def close(self):
+        pass
+
+
+class ClusterRegistry(SessionRegistry):
+    """
+    Registry de um worker: as sessões locais ficam em clients, e connections inclui também os
+    usuários de outros workers (RemoteSession). Alterações são confirmadas pelo broker; a réplica
+    é atualizada pelos eventos que ele publica, recebidos antes da resposta ao pedido.
+    """
+
+    def __init__(self, bus: BusClient):
+        super().__init__()
+        self.bus = bus
+
+    def connect(self, connection, username: str) -> bool:
+        if username in self.connections:
+            return False
+        try:
+            accepted = self.bus.request('connect', user=username)['ok']
+        except TimeoutError:
+            # O broker ainda pode registrar o login depois do prazo: desfaz, para o nome não ficar preso
+            self.bus.send('disconnect', user=username)
+            raise
+        return accepted and super().connect(connection, username)
+
+    def disconnect(self, connection) -> str | None:
+        username = super().disconnect(connection)
+        if username is not None:
+            self.bus.send('disconnect', user=username)
+        return username
+
+    def create_group(self, group_name: str, owner: str) -> bool:
+        return self.bus.request('create_group', group=group_name, user=owner)['ok']
+
+    def join_group(self, group_name: str, username: str) -> bool:
+        return self.bus.request('join_group', group=group_name, user=username)['ok']
+
+    def leave_group(self, group_name: str, username: str) -> bool:
+        return self.bus.request('leave_group', group=group_name, user=username)['ok']
+
+
+class RemoteOfflineStore(OfflineStore):
+    """Mensagens offline guardadas pelo broker, compartilhadas por todos os workers."""
+
+    def __init__(self, bus: BusClient):
+        self.bus = bus
+
+    def append(self, username: str, message: str):
+        self.bus.send('store', user=username, text=message)
+
+    def pending(self, username: str) -> int:
+        return self.bus.request('offline_pending', user=username)['count']
+
+    def pop_chunks(self, username: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        return self.bus.stream('replay', user=username, kind='offline', chunk_size=chunk_size)
+
+    def backlog_bytes(self) -> int:
+        return self.bus.request('offline_backlog')['bytes']
+
+
+class RemoteBroadcastLog:
+    """Log de mensagens globais mantido pelo broker; o cursor é registrado por ele no logout."""
+
+    def __init__(self, bus: BusClient):
+        self.bus = bus
+
+    def append(self, message: str):
+        self.bus.send('log_broadcast', text=message)
+
+    def park(self, username: str):
+        pass
+
+    def retained(self) -> int:
+        return self.bus.request('broadcast_retained')['count']
+
+    def pop_chunks(self, username: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        return self.bus.stream('replay', user=username, kind='broadcast', chunk_size=chunk_size)
+
+    def close(self):
+        pass
+
+
+class RemoteGroupHistory:
+    """Histórico dos grupos mantido pelo broker, que recebe as mensagens de grupo de todos os workers."""
+
+    def __init__(self, bus: BusClient):
+        self.bus = bus
+
+    def append(self, group_name: str, message: str):
+        self.bus.send('history_append', group=group_name, text=message)
+
+    def fetch(self, group_name: str, since: int = None, limit: int = DEFAULT_FETCH_SIZE) -> HistoryPage:
+        reply = self.bus.request('history_fetch', group=group_name, since=since, limit=limit)
+        return HistoryPage(reply['messages'], reply['last_seq'], reply['more'])
+
+    def close(self):
+        pass
+
+
+class ClusterWorker(Server):
+    """Server executado como worker do cluster, com o estado compartilhado pelo broker."""
+
+    def __init__(self, host, port, worker_id: int, bus_path: str, **options):
+        self.worker_id = worker_id
+        self.bus = BusClient(bus_path, worker_id)
+        # A reconexão pode chegar a outro worker, que não conhece a sessão suspensa neste: sem retomada,
+        # desativada antes do Server.__init__ para que suas métricas nem sejam registradas
+        options.pop('resumption', None)
+        super().__init__(host, port, offline_store=RemoteOfflineStore(self.bus), **options)
+        self.registry = ClusterRegistry(self.bus)
+        self.clients = self.registry.clients
+        self.groups = self.registry.groups
+        self.broadcast_log = RemoteBroadcastLog(self.bus)
+        self.group_history = RemoteGroupHistory(self.bus)
+        # Todos os workers escutam na mesma porta; o kernel distribui as conexões entre eles
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self._loop = None
+        self.bus.start(self._on_bus_event)
+
+    def _call_soon(self, function, *args):
+        """Executa uma entrega recebida do broker no contexto em que as conexões são usadas."""
+        function(*args)
+
+    def _on_bus_event(self, event: dict):
+        """Aplica os eventos do broker; chamado pela thread que lê o barramento."""
+        registry = self.registry
+        match event['ev']:
+            case 'snapshot':
+                for username, worker_id in event['presence'].items():
+                    if worker_id != self.worker_id:
+                        registry.attach(username, RemoteSession(self.bus, username, worker_id))
+                registry.load_groups(event['groups'])
+                self.all_users.update(event['all_users'])
+            case 'online':
+                self.all_users.add(event['user'])
+                if event['worker'] != self.worker_id:
+                    registry.attach(event['user'], RemoteSession(self.bus, event['user'], event['worker']))
+                    self._call_soon(self._publish_presence, event['user'], True)
+            case 'offline':
+                session = registry.connections.get(event['user'])
+                if isinstance(session, RemoteSession) and session.worker_id == event['worker']:
+                    registry.detach(event['user'], session)
+                    self._call_soon(self._publish_presence, event['user'], False)
+            case 'group':
+                SessionRegistry.create_group(registry, event['group'], event['user'])
+            case 'join':
+                if registry.has_group(event['group']):
+                    SessionRegistry.join_group(registry, event['group'], event['user'])
+            case 'leave':
+                if registry.has_group(event['group']):
+                    SessionRegistry.leave_group(registry, event['group'], event['user'])
+            case 'deliver':
+                self._call_soon(self._deliver_local, event['users'], event['text'], event['hops'])
+            case 'broadcast':
+                self._call_soon(Server._broadcast, self, event['text'])
+
+    def _deliver_local(self, usernames: list[str], text: str, hops: int):
+        moved = []
+        for username in usernames:
+            client_socket = self.registry.connection_of(username)
+            if client_socket is None or isinstance(client_socket, RemoteSession):
+                moved.append(username)
+                continue
+            Server.send_message_safe(client_socket, text)
+        if moved:
+            # Os usuários saíram ou mudaram de worker: o broker reencaminha ou guarda a mensagem
+            self.bus.send('deliver', users=moved, text=text, hops=hops)
+
+    def _deliver_to_members(self, members, message: Envelope, sender_username: str) -> int:
+        """Como no Server, mas os membros de outros workers recebem uma única mensagem do barramento por worker."""
+        local = []
+        remote = {}  # {id do worker: [usernames]}
+        for member in members:
+            session = self.registry.connection_of(member)
+            if isinstance(session, RemoteSession):
+                remote.setdefault(session.worker_id, []).append(member)
+            else:
+                local.append(member)
+        for usernames in remote.values():
+            self.bus.send('deliver', users=usernames, text=message.text)
+        return super()._deliver_to_members(local, message, sender_username) + sum(map(len, remote.values()))
+
+    def _broadcast(self, message, sender_socket: Connection = None):
+        super()._broadcast(message, sender_socket)
+        # Na fila do remetente, como as entregas a usuários de outros workers feitas pelo fan-out local
+        self.fanout.after(sender_socket, self._publish_broadcast, str(message))
+
+    def _publish_broadcast(self, text: str):
+        self.bus.send('broadcast', text=text)
+
+    def _shutdown(self):
+        super()._shutdown()
+        self.bus.close()
+
+
+class AsyncClusterWorker(ClusterWorker, AsyncServer):
+    """
+    Worker com o engine asyncio; as entregas vindas do broker são executadas no event loop, e as
+    chamadas que esperam uma resposta do broker (login, grupos, histórico, replay) em threads do
+    executor padrão, para não parar o loop.
+    """
+    # -stats lê as métricas do armazenamento offline e do log global, mantidos pelo broker
+    blocking_commands = frozenset(('-criargrupo', '-entrargrupo', '-sairgrupo', '-historico', '-stats'))
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        await super()._serve()
+
+    def _call_soon(self, function, *args):
+        if self._loop is None:
+            function(*args)
+            return
+        self._loop.call_soon_threadsafe(function, *args)
+
+    async def _run_blocking(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+
+ENGINES = {'threaded': ClusterWorker, 'asyncio': AsyncClusterWorker}
+
+
+def _run_worker(worker_id: int, host: str, port: int, bus_path: str, engine: str, options: dict):
+    if options.get('metrics_port') is not None:
+        # Um endpoint de métricas por worker, em portas consecutivas
+        options = {**options, 'metrics_port': options['metrics_port'] + worker_id}
+    if options.get('unix_paths'):
+        # Um caminho não pode ser compartilhado como a porta TCP: cada worker escuta em caminho.N
+        options = {**options, 'unix_paths': [f'{path}.{worker_id}' for path in options['unix_paths']]}
+    ENGINES[engine](host, port, worker_id, bus_path, **options).run()
+
+
+def run_cluster(host: str, port: int, workers: int = None, engine: str = 'asyncio', bus_path: str = None,
+                offline_store: OfflineStore = None, state_store: StateStore = None,
+                group_history: GroupHistory = None, broadcast_log: BroadcastLog = None, **options):
+    """
+    Inicia o broker neste processo e os workers em processos separados, até um Ctrl+C.
+    :param options: Demais opções do Server, repassadas a cada worker (ex.: idle_timeout).
+    """
+    if not hasattr(socket, 'SO_REUSEPORT') or not hasattr(socket, 'AF_UNIX'):
+        raise OSError('O modo multi-processo requer SO_REUSEPORT e sockets Unix')
+    ensure_configured()
+    workers = workers or os.cpu_count() or 1
+    bus_path = bus_path or os.path.join(tempfile.gettempdir(), f'psd-broker-{port}.sock')
+    broker = Broker(bus_path, offline_store, state_store, group_history, broadcast_log)
+    broker.start()
+    # spawn: os workers não herdam as threads do broker e do logging deste processo
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=_run_worker, args=(worker_id, host, port, bus_path, engine, options))
+                 for worker_id in range(workers)]
+    for process in processes:
+        process.start()
+    logger.info("Cluster com %d workers (%s) em %s:%s", workers, engine, host, port)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        logger.warning("Cluster interrompido manualmente. Encerrando workers...")
+    finally:
+        for process in processes:
+            if process.is_alive():
+                # Repassa o Ctrl+C, caso o sinal não tenha sido enviado ao grupo de processos
+                os.kill(process.pid, signal.SIGINT)
+        for process in processes:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+        broker.close()
+
+
+if __name__ == '__main__':
+    run_cluster('localhost', 50001, workers=int(sys.argv[1]) if len(sys.argv) > 1 else None,
+                offline_store=SegmentLogOfflineStore('offline_data'), state_store=StateStore('state_data'),
+                group_history=GroupHistory(directory='history_data'),
+                broadcast_log=BroadcastLog(directory='broadcast_data'), idle_timeout=90, heartbeat_interval=30,
+                admission=AdmissionControl(), compression=Compression())
@@ -0,0 +1,112 @@
+import time
+from typing import Callable, NamedTuple, Sequence
+
+from metrics import Histogram, Metrics
+
+
+class ParsedCommand(NamedTuple):
+    """Comando já dividido em partes: o verbo (ex.: '-msg') e seus argumentos."""
+    verb: str
+    args: Sequence[str]
+
+
+class Command(NamedTuple):
+    handler: Callable
+    # Quantidade de argumentos; o último recebe todo o restante do texto (ex.: a mensagem)
+    arity: int
+    # Argumentos opcionais após os obrigatórios; com eles, o texto é dividido em palavras
+    optional: int
+    usage: str
+    # Comandos sem argumentos são sempre iguais, então o ParsedCommand é criado uma única vez
+    parsed: ParsedCommand | None
+    # Histograma de duração do handler, presente apenas com a instrumentação ativada
+    latency: Histogram | None
+
+
+class CommandDispatcher:
+    """
+    Tabela de comandos indexada pelo verbo. Cada mensagem é dividida uma única vez, conforme a
+    aridade registrada para o verbo, e entregue ao handler com um ParsedCommand.
+
+    Handlers recebem (client_socket, username, comando) e retornam False para encerrar a conexão.
+    Com metrics, a duração de cada handler é registrada em um histograma por verbo.
+    """
+
+    def __init__(self, on_error: Callable, metrics: Metrics = None):
+        self._commands = {}  # {verbo: Command}
+        # Comandos sem argumentos chegam exatamente como o verbo: {verbo: (Command, ParsedCommand)}
+        self._bare = {}
+        self._on_error = on_error  # Chamado com (client_socket, mensagem de erro)
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.describe('command_duration_seconds', 'Duração do processamento de cada comando')
+            metrics.describe('command_errors_total', 'Comandos desconhecidos ou com formato inválido')
+
+    def register(self, verb: str, handler: Callable, arity: int = 0, usage: str = None, optional: int = 0):
+        latency = None
+        if self.metrics is not None:
+            latency = self.metrics.histogram('command_duration_seconds', scale=1e-9, command=verb)
+        parsed = None if arity or optional else ParsedCommand(verb, ())
+        command = self._commands[verb] = Command(handler, arity, optional, usage or verb, parsed, latency)
+        if parsed is not None:
+            self._bare[verb] = command, parsed
+        else:
+            self._bare.pop(verb, None)
+
+    def verbs(self):
+        return self._commands.keys()
+
+    def parse(self, message: str) -> tuple[Command, ParsedCommand | None] | None:
+        """
+        Divide a mensagem conforme o comando registrado para o verbo.
+        :return: None se o verbo não existe; (comando, None) se os argumentos são inválidos.
+        """
+        bare = self._bare.get(message)
+        if bare is not None:
+            return bare
+        verb, _, rest = message.partition(' ')
+        command = self._commands.get(verb)
+        if command is None:
+            return None
+        if command.parsed is not None:
+            # Texto depois de um comando sem argumentos é um erro de formato, não é ignorado
+            return (command, None) if rest.strip() else (command, command.parsed)
+        if command.optional:
+            args = rest.split()
+            if not command.arity <= len(args) <= command.arity + command.optional:
+                return command, None
+            return command, ParsedCommand(verb, args)
+        if command.arity == 1:
+            # Um único argumento recebe todo o restante: não há o que dividir
+            if not rest or rest.isspace():
+                return command, None
+            return command, ParsedCommand(verb, (rest,))
+        args = rest.split(' ', command.arity - 1)
+        if len(args) != command.arity or '' in args or any(map(str.isspace, args)):
+            return command, None
+        return command, ParsedCommand(verb, args)
+
+    def dispatch(self, client_socket, username: str, message: str) -> bool:
+        """
+        Executa o comando contido na mensagem.
+        :return: False quando o handler pede o encerramento da conexão.
+        """
+        parsed = self.parse(message)
+        if parsed is None:
+            if self.metrics is not None:
+                self.metrics.inc('command_errors_total', reason='unknown')
+            self._on_error(client_socket, "Comando desconhecido ou formato inválido.")
+            return True
+        command, parsed_command = parsed
+        if parsed_command is None:
+            if self.metrics is not None:
+                self.metrics.inc('command_errors_total', reason='format')
+            self._on_error(client_socket, f'Formato inválido. Use: {command.usage}')
+            return True
+        if command.latency is None:
+            return command.handler(client_socket, username, parsed_command) is not False
+        started = time.perf_counter_ns()
+        try:
+            return command.handler(client_socket, username, parsed_command) is not False
+        finally:
+            command.latency.record(time.perf_counter_ns() - started)
@@ -0,0 +1,91 @@
+import threading
+import time
+import zlib
+
+from protocol import COMPRESSION_DICTIONARY, MAX_FRAME_SIZE, MSG_COMPRESSED, encode_frame
+
+DEFAULT_THRESHOLD = 1024
+DEFAULT_LEVEL = 6
+# Janela de 4 KB e memLevel 5: ~32 KB por contexto em vez dos ~256 KB do padrão do zlib, com pouca
+# perda de razão, já que as repetições entre lotes (prefixos, nomes) ficam próximas
+DEFAULT_WBITS = 12
+DEFAULT_MEM_LEVEL = 5
+# Pior caso do deflate: alguns bytes a mais por bloco; lotes maiores seguem sem compressão
+MAX_COMPRESSED_BATCH = MAX_FRAME_SIZE - 64 * 1024
+
+
+class Compression:
+    """
+    Compressão negociada por conexão, para clientes que a oferecem no handshake.
+
+    O writer de cada conexão comprime o lote que vai escrever (uma listagem grande, um bloco do
+    replay offline ou várias mensagens acumuladas na fila) quando ele tem pelo menos threshold
+    bytes; lotes menores seguem como estão, já que o ganho não pagaria a CPU. Cada conexão mantém
+    seu próprio contexto zlib, criado só no primeiro lote comprimido, então os prefixos '(usuário, dd/mm/aaaa - hh:mm:ss): ' repetidos
+    entre lotes são comprimidos como referências ao que o cliente já recebeu.
+
+    Os totais de bytes e o tempo de CPU gasto ficam disponíveis para ajustar threshold e level.
+    """
+
+    def __init__(self, threshold: int = DEFAULT_THRESHOLD, level: int = DEFAULT_LEVEL,
+                 wbits: int = DEFAULT_WBITS, mem_level: int = DEFAULT_MEM_LEVEL):
+        self.threshold = threshold
+        self.level = level
+        self.wbits = wbits
+        self.mem_level = mem_level
+        self.metrics = None  # Definido pelo Server quando a instrumentação está ativa
+        self.batches = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.cpu_ns = 0
+        self._lock = threading.Lock()
+
+    def __reduce__(self):
+        # Copiado para cada worker do cluster apenas com a configuração
+        return Compression, (self.threshold, self.level, self.wbits, self.mem_level)
+
+    def compressor(self) -> 'StreamCompressor':
+        return StreamCompressor(self)
+
+    @property
+    def ratio(self) -> float:
+        """Bytes originais por byte enviado, nos lotes comprimidos."""
+        return self.raw_bytes / self.compressed_bytes if self.compressed_bytes else 0.0
+
+    def _record(self, raw: int, compressed: int, elapsed: int):
+        with self._lock:
+            self.batches += 1
+            self.raw_bytes += raw
+            self.compressed_bytes += compressed
+            self.cpu_ns += elapsed
+        if self.metrics is not None:
+            self.metrics.histogram('compression_batch_bytes').record(raw)
+            self.metrics.histogram('compression_duration_seconds', scale=1e-9).record(elapsed)
+
+
+class StreamCompressor:
+    """
+    Contexto de compressão de uma conexão; usado apenas pelo writer dela, na ordem de escrita.
+    O contexto zlib só é alocado no primeiro lote a partir do threshold: conexões que nunca recebem
+    um lote grande não pagam por ele.
+    """
+    __slots__ = ('compression', 'threshold', '_context')
+
+    def __init__(self, compression: Compression):
+        self.compression = compression
+        self.threshold = compression.threshold
+        self._context = None
+
+    def compress(self, batch: bytes) -> bytes:
+        """:return: O lote como um frame MSG_COMPRESSED, ou inalterado se estiver fora dos limites."""
+        if not self.threshold <= len(batch) <= MAX_COMPRESSED_BATCH:
+            return batch
+        started = time.perf_counter_ns()
+        if self._context is None:
+            compression = self.compression
+            self._context = zlib.compressobj(compression.level, zlib.DEFLATED, compression.wbits,
+                                             compression.mem_level, zdict=COMPRESSION_DICTIONARY)
+        # Z_SYNC_FLUSH: o cliente descomprime o lote inteiro assim que o recebe, e o contexto segue aberto
+        payload = self._context.compress(batch) + self._context.flush(zlib.Z_SYNC_FLUSH)
+        self.compression._record(len(batch), len(payload), time.perf_counter_ns() - started)
+        return encode_frame(MSG_COMPRESSED, payload)
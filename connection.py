@@ -0,0 +1,267 @@
+import asyncio
+import socket
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from enum import Enum
+
+from envelope import Envelope
+from compression import Compression
+from protocol import MessageCodec
+
+DEFAULT_QUEUE_SIZE = 1024
+
+
+class OverflowPolicy(str, Enum):
+    """O que fazer quando a fila de saída de um cliente lento está cheia."""
+    DROP_OLDEST = 'drop_oldest'  # Descarta a mensagem mais antiga da fila
+    DISCONNECT = 'disconnect'  # Encerra a conexão do cliente
+    SPILL = 'spill'  # Desvia a mensagem para o armazenamento offline
+
+
+class Connection(ABC):
+    """
+    Conexão de um cliente com o servidor. Guarda o protocolo negociado no handshake e
+    serializa as mensagens e respostas conforme ele, independente do transporte usado.
+
+    Os envios não escrevem no socket: entram em uma fila de saída limitada que é esvaziada
+    pelo writer da própria conexão, então quem envia nunca espera por um cliente lento.
+    """
+
+    def __init__(self, address: tuple = None, queue_size: int = DEFAULT_QUEUE_SIZE,
+                 overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST, on_spill=None,
+                 compression: Compression = None):
+        self.address = address
+        self.codec = MessageCodec()
+        # Compressão oferecida pelo servidor; o compressor só é criado se o cliente também a oferecer
+        self.compression = compression
+        self.compressor = None
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self.on_spill = on_spill  # Chamado com (conexão, mensagem) na política SPILL
+        self.outbound = deque()
+        self.dropped = 0
+        self.closed = False
+        self.last_seen = time.monotonic()  # Último instante em que o cliente enviou dados
+        self.last_ping = 0.0
+        # Com acknowledge, todo comando recebe exatamente uma resposta (OK ou ERROR), ativado por -confirmar
+        self.acknowledge = False
+        self.responses = 0  # Respostas enviadas, usado para saber se um comando já foi respondido
+        # Com a retomada de sessão ativa, numera as mensagens de chat enviadas (ResumeBuffer)
+        self.resume_buffer = None
+        self._lock = threading.Lock()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self.outbound)
+
+    def send(self, data: bytes | memoryview, message: str = None, messages: list[str] = None) -> int:
+        """
+        Enfileira os dados para o writer da conexão.
+        :param message: Texto da mensagem de chat, usado para desviá-la ao armazenamento offline.
+        :param messages: Textos das mensagens de chat, quando os dados contêm várias.
+        """
+        if self.closed:
+            raise BrokenPipeError('Conexão já encerrada')
+        buffer = self.resume_buffer
+        if buffer is None:
+            return self._enqueue(data, message)
+        # A numeração segue a ordem da fila de saída, mesmo com vários remetentes ao mesmo tempo
+        with buffer.lock:
+            sent = self._enqueue(data, message)
+            if sent:
+                buffer.record(message, messages)
+            return sent
+
+    def _enqueue(self, data: bytes | memoryview, message: str | None) -> int:
+        with self._lock:
+            if len(self.outbound) >= self.queue_size and not self._handle_overflow(message):
+                return 0
+            self.outbound.append(data)
+        self._wake_writer()
+        return len(data)
+
+    def _handle_overflow(self, message: str | None) -> bool:
+        """Aplica a política de overflow. Retorna True se os dados ainda devem ser enfileirados."""
+        if self.overflow_policy is OverflowPolicy.DROP_OLDEST:
+            self.outbound.popleft()
+            self.dropped += 1
+            if self.resume_buffer is not None:
+                # O cliente deixaria de receber uma mensagem já numerada: a sequência não é mais confiável
+                self.resume_buffer.broken = True
+            return True
+        if self.overflow_policy is OverflowPolicy.SPILL and message is not None and self.on_spill:
+            self.on_spill(self, message)
+            return False
+        # DISCONNECT, ou uma resposta do servidor, que não pode ser armazenada offline
+        self.outbound.clear()
+        self.abort()
+        raise BrokenPipeError('Fila de saída cheia: cliente desconectado')
+
+    def _take_batch(self) -> bytes:
+        """Retira tudo o que está na fila para ser escrito de uma só vez."""
+        with self._lock:
+            batch = b''.join(self.outbound)
+            self.outbound.clear()
+        # Fora do lock: os remetentes não esperam pela compressão
+        if self.compressor is not None and batch:
+            return self.compressor.compress(batch)
+        return batch
+
+    @abstractmethod
+    def _wake_writer(self):
+        """Avisa o writer da conexão que há dados na fila."""
+
+    def close(self):
+        """Encerra a conexão depois que o writer enviar o que ainda está na fila."""
+        self.closed = True
+        self._wake_writer()
+
+    @abstractmethod
+    def abort(self):
+        """Encerra a conexão imediatamente, descartando a fila."""
+
+    def feed(self, data: bytes) -> list[str]:
+        """Retorna os comandos completos contidos nos dados recebidos."""
+        self.last_seen = time.monotonic()
+        commands = self.codec.decode_commands(data)
+        if self.codec.compression and self.compressor is None and self.compression is not None:
+            self.compressor = self.compression.compressor()
+        if replies := self.codec.take_replies():
+            self.send(replies)
+        return commands
+
+    def send_ping(self):
+        self.last_ping = time.monotonic()
+        self.send(self.codec.encode_ping())
+
+    def send_message(self, message: str | Envelope):
+        if isinstance(message, Envelope):
+            # Reaproveita os bytes já codificados, compartilhados com os demais destinatários
+            self.send(message.encoded(self.codec.framed), message.text)
+            return
+        self.send(self.codec.encode_message(message), message)
+
+    def send_messages(self, messages):
+        """Envia várias mensagens em uma única escrita."""
+        messages = messages if isinstance(messages, list) else list(messages)
+        self.send(self.codec.encode_messages(messages), messages=messages)
+
+    def send_response(self, header: str, message: str):
+        self.responses += 1
+        self.send(self.codec.encode_response(header, message))
+
+
+class SocketConnection(Connection):
+    """Conexão sobre um socket bloqueante, usada pelo Server com uma thread por cliente."""
+
+    def __init__(self, client_socket: socket.socket, address: tuple = None, **options):
+        super().__init__(address, **options)
+        self.socket = client_socket
+        self._ready = threading.Event()
+        self._drained = threading.Event()
+        self._writer = threading.Thread(target=self._drain_queue, daemon=True)
+        self._writer.start()
+
+    def recv(self, bufsize: int) -> bytes:
+        if self.closed:
+            raise ConnectionAbortedError('Conexão encerrada pelo servidor')
+        return self.socket.recv(bufsize)
+
+    def _wake_writer(self):
+        self._ready.set()
+
+    def _drain_queue(self):
+        try:
+            while True:
+                self._ready.wait()
+                self._ready.clear()
+                batch = self._take_batch()
+                if batch:
+                    self.socket.sendall(batch)
+                self._drained.set()
+                if self.closed and not self.outbound:
+                    break
+        except OSError:
+            self.closed = True
+        finally:
+            self._drained.set()
+            self.socket.close()
+
+    def wait_for_capacity(self, max_depth: int):
+        """Bloqueia até que a fila de saída tenha no máximo max_depth itens ou a conexão seja encerrada."""
+        while self.queue_depth > max_depth and not self.closed:
+            self._drained.clear()
+            if self.queue_depth > max_depth:
+                self._drained.wait(0.5)
+
+    def abort(self):
+        self.closed = True
+        try:
+            # Acorda a thread bloqueada em recv/sendall
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._wake_writer()
+
+    def fileno(self) -> int:
+        return self.socket.fileno()
+
+
+class StreamConnection(Connection):
+    """
+    Adapta um asyncio.StreamWriter à interface usada pelos handlers do Server,
+    permitindo que os mesmos comandos rodem dentro do event loop.
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter, **options):
+        # Clientes de sockets Unix não têm endereço próprio: são identificados pelo caminho do socket
+        address = writer.get_extra_info('peername') or f"unix:{writer.get_extra_info('sockname')}"
+        super().__init__(address, **options)
+        self._writer = writer
+        self._ready = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._writer_task = self._loop.create_task(self._drain_queue())
+
+    def _wake_writer(self):
+        if threading.get_ident() == self._loop_thread:
+            self._ready.set()
+        else:
+            # Envio feito fora do event loop (ex.: comando do cluster executado em outra thread)
+            self._loop.call_soon_threadsafe(self._ready.set)
+
+    async def _drain_queue(self):
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                batch = self._take_batch()
+                if batch:
+                    self._writer.write(batch)
+                    # Só esta tarefa espera pelo cliente lento; os remetentes seguem adiante
+                    await self._writer.drain()
+                self._drained.set()
+                if self.closed and not self.outbound:
+                    break
+        except (ConnectionError, OSError):
+            self.closed = True
+        finally:
+            self._drained.set()
+            self._writer.close()
+
+    async def wait_for_capacity(self, max_depth: int):
+        """Aguarda até que a fila de saída tenha no máximo max_depth itens ou a conexão seja encerrada."""
+        while self.queue_depth > max_depth and not self.closed:
+            self._drained.clear()
+            await self._drained.wait()
+
+    def abort(self):
+        self.closed = True
+        if threading.get_ident() != self._loop_thread:
+            self._loop.call_soon_threadsafe(self.abort)
+            return
+        self._writer.transport.abort()
+        self._wake_writer()
@@ -0,0 +1,30 @@
+from protocol import FRAME_HEADER, MSG_TEXT, encode_frame
+
+
+class Envelope:
+    """
+    Mensagem de chat formatada e codificada uma única vez e compartilhada, somente leitura,
+    por todos os destinatários de uma entrega (grupo, broadcast ou mensagem privada).
+
+    Os bytes do frame são gerados na primeira vez em que são pedidos; conexões no protocolo
+    antigo recebem uma memoryview do mesmo buffer, sem o cabeçalho, em vez de uma cópia.
+    """
+    __slots__ = ('text', '_frame')
+
+    def __init__(self, text: str):
+        self.text = text
+        self._frame = None
+
+    @property
+    def frame(self) -> bytes:
+        if self._frame is None:
+            self._frame = encode_frame(MSG_TEXT, self.text)
+        return self._frame
+
+    def encoded(self, framed: bool) -> bytes | memoryview:
+        if framed:
+            return self.frame
+        return memoryview(self.frame)[FRAME_HEADER.size:]
+
+    def __str__(self) -> str:
+        return self.text
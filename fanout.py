@@ -0,0 +1,155 @@
+import asyncio
+import queue
+import threading
+import time
+from typing import Callable, Sequence
+
+from log import logger
+
+DEFAULT_THRESHOLD = 1000
+DEFAULT_SHARD_SIZE = 500
+
+
+class _Delivery:
+    """Uma mensagem em entrega: conta os shards restantes para medir o tempo total do fan-out."""
+    __slots__ = ('kind', 'started', 'remaining', 'delivered')
+
+    def __init__(self, kind: str, shards: int):
+        self.kind = kind
+        self.started = time.perf_counter_ns()
+        self.remaining = shards
+        self.delivered = 0
+
+
+class FanoutPool:
+    """
+    Estágio de fan-out para grupos grandes e mensagens globais.
+
+    Abaixo de threshold destinatários a entrega continua inline, no handler do remetente. Acima,
+    os destinatários são divididos em shards de até shard_size, entregues em lote por um conjunto
+    limitado de workers, e o handler do remetente retorna sem esperar a entrega.
+
+    Cada remetente tem uma fila fixa (escolhida pelo hash da conexão), consumida por um único
+    worker: suas mensagens em fan-out são entregues na ordem em que foram enviadas, e remetentes
+    diferentes são entregues em paralelo. Enquanto um remetente tiver entregas na fila, as
+    seguintes (mesmo abaixo do threshold) e as passadas por after() entram na mesma fila, então
+    uma mensagem privada enviada em seguida nunca chega antes de um fan-out anterior. A fila de
+    cada worker tem no máximo queue_size shards; com ela cheia, o remetente espera (backpressure).
+
+    No engine asyncio as conexões só podem ser usadas pelo event loop: com use_loop() os shards
+    são agendados no próprio loop (call_soon, também em ordem), intercalados com os demais eventos.
+    """
+
+    def __init__(self, workers: int = 4, threshold: int = DEFAULT_THRESHOLD, shard_size: int = DEFAULT_SHARD_SIZE,
+                 queue_size: int = 64):
+        self.workers = workers
+        self.threshold = threshold
+        self.shard_size = shard_size
+        self.queue_size = queue_size
+        self.metrics = None  # Definido pelo Server quando a instrumentação está ativa
+        self.pending = 0  # Shards agendados e ainda não entregues
+        self._queues = []
+        self._threads = []
+        self._loop = None
+        self._lock = threading.Lock()
+        self._inflight = {}  # {remetente: tarefas agendadas e ainda não executadas}
+
+    def __reduce__(self):
+        # Copiado para cada worker do cluster apenas com a configuração; cada processo cria suas threads
+        return FanoutPool, (self.workers, self.threshold, self.shard_size, self.queue_size)
+
+    def use_loop(self, loop: asyncio.AbstractEventLoop):
+        """Passa a entregar os shards no event loop (engine asyncio)."""
+        self._loop = loop
+
+    def deliver(self, recipients: Sequence, deliver_shard: Callable[[Sequence], int], kind: str, sender=None):
+        """
+        Entrega a mensagem aos destinatários.
+        :param deliver_shard: Entrega a um lote de destinatários e retorna quantos a receberam.
+        :param kind: Rótulo das métricas ('group' ou 'broadcast').
+        :param sender: Conexão do remetente, que define a fila da entrega. No engine asyncio, sem
+                       remetente (ex.: mensagens repassadas pelo cluster) a entrega é feita inline.
+        """
+        if (len(recipients) < self.threshold and sender not in self._inflight) \
+                or (self._loop is not None and sender is None):
+            started = time.perf_counter_ns()
+            delivered = deliver_shard(recipients)
+            self._record(kind, started, delivered)
+            return
+        shards = [recipients[start:start + self.shard_size] for start in range(0, len(recipients), self.shard_size)]
+        delivery = _Delivery(kind, len(shards))
+        for shard in shards:
+            self._submit(sender, self._run_shard, delivery, deliver_shard, shard)
+
+    def after(self, sender, function: Callable, *args):
+        """Executa function(*args) depois das entregas do remetente ainda na fila, ou inline se não houver."""
+        if sender not in self._inflight:
+            function(*args)
+            return
+        self._submit(sender, function, *args)
+
+    def _submit(self, sender, function: Callable, *args):
+        with self._lock:
+            self.pending += 1
+            self._inflight[sender] = self._inflight.get(sender, 0) + 1
+        if self._loop is not None:
+            self._loop.call_soon(self._run, sender, function, args)
+            return
+        self._start_workers()
+        self._queues[hash(sender) % self.workers].put((sender, function, args))
+
+    def _start_workers(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            self._queues = [queue.Queue(self.queue_size) for _ in range(self.workers)]
+            self._threads = [threading.Thread(target=self._work, args=(work_queue,), daemon=True)
+                             for work_queue in self._queues]
+            for thread in self._threads:
+                thread.start()
+
+    def _work(self, work_queue: queue.Queue):
+        while (job := work_queue.get()) is not None:
+            self._run(*job)
+
+    def _run(self, sender, function: Callable, args: tuple):
+        try:
+            function(*args)
+        except Exception:
+            # Uma tarefa com erro não deve derrubar o worker nem travar a fila do remetente
+            logger.exception("Erro em uma entrega do fan-out")
+        with self._lock:
+            self.pending -= 1
+            if self._inflight[sender] == 1:
+                del self._inflight[sender]
+            else:
+                self._inflight[sender] -= 1
+
+    def _run_shard(self, delivery: _Delivery, deliver_shard: Callable[[Sequence], int], shard: Sequence):
+        # Os shards de uma entrega rodam em sequência no mesmo worker: a contagem dispensa lock
+        try:
+            delivery.delivered += deliver_shard(shard)
+        finally:
+            delivery.remaining -= 1
+            if not delivery.remaining:
+                self._record(delivery.kind, delivery.started, delivery.delivered)
+
+    def _record(self, kind: str, started: int, delivered: int):
+        if self.metrics is not None:
+            self.metrics.histogram('fanout_size', kind=kind).record(delivered)
+            self.metrics.histogram('fanout_duration_seconds', scale=1e-9, kind=kind).record(
+                time.perf_counter_ns() - started)
+
+    async def wait_for_capacity(self):
+        """No engine asyncio, cede o loop até que os shards pendentes voltem ao limite das filas."""
+        while self.pending > self.queue_size * self.workers:
+            await asyncio.sleep(0)
+
+    def close(self):
+        """Entrega os shards já enfileirados e encerra os workers."""
+        for work_queue in self._queues:
+            work_queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=5)
@@ -0,0 +1,166 @@
+import os
+import threading
+import time
+from typing import NamedTuple
+
+from offline_store import RECORD_HEADER, SEGMENT_SUFFIX, scan_records
+
+DEFAULT_CAPACITY = 100
+DEFAULT_FETCH_SIZE = 100
+
+
+class HistoryPage(NamedTuple):
+    messages: list[str]  # Da mais antiga para a mais nova
+    last_seq: int  # Sequência da última mensagem da página; use como desde= na próxima busca
+    more: bool  # Há mensagens mais novas após a página
+
+
+class _Ring:
+    """Últimas mensagens de um grupo em um array de tamanho fixo, indexado por seq % capacidade."""
+    __slots__ = ('slots', 'next_seq', 'first_seq', 'spilled_seq', 'segments', 'segment_bytes')
+
+    def __init__(self, capacity: int, next_seq: int, segments: list[int]):
+        self.slots = [None] * capacity  # [(seq, timestamp, mensagem), ...]
+        self.next_seq = next_seq
+        self.first_seq = next_seq  # Mensagens anteriores a esta, de execuções passadas, só estão em disco
+        self.spilled_seq = next_seq - 1  # Última sequência já gravada em disco
+        self.segments = segments  # Sequência da primeira mensagem de cada segmento em disco, em ordem
+        self.segment_bytes = 0  # Tamanho do último segmento
+
+    def oldest_seq(self) -> int:
+        return max(self.next_seq - len(self.slots), self.first_seq)
+
+
+class GroupHistory:
+    """
+    Histórico recente de cada grupo, para que quem entra com -entrargrupo possa ler o que veio antes
+    (-historico) sem cópias por membro.
+
+    Cada grupo guarda as últimas capacity mensagens em um ring buffer, alocado na primeira mensagem
+    do grupo. Com directory, as mensagens que saem do ring são gravadas em segmentos no disco (no
+    mesmo formato do SegmentLogOfflineStore), mantidos até max_segments por grupo, e o conteúdo do
+    ring é gravado no close(), para que o histórico sobreviva a um reinício.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, directory: str = None,
+                 segment_size: int = 1024 * 1024, max_segments: int = 16):
+        self.capacity = capacity
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self._rings = {}  # {group_name: _Ring}
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def append(self, group_name: str, message: str) -> int:
+        """:return: A sequência da mensagem no histórico do grupo."""
+        with self._lock:
+            ring = self._ring(group_name)
+            seq = ring.next_seq
+            ring.next_seq += 1
+            index = seq % self.capacity
+            evicted = ring.slots[index]
+            ring.slots[index] = (seq, time.time(), message)
+            if evicted is not None and self.directory is not None and evicted[0] > ring.spilled_seq:
+                self._spill(group_name, ring, [evicted])
+            return seq
+
+    def fetch(self, group_name: str, since: int = None, limit: int = DEFAULT_FETCH_SIZE) -> HistoryPage:
+        """
+        Sem since, as últimas limit mensagens; com since, até limit mensagens posteriores a ela.
+        Mensagens mais antigas que o ring são lidas dos segmentos em disco.
+        """
+        with self._lock:
+            ring = self._ring(group_name, create=False)
+            if ring is None:
+                return HistoryPage([], 0, False)
+            newest = ring.next_seq - 1
+            start = max(newest - limit + 1, 1) if since is None else since + 1
+            end = min(newest, start + limit - 1)
+            oldest = ring.oldest_seq()
+            slots = (ring.slots[seq % self.capacity] for seq in range(max(start, oldest), end + 1))
+            recent = [slot[2] for slot in slots if slot is not None]
+            segments = list(ring.segments)
+        older = []
+        if start < oldest and segments:
+            # Os segmentos são append-only: a leitura é feita fora do lock
+            older = self._read_disk(group_name, segments, start, min(end, oldest - 1))
+        return HistoryPage(older + recent, max(end, since or 0), end < newest)
+
+    def _ring(self, group_name: str, create: bool = True) -> _Ring | None:
+        ring = self._rings.get(group_name)
+        if ring is None:
+            segments = self._segments(group_name) if self.directory is not None else []
+            if not create and not segments:
+                return None
+            last_seq = 0
+            if segments:
+                path = self._segment_path(group_name, segments[-1])
+                last_seq = segments[-1] + sum(1 for _ in scan_records(path, read_messages=False)) - 1
+            ring = self._rings[group_name] = _Ring(self.capacity, last_seq + 1, segments)
+            if segments:
+                ring.segment_bytes = os.path.getsize(path)
+        return ring
+
+    # Disco
+
+    def _group_directory(self, group_name: str) -> str:
+        return os.path.join(self.directory, group_name.encode('utf-8').hex())
+
+    def _segments(self, group_name: str) -> list[int]:
+        """Sequência da primeira mensagem de cada segmento, em ordem."""
+        try:
+            names = os.listdir(self._group_directory(group_name))
+        except FileNotFoundError:
+            return []
+        return sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in names if name.endswith(SEGMENT_SUFFIX))
+
+    def _segment_path(self, group_name: str, first_seq: int) -> str:
+        return os.path.join(self._group_directory(group_name), f'{first_seq:012d}{SEGMENT_SUFFIX}')
+
+    def _spill(self, group_name: str, ring: _Ring, entries: list[tuple]):
+        """Grava mensagens em ordem de sequência no último segmento do grupo, iniciando outro quando cheio."""
+        if not ring.segments:
+            os.makedirs(self._group_directory(group_name), exist_ok=True)
+        if not ring.segments or ring.segment_bytes >= self.segment_size:
+            ring.segments.append(entries[0][0])
+            ring.segment_bytes = 0
+            while len(ring.segments) > self.max_segments:
+                os.remove(self._segment_path(group_name, ring.segments.pop(0)))
+        data = bytearray()
+        for _, timestamp, message in entries:
+            encoded = message.encode('utf-8')
+            data += RECORD_HEADER.pack(timestamp, len(encoded)) + encoded
+        with open(self._segment_path(group_name, ring.segments[-1]), 'ab') as segment:
+            segment.write(data)
+        ring.segment_bytes += len(data)
+        ring.spilled_seq = entries[-1][0]
+
+    def _read_disk(self, group_name: str, segments: list[int], start: int, end: int) -> list[str]:
+        messages = []
+        for index, first_seq in enumerate(segments):
+            next_first = segments[index + 1] if index + 1 < len(segments) else None
+            if (next_first is not None and next_first <= start) or first_seq > end:
+                continue
+            try:
+                records = scan_records(self._segment_path(group_name, first_seq))
+                for seq, (_, message) in enumerate(records, first_seq):
+                    if seq > end:
+                        break
+                    if seq >= start:
+                        messages.append(message)
+            except FileNotFoundError:
+                # Segmento descartado pela retenção durante a leitura
+                continue
+        return messages
+
+    def close(self):
+        """Grava em disco o conteúdo dos rings, que de outra forma seria perdido."""
+        if self.directory is None:
+            return
+        with self._lock:
+            for group_name, ring in self._rings.items():
+                pending = sorted(slot for slot in ring.slots if slot is not None and slot[0] > ring.spilled_seq)
+                if pending:
+                    self._spill(group_name, ring, pending)
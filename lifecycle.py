@@ -0,0 +1,65 @@
+import time
+
+DEFAULT_LOGIN_TIMEOUT = 30.0
+
+
+class ConnectionLifecycle:
+    """
+    Acompanha todas as conexões abertas e encerra as que deixaram de responder.
+
+    - Conexões que não enviaram o nome de usuário em login_timeout segundos são encerradas.
+    - Com heartbeat_interval, conexões no protocolo com framing que ficaram esse tempo sem
+      enviar dados recebem um ping; o cliente responde com um pong, que conta como atividade.
+    - Conexões sem nenhuma atividade por idle_timeout segundos são encerradas.
+
+    O servidor apenas aborta as conexões inativas; a thread ou tarefa que lê do cliente detecta
+    o fim da conexão e libera a sessão no registry, como em qualquer outra desconexão.
+    """
+
+    def __init__(self, idle_timeout: float = None, heartbeat_interval: float = None,
+                 login_timeout: float = DEFAULT_LOGIN_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.login_timeout = login_timeout
+        self.connections = {}  # {conexão: None}: conjunto ordenado das conexões abertas
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.idle_timeout or self.heartbeat_interval or self.login_timeout)
+
+    @property
+    def check_interval(self) -> float:
+        """Intervalo entre varreduras: uma fração do menor prazo configurado."""
+        timeouts = [timeout for timeout in (self.idle_timeout, self.heartbeat_interval, self.login_timeout)
+                    if timeout]
+        return max(min(timeouts) / 4, 0.05) if timeouts else 1.0
+
+    def track(self, connection):
+        self.connections[connection] = None
+
+    def untrack(self, connection):
+        self.connections.pop(connection, None)
+
+    def sweep(self, is_authenticated) -> list:
+        """
+        Verifica todas as conexões, enviando pings às ociosas.
+        :param is_authenticated: Função que indica se a conexão já concluiu o login.
+        :return: As conexões inativas, que devem ser encerradas com abort().
+        """
+        now = time.monotonic()
+        reaped = []
+        for connection in list(self.connections):
+            if connection.closed:
+                continue
+            idle = now - connection.last_seen
+            if self.login_timeout and idle > self.login_timeout and not is_authenticated(connection):
+                reaped.append(connection)
+            elif self.idle_timeout and idle > self.idle_timeout:
+                reaped.append(connection)
+            elif (self.heartbeat_interval and connection.codec.framed and idle > self.heartbeat_interval
+                  and now - connection.last_ping > self.heartbeat_interval):
+                try:
+                    connection.send_ping()
+                except OSError:
+                    reaped.append(connection)
+        return reaped
@@ -0,0 +1,148 @@
+"""
+Logging do servidor: os handlers de comando apenas enfileiram os registros (sem formatar e sem
+escrever no console); uma thread separada formata e escreve. Se a fila encher, os registros
+excedentes são descartados em vez de bloquear quem está entregando mensagens.
+
+Configuração por configure() ou pelas variáveis de ambiente PSD_LOG_LEVEL (DEBUG, INFO, ...),
+PSD_LOG_FORMAT (console ou json) e PSD_LOG_SAMPLE (fração dos eventos por mensagem registrados).
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+from colorama import Fore, Style
+
+logger = logging.getLogger('servidor')
+# Eventos gerados a cada mensagem entregue; são os únicos sujeitos a amostragem
+message_logger = logging.getLogger('servidor.mensagens')
+
+DEFAULT_QUEUE_SIZE = 10000
+
+LEVEL_COLORS = {
+    logging.DEBUG: Style.DIM,
+    logging.INFO: Fore.CYAN,
+    logging.WARNING: Fore.YELLOW,
+    logging.ERROR: Fore.RED,
+    logging.CRITICAL: Fore.RED + Style.BRIGHT,
+}
+# Atributos padrão de um LogRecord; os demais vieram de extra= e são campos estruturados
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+_handler = None
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler que não formata o registro antes de enfileirá-lo: a mensagem só é montada
+    pelo listener, e apenas se o registro for de fato escrito. Com a fila cheia, descarta.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SamplingFilter(logging.Filter):
+    """Deixa passar apenas uma fração dos registros (eventos por mensagem em tráfego alto)."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return self.rate >= 1 or random.random() < self.rate
+
+
+class ConsoleFormatter(logging.Formatter):
+    """Formato legível, colorido pelo nível do registro."""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(message)s', datefmt='%H:%M:%S')
+
+    def format(self, record: logging.LogRecord) -> str:
+        return LEVEL_COLORS.get(record.levelno, '') + super().format(record) + Style.RESET_ALL
+
+
+class JSONFormatter(logging.Formatter):
+    """Uma linha JSON por registro, com os campos passados em extra=."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 6),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value if isinstance(value, (int, float, bool, type(None))) else str(value)
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def configure(level: str = None, fmt: str = None, sample_rate: float = None, stream=None,
+              queue_size: int = DEFAULT_QUEUE_SIZE):
+    """
+    (Re)configura o logging do servidor. Parâmetros omitidos vêm das variáveis de ambiente.
+    :param fmt: 'console' (colorido) ou 'json' (JSON lines).
+    :param sample_rate: Fração dos eventos por mensagem (logger servidor.mensagens) registrados.
+    """
+    global _listener, _handler
+    shutdown()
+    level = (level or os.environ.get('PSD_LOG_LEVEL', 'INFO')).upper()
+    fmt = fmt or os.environ.get('PSD_LOG_FORMAT', 'console')
+    sample_rate = sample_rate if sample_rate is not None else float(os.environ.get('PSD_LOG_SAMPLE', 1.0))
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JSONFormatter() if fmt == 'json' else ConsoleFormatter())
+    log_queue = queue.Queue(queue_size)
+    _handler = NonBlockingQueueHandler(log_queue)
+    _listener = QueueListener(log_queue, output)
+    _listener.start()
+
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(_handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    message_logger.filters.clear()
+    if sample_rate < 1:
+        message_logger.addFilter(SamplingFilter(sample_rate))
+
+
+def ensure_configured():
+    """Configura com os valores padrão, a menos que a aplicação já tenha chamado configure()."""
+    if _listener is None:
+        configure()
+
+
+def dropped_records() -> int:
+    """Registros descartados porque a fila de logging estava cheia."""
+    return _handler.dropped if _handler is not None else 0
+
+
+def shutdown():
+    """Escreve os registros pendentes e encerra a thread do listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown)
@@ -0,0 +1,210 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Sub-buckets por potência de 2 nos histogramas: erro relativo de no máximo 1/SUB_BUCKETS
+SUB_BUCKET_BITS = 3
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+PREFIX = 'psd_'
+
+
+class Histogram:
+    """
+    Histograma no estilo HDR para valores inteiros (ex.: nanossegundos). Valores pequenos têm
+    um bucket cada; acima disso, cada potência de 2 é dividida em SUB_BUCKETS buckets iguais,
+    então registrar um valor custa apenas algumas operações de bits e um incremento.
+    """
+
+    def __init__(self, scale: float = 1.0):
+        # Fator aplicado na exibição (ex.: 1e-9 para exibir nanossegundos em segundos)
+        self.scale = scale
+        self.counts = [0] * (2 * SUB_BUCKETS + 64 * SUB_BUCKETS)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _index(value: int) -> int:
+        if value < 2 * SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - SUB_BUCKET_BITS - 1
+        return SUB_BUCKETS * shift + (value >> shift)
+
+    @staticmethod
+    def _upper_bound(index: int) -> int:
+        """Maior valor registrado no bucket."""
+        if index < 2 * SUB_BUCKETS:
+            return index
+        shift = index // SUB_BUCKETS - 1
+        return ((index - SUB_BUCKETS * shift) + 1 << shift) - 1
+
+    def record(self, value: int):
+        value = max(int(value), 0)
+        index = Histogram._index(value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, fraction: float) -> float:
+        with self._lock:
+            counts = list(self.counts)
+            count = self.count
+            maximum = self.max
+        if not count:
+            return 0.0
+        target = max(int(count * fraction + 0.5), 1)
+        seen = 0
+        for index, bucket in enumerate(counts):
+            seen += bucket
+            if seen >= target:
+                return min(Histogram._upper_bound(index), maximum) * self.scale
+        return maximum * self.scale
+
+    @property
+    def sum(self) -> float:
+        return self.total * self.scale
+
+
+class Metrics:
+    """
+    Contadores, histogramas e gauges do servidor.
+
+    Contadores e histogramas são atualizados no caminho das mensagens; gauges são funções
+    avaliadas apenas na leitura (-stats ou endpoint HTTP), assim como os contadores mantidos pelos
+    próprios componentes (ex.: bytes comprimidos), registrados com counter(). Com a instrumentação desativada o
+    servidor mantém self.metrics = None e os pontos de medição se resumem a um teste de None.
+    """
+
+    def __init__(self):
+        self.counters = {}  # {(nome, rótulos): valor}
+        self.histograms = {}  # {(nome, rótulos): Histogram}
+        self.gauges = {}  # {nome: (função, descrição, tipo)}, avaliados na leitura
+        self.descriptions = {}  # {nome: descrição} de contadores e histogramas
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted(labels.items()))
+
+    def describe(self, name: str, description: str):
+        self.descriptions[name] = description
+
+    def inc(self, name: str, amount: int = 1, **labels):
+        key = Metrics._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def histogram(self, name: str, scale: float = 1.0, **labels) -> Histogram:
+        """Retorna o histograma com o nome e rótulos, criando-o na primeira chamada."""
+        key = Metrics._key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key, Histogram(scale))
+        return histogram
+
+    def gauge(self, name: str, function, description: str = ''):
+        self.gauges[name] = (function, description, 'gauge')
+
+    def counter(self, name: str, function, description: str = ''):
+        """Como gauge(), para um valor que só cresce: exportado como counter."""
+        self.gauges[name] = (function, description, 'counter')
+
+    def _gauge_values(self) -> dict[str, float]:
+        values = {}
+        for name, (function, _, _) in self.gauges.items():
+            try:
+                values[name] = function()
+            except Exception:
+                # Um gauge com erro não deve impedir a leitura dos demais
+                continue
+        return values
+
+    @staticmethod
+    def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+        labels = labels + extra
+        if not labels:
+            return ''
+        return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+    def render_prometheus(self) -> str:
+        """Exposição no formato de texto do Prometheus; histogramas viram summaries com quantis."""
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+        declared = set()
+        for (name, labels), value in counters:
+            if name not in declared:
+                declared.add(name)
+                lines.append(f'# HELP {PREFIX}{name} {self.descriptions.get(name, name)}')
+                lines.append(f'# TYPE {PREFIX}{name} counter')
+            lines.append(f'{PREFIX}{name}{Metrics._format_labels(labels)} {value}')
+        for (name, labels), histogram in histograms:
+            if name not in declared:
+                declared.add(name)
+                lines.append(f'# HELP {PREFIX}{name} {self.descriptions.get(name, name)}')
+                lines.append(f'# TYPE {PREFIX}{name} summary')
+            for fraction in QUANTILES:
+                quantile = Metrics._format_labels(labels, (('quantile', fraction),))
+                lines.append(f'{PREFIX}{name}{quantile} {histogram.quantile(fraction):.9g}')
+            lines.append(f'{PREFIX}{name}_sum{Metrics._format_labels(labels)} {histogram.sum:.9g}')
+            lines.append(f'{PREFIX}{name}_count{Metrics._format_labels(labels)} {histogram.count}')
+        for name, value in self._gauge_values().items():
+            _, description, kind = self.gauges[name]
+            lines.append(f'# HELP {PREFIX}{name} {description or name}')
+            lines.append(f'# TYPE {PREFIX}{name} {kind}')
+            lines.append(f'{PREFIX}{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def render_text(self) -> str:
+        """Resumo legível, enviado como resposta ao comando -stats."""
+        lines = [f'{name}: {value}' for name, value in self._gauge_values().items()]
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+        for (name, labels), value in counters:
+            lines.append(f'{name}{Metrics._format_labels(labels)}: {value}')
+        for (name, labels), histogram in histograms:
+            if not histogram.count:
+                continue
+            quantiles = ' '.join(f'p{fraction * 100:g}={histogram.quantile(fraction):.3g}' for fraction in QUANTILES)
+            lines.append(f'{name}{Metrics._format_labels(labels)}: n={histogram.count} {quantiles}'
+                         f' max={histogram.max * histogram.scale:.3g}')
+        return '\n'.join(lines)
+
+
+class MetricsHTTPServer:
+    """Endpoint HTTP local (GET /metrics) para coleta das métricas por um Prometheus."""
+
+    def __init__(self, metrics: Metrics, host: str, port: int):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Coletas periódicas não devem poluir o console do servidor
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.address = self._server.server_address
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
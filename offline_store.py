@@ -0,0 +1,347 @@
+import os
+import struct
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+
+DEFAULT_CHUNK_SIZE = 256
+
+# Cabeçalho de cada registro no log: instante em que foi armazenado e tamanho da mensagem
+RECORD_HEADER = struct.Struct('!dI')
+SEGMENT_SUFFIX = '.log'
+
+
+def scan_records(path: str, read_messages: bool = True):
+    """Gera (timestamp, mensagem) de um segmento; com read_messages=False pula o conteúdo."""
+    with open(path, 'rb') as segment:
+        while True:
+            header = segment.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                # Fim do segmento, ou um registro incompleto deixado por uma queda do servidor
+                return
+            timestamp, length = RECORD_HEADER.unpack(header)
+            if not read_messages:
+                segment.seek(length, os.SEEK_CUR)
+                yield timestamp, None
+                continue
+            data = segment.read(length)
+            if len(data) < length:
+                return
+            yield timestamp, data.decode('utf-8')
+
+
+class OfflineStore(ABC):
+    """
+    Armazena as mensagens destinadas a usuários desconectados até que eles voltem.
+    As implementações podem limitar a quantidade de mensagens por usuário (quota,
+    descartando as mais antigas) e expirar mensagens mais velhas que o TTL.
+    """
+
+    @abstractmethod
+    def append(self, username: str, message: str):
+        """Guarda a mensagem até o usuário se conectar."""
+
+    @abstractmethod
+    def pending(self, username: str) -> int:
+        """Quantidade de mensagens armazenadas para o usuário."""
+
+    @abstractmethod
+    def pop_chunks(self, username: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        Gera as mensagens do usuário em blocos de até chunk_size, removendo-as do armazenamento
+        à medida que são consumidas. Se o consumo for interrompido, o restante é mantido.
+        """
+
+    @abstractmethod
+    def backlog_bytes(self) -> int:
+        """Tamanho das mensagens armazenadas para todos os usuários, usado nas métricas."""
+
+    def close(self):
+        pass
+
+
+class MemoryOfflineStore(OfflineStore):
+    """Armazenamento em memória: rápido, mas perdido quando o servidor reinicia."""
+
+    def __init__(self, quota: int = None, ttl: float = None):
+        self.quota = quota
+        self.ttl = ttl
+        self._messages = {}  # {username: deque([(timestamp, mensagem), ...])}
+        self._lock = threading.Lock()
+
+    def append(self, username: str, message: str):
+        with self._lock:
+            if username not in self._messages:
+                # deque com maxlen descarta automaticamente as mensagens mais antigas
+                self._messages[username] = deque(maxlen=self.quota)
+            self._messages[username].append((time.time(), message))
+
+    def pending(self, username: str) -> int:
+        return len(self._messages.get(username, ()))
+
+    def pop_chunks(self, username: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        expires_before = time.time() - self.ttl if self.ttl else None
+        while True:
+            with self._lock:
+                messages = self._messages.get(username)
+                if not messages:
+                    self._messages.pop(username, None)
+                    return
+                chunk = []
+                while messages and len(chunk) < chunk_size:
+                    timestamp, message = messages.popleft()
+                    if expires_before is None or timestamp >= expires_before:
+                        chunk.append(message)
+            if chunk:
+                yield chunk
+
+    def backlog_bytes(self) -> int:
+        with self._lock:
+            queues = [list(messages) for messages in self._messages.values()]
+        return sum(len(message.encode('utf-8')) for messages in queues for _, message in messages)
+
+
+class _UserLog:
+    """Estado em memória do log de um usuário; as mensagens ficam apenas em disco."""
+    __slots__ = ('directory', 'segments', 'skip', 'count', 'oldest')
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.segments = []  # Ids dos segmentos, do mais antigo ao mais novo
+        self.skip = 0  # Registros do início do log descartados pela quota, removidos na compactação
+        self.count = 0  # Registros em disco, incluindo os descartados
+        self.oldest = None  # Instante do registro mais antigo em disco
+
+    def path(self, segment_id: int) -> str:
+        return os.path.join(self.directory, f'{segment_id:08d}{SEGMENT_SUFFIX}')
+
+
+class SegmentLogOfflineStore(OfflineStore):
+    """
+    Armazenamento em disco, em um diretório local: cada usuário tem um log append-only dividido
+    em segmentos. Apenas contadores ficam em memória, então um usuário com 100 mil mensagens
+    pendentes não ocupa memória até que elas sejam lidas, bloco a bloco, na reconexão.
+
+    A quota descarta logicamente as mensagens mais antigas e o TTL as ignora na leitura; a
+    compactação em segundo plano reescreve os logs removendo esses registros do disco.
+    """
+
+    def __init__(self, directory: str, quota: int = None, ttl: float = None,
+                 segment_size: int = 1024 * 1024, compaction_interval: float = 60.0):
+        self.directory = directory
+        self.quota = quota
+        self.ttl = ttl
+        self.segment_size = segment_size
+        self._users = {}  # {username: _UserLog}
+        self._next_segment_id = 1  # Ids crescentes, compartilhados por todos os usuários
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+        self._compactor = None
+        if compaction_interval:
+            self._compactor = threading.Thread(target=self._compaction_loop, args=(compaction_interval,),
+                                               daemon=True)
+            self._compactor.start()
+
+    def _user_directory(self, username: str) -> str:
+        # O nome do diretório é o nome de usuário em hexadecimal, seguro para qualquer sistema de arquivos
+        return os.path.join(self.directory, username.encode('utf-8').hex())
+
+    def _load(self):
+        """Reconstrói os contadores a partir dos segmentos em disco, lendo apenas os cabeçalhos."""
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir():
+                continue
+            try:
+                username = bytes.fromhex(entry.name).decode('utf-8')
+            except ValueError:
+                continue
+            log = _UserLog(entry.path)
+            log.segments = sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(entry.path)
+                                  if name.endswith(SEGMENT_SUFFIX))
+            if log.segments:
+                self._next_segment_id = max(self._next_segment_id, log.segments[-1] + 1)
+            for segment_id in log.segments:
+                for timestamp, _ in SegmentLogOfflineStore._scan(log.path(segment_id), read_messages=False):
+                    if log.oldest is None:
+                        log.oldest = timestamp
+                    log.count += 1
+            if self.quota and log.count > self.quota:
+                log.skip = log.count - self.quota
+            if log.segments:
+                self._users[username] = log
+
+    @staticmethod
+    def _scan(path: str, read_messages: bool = True):
+        return scan_records(path, read_messages)
+
+    def append(self, username: str, message: str):
+        data = message.encode('utf-8')
+        timestamp = time.time()
+        with self._lock:
+            log = self._users.get(username)
+            if log is None:
+                log = self._users[username] = _UserLog(self._user_directory(username))
+                os.makedirs(log.directory, exist_ok=True)
+            if not log.segments or os.path.getsize(log.path(log.segments[-1])) >= self.segment_size:
+                log.segments.append(self._next_segment_id)
+                self._next_segment_id += 1
+            with open(log.path(log.segments[-1]), 'ab') as segment:
+                segment.write(RECORD_HEADER.pack(timestamp, len(data)) + data)
+            if log.oldest is None:
+                log.oldest = timestamp
+            log.count += 1
+            if self.quota and log.count - log.skip > self.quota:
+                log.skip += 1
+
+    def pending(self, username: str) -> int:
+        log = self._users.get(username)
+        return log.count - log.skip if log else 0
+
+    def backlog_bytes(self) -> int:
+        with self._lock:
+            paths = [log.path(segment_id) for log in self._users.values() for segment_id in log.segments]
+        size = 0
+        for path in paths:
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                # Segmento removido por uma entrega ou compactação em andamento
+                continue
+        return size
+
+    def _seal(self, username: str) -> _UserLog | None:
+        """
+        Retira os segmentos atuais do usuário para leitura ou compactação. Novas mensagens
+        passam a ser gravadas em segmentos novos enquanto os antigos são processados.
+        """
+        with self._lock:
+            log = self._users.pop(username, None)
+            if log is None or not log.segments:
+                return None
+            self._users[username] = _UserLog(log.directory)
+            return log
+
+    def _unseal(self, username: str, log: _UserLog):
+        """Devolve segmentos selados (não consumidos ou compactados) ao início do log do usuário."""
+        with self._lock:
+            current = self._users.get(username)
+            if current is None or not current.segments:
+                if log.segments:
+                    self._users[username] = log
+                    return
+                self._users.pop(username, None)
+                try:
+                    os.rmdir(log.directory)
+                except OSError:
+                    pass
+                return
+            current.segments = log.segments + current.segments
+            # skip conta a partir do início do log: se as mensagens novas já excederam a quota,
+            # todas as devolvidas, mais antigas, também ficam além dela
+            current.skip = log.count + current.skip if current.skip else log.skip
+            current.count += log.count
+            if self.quota:
+                current.skip = max(current.skip, current.count - self.quota)
+            current.oldest = log.oldest if log.oldest is not None else current.oldest
+
+    def pop_chunks(self, username: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        log = self._seal(username)
+        if log is None:
+            return
+        expires_before = time.time() - self.ttl if self.ttl else None
+        consumed = 0
+        try:
+            while log.segments:
+                segment_id = log.segments[0]
+                chunk = []
+                for timestamp, message in SegmentLogOfflineStore._scan(log.path(segment_id)):
+                    consumed += 1
+                    if log.skip >= consumed or (expires_before is not None and timestamp < expires_before):
+                        continue
+                    chunk.append(message)
+                    if len(chunk) >= chunk_size:
+                        yield chunk
+                        chunk = []
+                if chunk:
+                    yield chunk
+                # Segmento totalmente entregue
+                log.skip = max(0, log.skip - consumed)
+                log.count -= consumed
+                log.segments.pop(0)
+                os.remove(log.path(segment_id))
+                consumed = 0
+        finally:
+            if consumed:
+                # Leitura interrompida: remove do disco o que já foi entregue do segmento atual,
+                # para que não seja reenviado mesmo após um reinício do servidor
+                head = self._rewrite(log, log.segments[:1], consumed, None)
+                head.segments += log.segments[1:]
+                head.count = log.count - consumed
+                head.skip = max(0, log.skip - consumed)
+                head.oldest = head.oldest if head.oldest is not None else log.oldest
+                log = head
+            self._unseal(username, log)
+
+    def compact(self):
+        """Reescreve os logs com registros descartados pela quota ou expirados pelo TTL."""
+        expires_before = time.time() - self.ttl if self.ttl else None
+        with self._lock:
+            candidates = [username for username, log in self._users.items()
+                          if log.skip or (expires_before is not None and log.oldest is not None
+                                          and log.oldest < expires_before)]
+        for username in candidates:
+            if self._closed.is_set():
+                return
+            log = self._seal(username)
+            if log is not None:
+                self._unseal(username, self._rewrite(log, log.segments, log.skip, expires_before))
+
+    def _rewrite(self, log: _UserLog, segment_ids: list[int], drop_first: int,
+                 expires_before: float | None) -> _UserLog:
+        """
+        Reescreve os segmentos em um único, sem os drop_first primeiros registros e sem os expirados.
+        O novo segmento reutiliza o menor id, mantendo-se antes de qualquer segmento mais novo do usuário.
+        """
+        rewritten = _UserLog(log.directory)
+        target_id = segment_ids[0]
+        temporary_path = log.path(target_id) + '.tmp'
+        index = 0
+        with open(temporary_path, 'wb') as target:
+            for segment_id in segment_ids:
+                for timestamp, message in SegmentLogOfflineStore._scan(log.path(segment_id)):
+                    index += 1
+                    if index <= drop_first or (expires_before is not None and timestamp < expires_before):
+                        continue
+                    data = message.encode('utf-8')
+                    target.write(RECORD_HEADER.pack(timestamp, len(data)) + data)
+                    if rewritten.oldest is None:
+                        rewritten.oldest = timestamp
+                    rewritten.count += 1
+            target.flush()
+            os.fsync(target.fileno())
+        # Os segmentos de origem só são removidos depois que o novo está no lugar: uma queda no meio
+        # pode repetir mensagens no próximo replay, mas nunca perdê-las
+        if rewritten.count:
+            os.replace(temporary_path, log.path(target_id))
+            rewritten.segments = [target_id]
+            segment_ids = segment_ids[1:]
+        else:
+            os.remove(temporary_path)
+        for segment_id in segment_ids:
+            os.remove(log.path(segment_id))
+        return rewritten
+
+    def _compaction_loop(self, interval: float):
+        while not self._closed.wait(interval):
+            try:
+                self.compact()
+            except OSError:
+                pass
+
+    def close(self):
+        self._closed.set()
+        if self._compactor is not None:
+            self._compactor.join()
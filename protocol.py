@@ -0,0 +1,241 @@
+import struct
+import zlib
+
+# Bytes enviados pelo cliente antes do primeiro frame para negociar o protocolo com framing.
+# Clientes antigos enviam o nome de usuário diretamente, que nunca começa com \x00.
+PROTOCOL_MAGIC = b'\x00PSD'
+PROTOCOL_VERSION = 1
+HANDSHAKE = PROTOCOL_MAGIC + bytes([PROTOCOL_VERSION])
+
+# Cabeçalho de cada frame: versão (1 byte), tipo (1 byte) e tamanho do payload (4 bytes)
+FRAME_HEADER = struct.Struct('!BBI')
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+RECV_BUFFER_SIZE = 64 * 1024
+
+MSG_COMMAND = 1  # cliente -> servidor: nome de usuário ou comando
+MSG_TEXT = 2  # servidor -> cliente: mensagem de chat
+MSG_OK = 3  # servidor -> cliente: resposta de sucesso
+MSG_ERROR = 4  # servidor -> cliente: resposta de erro
+MSG_PING = 5  # heartbeat, nos dois sentidos; quem recebe responde com MSG_PONG
+MSG_PONG = 6
+MSG_PRESENCE = 7  # servidor -> cliente: '+usuário' ou '-usuário', para quem assinou a presença
+MSG_SESSION = 8  # servidor -> cliente: token de retomada da sessão, enviado após o login
+MSG_COMPRESSION = 9  # cliente -> servidor: oferece a compressão (COMPRESSION_CODEC), junto com o handshake
+MSG_COMPRESSED = 10  # servidor -> cliente: bloco de frames comprimido no contexto da conexão
+
+RESPONSE_TYPES = {'OK': MSG_OK, 'ERROR': MSG_ERROR}
+RESPONSE_HEADERS = {MSG_OK: 'OK', MSG_ERROR: 'ERROR'}
+PRESENCE_HEADER = 'PRESENCA'
+SESSION_HEADER = 'SESSAO'
+# Cabeçalho de cada tipo de mensagem recebida pelo cliente; mensagens de chat não têm cabeçalho
+MESSAGE_HEADERS = {**RESPONSE_HEADERS, MSG_PRESENCE: PRESENCE_HEADER, MSG_SESSION: SESSION_HEADER}
+# Enviado no lugar do nome de usuário para retomar uma sessão: '-retomar usuário token última_sequência',
+# onde a sequência é o número de mensagens de chat recebidas desde o login
+RESUME_COMMAND = '-retomar'
+# Marca, no título de uma listagem paginada, que há outra página: o último item é o cursor (apos=)
+MORE_RESULTS = '(mais resultados)'
+LEGACY_HEADER_SIZE = 10
+
+# Compressão negociada: o servidor só envia MSG_COMPRESSED a quem ofereceu o codec, e servidores que
+# não o conhecem ignoram a oferta. Os blocos usam um único contexto zlib por conexão (com sync flush),
+# então prefixos repetidos entre mensagens viram referências curtas. O dicionário, com os textos mais
+# comuns do servidor, ajuda já nos primeiros blocos; alterá-lo exige um novo nome de codec.
+COMPRESSION_CODEC = 'zlib'
+COMPRESSION_DICTIONARY = (
+    'Usuários online:\nUsuários do grupo: \nGrupos:\nNenhum usuário no grupo Mensagem enviada '
+    'Conexão estabelecida com sucesso!(mais resultados)/2026 - 00:00:00): '
+).encode('utf-8')
+
+
+class ProtocolError(Exception):
+    """Dados recebidos não seguem o protocolo negociado."""
+
+
+def encode_frame(msg_type: int, payload: str | bytes) -> bytes:
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    if len(payload) > MAX_FRAME_SIZE:
+        raise ProtocolError(f'Frame de {len(payload)} bytes excede o limite de {MAX_FRAME_SIZE}')
+    return FRAME_HEADER.pack(PROTOCOL_VERSION, msg_type, len(payload)) + payload
+
+
+def encode_frames(msg_type: int, payloads) -> bytes:
+    """Concatena vários frames para serem enviados em uma única escrita (pipelining)."""
+    return b''.join(encode_frame(msg_type, payload) for payload in payloads)
+
+
+def format_response(header: str, message: str) -> str:
+    """Formato textual das respostas no protocolo antigo: cabeçalho de 10 caracteres e a mensagem."""
+    return header.ljust(LEGACY_HEADER_SIZE) + f'\n{message}'
+
+
+class FrameDecoder:
+    """
+    Extrai frames de um fluxo TCP. Os dados podem chegar fragmentados ou vários frames
+    em uma única leitura; o que sobrar fica no buffer até a próxima chamada de feed.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> list[tuple[int, bytes]]:
+        buffer = self._buffer
+        buffer += data
+        frames = []
+        offset = 0
+        size = len(buffer)
+        header_size = FRAME_HEADER.size
+        while size - offset >= header_size:
+            version, msg_type, length = FRAME_HEADER.unpack_from(buffer, offset)
+            if version != PROTOCOL_VERSION:
+                raise ProtocolError(f'Versão de protocolo não suportada: {version}')
+            if length > MAX_FRAME_SIZE:
+                raise ProtocolError(f'Frame de {length} bytes excede o limite de {MAX_FRAME_SIZE}')
+            end = offset + header_size + length
+            if end > size:
+                break
+            frames.append((msg_type, bytes(buffer[offset + header_size:end])))
+            offset = end
+        if offset:
+            del buffer[:offset]
+        return frames
+
+
+class MessageCodec:
+    """
+    Serializa e interpreta as mensagens de uma conexão, no protocolo antigo (um recv por
+    mensagem, respostas com cabeçalho de texto) ou no protocolo com framing.
+    """
+
+    def __init__(self, framed: bool | None = None, compression: bool = False):
+        # None enquanto o servidor ainda não recebeu o handshake do cliente
+        self.framed = framed
+        # Cliente: oferece a compressão no handshake. Servidor: o cliente ofereceu
+        self.compression = compression
+        self._decompressor = None  # Cliente: contexto zlib e frames dos blocos comprimidos recebidos
+        self._inner_decoder = None
+        self._handshake_buffer = b''
+        self._decoder = FrameDecoder()
+        self._replies = bytearray()  # Respostas de controle (pongs) a serem enviadas pelo dono do codec
+
+    # Lado do cliente
+
+    def handshake(self, username: str) -> bytes:
+        if not self.framed:
+            return username.encode('utf-8')
+        if self.compression:
+            return HANDSHAKE + encode_frame(MSG_COMPRESSION, COMPRESSION_CODEC) + encode_frame(MSG_COMMAND, username)
+        return HANDSHAKE + encode_frame(MSG_COMMAND, username)
+
+    def encode_command(self, command: str) -> bytes:
+        if not self.framed:
+            return command.encode('utf-8')
+        return encode_frame(MSG_COMMAND, command)
+
+    def encode_commands(self, commands) -> bytes:
+        if not self.framed:
+            raise ProtocolError('O envio de vários comandos em uma escrita requer o protocolo com framing')
+        return encode_frames(MSG_COMMAND, commands)
+
+    def decode(self, data: bytes) -> list[tuple[str | None, str]]:
+        """
+        Interpreta dados recebidos do servidor.
+        :return: Lista de (cabeçalho, mensagem); o cabeçalho é 'OK', 'ERROR', 'PRESENCA', 'SESSAO' ou None
+                 para mensagens de chat.
+        """
+        if not self.framed:
+            text = data.decode('utf-8')
+            header = text[:LEGACY_HEADER_SIZE].strip()
+            if header in RESPONSE_TYPES:
+                return [(header, text[LEGACY_HEADER_SIZE + 1:])]
+            return [(None, text)]
+        frames = self._decoder.feed(data)
+        if any(msg_type == MSG_COMPRESSED for msg_type, _ in frames):
+            frames = self._decompress(frames)
+        return [(MESSAGE_HEADERS.get(msg_type), payload.decode('utf-8'))
+                for msg_type, payload in self._control(frames)]
+
+    def _decompress(self, frames: list[tuple[int, bytes]]) -> list[tuple[int, bytes]]:
+        """Substitui cada bloco comprimido pelos frames que ele contém, na mesma posição."""
+        if self._decompressor is None:
+            self._decompressor = zlib.decompressobj(zdict=COMPRESSION_DICTIONARY)
+            self._inner_decoder = FrameDecoder()
+        expanded = []
+        for msg_type, payload in frames:
+            if msg_type != MSG_COMPRESSED:
+                expanded.append((msg_type, payload))
+                continue
+            try:
+                expanded += self._inner_decoder.feed(self._decompressor.decompress(payload))
+            except zlib.error as e:
+                raise ProtocolError(f'Bloco comprimido inválido: {e}') from e
+        return expanded
+
+    # Lado do servidor
+
+    def decode_commands(self, data: bytes) -> list[str]:
+        """Extrai os comandos enviados pelo cliente, detectando o protocolo na primeira leitura."""
+        if self.framed is None:
+            data = self._negotiate(data)
+            if data is None:
+                return []
+        if not self.framed:
+            message = data.decode('utf-8').strip()
+            return [message] if message else []
+        frames = self._control(self._decoder.feed(data))
+        if not self.compression and any(msg_type == MSG_COMPRESSION for msg_type, _ in frames):
+            self.compression = any(msg_type == MSG_COMPRESSION and payload == COMPRESSION_CODEC.encode()
+                                   for msg_type, payload in frames)
+        return [payload.decode('utf-8').strip() for msg_type, payload in frames if msg_type == MSG_COMMAND]
+
+    def _control(self, frames: list[tuple[int, bytes]]) -> list[tuple[int, bytes]]:
+        """Responde aos frames de heartbeat e os remove da lista de mensagens."""
+        if not any(msg_type in (MSG_PING, MSG_PONG) for msg_type, _ in frames):
+            return frames
+        messages = []
+        for msg_type, payload in frames:
+            if msg_type == MSG_PING:
+                self._replies += encode_frame(MSG_PONG, payload)
+            elif msg_type != MSG_PONG:
+                messages.append((msg_type, payload))
+        return messages
+
+    def take_replies(self) -> bytes:
+        """Retorna e limpa as respostas de controle geradas pelos últimos dados interpretados."""
+        replies = bytes(self._replies)
+        self._replies.clear()
+        return replies
+
+    def encode_ping(self) -> bytes:
+        return encode_frame(MSG_PING, b'')
+
+    def _negotiate(self, data: bytes) -> bytes | None:
+        buffer = self._handshake_buffer + data
+        if len(buffer) < len(HANDSHAKE) and PROTOCOL_MAGIC.startswith(buffer[:len(PROTOCOL_MAGIC)]):
+            # Handshake chegou fragmentado: aguarda o restante
+            self._handshake_buffer = buffer
+            return None
+        self._handshake_buffer = b''
+        if not buffer.startswith(PROTOCOL_MAGIC):
+            self.framed = False
+            return buffer
+        version = buffer[len(PROTOCOL_MAGIC)]
+        if version != PROTOCOL_VERSION:
+            raise ProtocolError(f'Versão de protocolo não suportada: {version}')
+        self.framed = True
+        return buffer[len(HANDSHAKE):]
+
+    def encode_message(self, message: str) -> bytes:
+        if not self.framed:
+            return message.encode('utf-8')
+        return encode_frame(MSG_TEXT, message)
+
+    def encode_messages(self, messages) -> bytes:
+        if not self.framed:
+            return ''.join(message + '\n' for message in messages).encode('utf-8')
+        return encode_frames(MSG_TEXT, messages)
+
+    def encode_response(self, header: str, message: str) -> bytes:
+        if not self.framed:
+            return format_response(header, message).encode('utf-8')
+        return encode_frame(RESPONSE_TYPES[header], message)
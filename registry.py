@@ -0,0 +1,218 @@
+import threading
+
+
+class SessionRegistry:
+    """
+    Índices das sessões ativas e dos grupos, mantidos consistentes entre si:
+    conexão -> usuário, usuário -> conexão e grupo -> membros.
+    Todas as consultas são O(1), então o custo de entregar uma mensagem depende apenas
+    do número de destinatários e não do total de usuários conectados.
+
+    Concorrência: há um único escritor por vez (as alterações são serializadas por self._writer)
+    e os leitores nunca bloqueiam. Consultas pontuais são leituras atômicas de dict; quem precisa
+    iterar (broadcasts, listagens) recebe um snapshot imutável (tupla), reconstruído apenas na
+    primeira leitura após uma alteração. Assim as entregas não disputam lock com logins e grupos,
+    e nenhuma iteração vê um dict mudando de tamanho.
+    """
+
+    def __init__(self):
+        self.clients = {}  # {conexão: username}
+        self.connections = {}  # {username: conexão}
+        # {group_name: {username: None}}: dict usado como conjunto ordenado, preserva a ordem de entrada
+        self.groups = {}
+        self._writer = threading.Lock()
+        self.presence_subscribers = {}  # {conexão: None}: sessões locais que recebem entradas e saídas
+        # Snapshots; None (ou ausente em _members) quando desatualizados
+        self._sessions = None
+        self._online = None
+        self._sorted_online = None
+        self._group_names = None
+        self._sorted_group_names = None
+        self._members = {}
+        self._sorted_members = {}
+        self._subscribers = None
+
+    def connect(self, connection, username: str) -> bool:
+        """Registra a sessão. Retorna False se o usuário já estiver conectado por outra conexão."""
+        with self._writer:
+            if self.connections.setdefault(username, connection) is not connection:
+                return False
+            self.clients[connection] = username
+            self._sessions = self._online = self._sorted_online = None
+        return True
+
+    def disconnect(self, connection) -> str | None:
+        """Remove a sessão da conexão e retorna o nome do usuário, se houver."""
+        with self._writer:
+            username = self.clients.pop(connection, None)
+            if username is not None and self.connections.get(username) is connection:
+                del self.connections[username]
+            if self.presence_subscribers.pop(connection, False) is None:
+                self._subscribers = None
+            self._sessions = self._online = self._sorted_online = None
+        return username
+
+    def replace(self, connection, new_connection) -> str | None:
+        """
+        Transfere a sessão (e a assinatura de presença) da conexão para new_connection.
+        :return: O nome do usuário, ou None se a conexão não tinha sessão.
+        """
+        with self._writer:
+            username = self.clients.pop(connection, None)
+            if username is None:
+                return None
+            self.clients[new_connection] = username
+            if self.connections.get(username) is connection:
+                self.connections[username] = new_connection
+            if self.presence_subscribers.pop(connection, False) is None:
+                self.presence_subscribers[new_connection] = None
+                self._subscribers = None
+            self._sessions = None
+        return username
+
+    def attach(self, username: str, connection):
+        """Associa o usuário a uma conexão sem sessão local (ex.: usuário de outro worker do cluster)."""
+        with self._writer:
+            self.connections[username] = connection
+            self._online = self._sorted_online = None
+
+    def detach(self, username: str, connection):
+        """Desfaz attach(), se o usuário ainda estiver associado à mesma conexão."""
+        with self._writer:
+            if self.connections.get(username) is connection:
+                del self.connections[username]
+                self._online = self._sorted_online = None
+
+    def username_of(self, connection) -> str | None:
+        return self.clients.get(connection)
+
+    def connection_of(self, username: str):
+        return self.connections.get(username)
+
+    def is_online(self, username: str) -> bool:
+        return username in self.connections
+
+    def sessions(self) -> tuple:
+        """Snapshot das sessões locais: ((conexão, username), ...)."""
+        snapshot = self._sessions
+        if snapshot is None:
+            with self._writer:
+                snapshot = self._sessions = tuple(self.clients.items())
+        return snapshot
+
+    def online_users(self) -> tuple:
+        snapshot = self._online
+        if snapshot is None:
+            with self._writer:
+                snapshot = self._online = tuple(self.connections)
+        return snapshot
+
+    def sorted_online_users(self) -> tuple:
+        """Snapshot em ordem alfabética, para listagens paginadas e filtradas por prefixo."""
+        snapshot = self._sorted_online
+        if snapshot is None:
+            with self._writer:
+                snapshot = self._sorted_online = tuple(sorted(self.connections))
+        return snapshot
+
+    def subscribe_presence(self, connection) -> bool:
+        """Retorna False se a conexão já era assinante."""
+        with self._writer:
+            if connection in self.presence_subscribers or connection not in self.clients:
+                return False
+            self.presence_subscribers[connection] = None
+            self._subscribers = None
+        return True
+
+    def unsubscribe_presence(self, connection) -> bool:
+        with self._writer:
+            if self.presence_subscribers.pop(connection, False) is not None:
+                return False
+            self._subscribers = None
+        return True
+
+    def presence_subscriptions(self) -> tuple:
+        snapshot = self._subscribers
+        if snapshot is None:
+            with self._writer:
+                snapshot = self._subscribers = tuple(self.presence_subscribers)
+        return snapshot
+
+    def create_group(self, group_name: str, owner: str) -> bool:
+        with self._writer:
+            if group_name in self.groups:
+                return False
+            self.groups[group_name] = {owner: None}
+            self._group_names = self._sorted_group_names = None
+        return True
+
+    def join_group(self, group_name: str, username: str) -> bool:
+        """Adiciona o usuário ao grupo. Retorna False se ele já for membro."""
+        with self._writer:
+            members = self.groups[group_name]
+            if username in members:
+                return False
+            members[username] = None
+            self._members.pop(group_name, None)
+            self._sorted_members.pop(group_name, None)
+        return True
+
+    def leave_group(self, group_name: str, username: str) -> bool:
+        """Remove o usuário do grupo. Retorna False se ele não for membro."""
+        with self._writer:
+            members = self.groups[group_name]
+            if username not in members:
+                return False
+            del members[username]
+            self._members.pop(group_name, None)
+            self._sorted_members.pop(group_name, None)
+        return True
+
+    def load_groups(self, groups: dict):
+        """Substitui os grupos conhecidos: {group_name: [username, ...]}."""
+        with self._writer:
+            self.groups.clear()
+            self.groups.update((group_name, dict.fromkeys(members)) for group_name, members in groups.items())
+            self._group_names = self._sorted_group_names = None
+            self._members.clear()
+            self._sorted_members.clear()
+
+    def export_groups(self) -> dict[str, tuple]:
+        """Cópia consistente de todos os grupos: {group_name: (username, ...)}."""
+        with self._writer:
+            return {group_name: tuple(members) for group_name, members in self.groups.items()}
+
+    def has_group(self, group_name: str) -> bool:
+        return group_name in self.groups
+
+    def is_member(self, group_name: str, username: str) -> bool:
+        return username in self.groups.get(group_name, ())
+
+    def group_names(self) -> tuple:
+        snapshot = self._group_names
+        if snapshot is None:
+            with self._writer:
+                snapshot = self._group_names = tuple(self.groups)
+        return snapshot
+
+    def sorted_group_names(self) -> tuple:
+        snapshot = self._sorted_group_names
+        if snapshot is None:
+            with self._writer:
+                snapshot = self._sorted_group_names = tuple(sorted(self.groups))
+        return snapshot
+
+    def sorted_members(self, group_name: str) -> tuple:
+        snapshot = self._sorted_members.get(group_name)
+        if snapshot is None:
+            with self._writer:
+                snapshot = self._sorted_members[group_name] = tuple(sorted(self.groups[group_name]))
+        return snapshot
+
+    def members(self, group_name: str) -> tuple:
+        """Snapshot dos membros do grupo, na ordem de entrada."""
+        snapshot = self._members.get(group_name)
+        if snapshot is None:
+            with self._writer:
+                snapshot = self._members[group_name] = tuple(self.groups[group_name])
+        return snapshot
@@ -0,0 +1,174 @@
+import secrets
+import threading
+import time
+from collections import deque
+from typing import Callable
+
+from connection import Connection
+
+DEFAULT_GRACE_PERIOD = 30.0
+DEFAULT_BUFFER_SIZE = 256
+
+
+class ResumeBuffer:
+    """
+    Últimas mensagens de chat enviadas a uma sessão. A sequência de cada mensagem é implícita:
+    a n-ésima mensagem de chat desde o login tem a sequência n, contada igualmente pelo cliente.
+    """
+    __slots__ = ('entries', 'seq', 'broken', 'lock')
+
+    def __init__(self, size: int):
+        self.entries = deque(maxlen=size)
+        self.seq = 0  # Sequência da última mensagem enviada
+        self.broken = False  # Uma mensagem numerada foi descartada: a sessão não pode ser retomada
+        # Reentrante: o envio das mensagens perdidas na retomada passa pelo mesmo lock
+        self.lock = threading.RLock()
+
+    def record(self, message: str | None, messages: list[str] | None):
+        if message is not None:
+            self.seq += 1
+            self.entries.append(message)
+        elif messages:
+            self.seq += len(messages)
+            self.entries.extend(messages)
+
+    def since(self, last_seq: int) -> list[str] | None:
+        """:return: As mensagens posteriores a last_seq, ou None se elas não estão mais todas no buffer."""
+        missing = self.seq - last_seq
+        if missing < 0 or missing > len(self.entries) or self.broken:
+            return None
+        return list(self.entries)[len(self.entries) - missing:]
+
+
+class SuspendedConnection(Connection):
+    """
+    Ocupa o lugar da conexão perdida no registry durante a janela de retomada: o usuário continua
+    online, e as mensagens enviadas a ele são numeradas no mesmo ResumeBuffer e guardadas em gap.
+    Depois da retomada, o que ainda chegar por esta conexão é repassado à nova.
+    """
+
+    def __init__(self, username: str, buffer: ResumeBuffer, deadline: float):
+        super().__init__(address=f'{username} (aguardando retomada)')
+        self.codec.framed = True  # A retomada só é oferecida no protocolo com framing
+        self.username = username
+        self.resume_buffer = buffer
+        self.deadline = deadline
+        self.gap = []  # Mensagens enviadas durante a janela, armazenadas offline se ela expirar
+        self.target = None  # Conexão que retomou a sessão
+
+    def send(self, data: bytes | memoryview, message: str = None, messages: list[str] = None) -> int:
+        with self.resume_buffer.lock:
+            if self.closed:
+                raise BrokenPipeError('Sessão encerrada')
+            if self.target is None:
+                if message is not None or messages:
+                    self.resume_buffer.record(message, messages)
+                    self.gap.extend(messages or (message,))
+                return len(data)
+        return self.target.send(data, message, messages)
+
+    def _wake_writer(self):
+        pass
+
+    def abort(self):
+        self.closed = True
+
+
+class SessionResumption:
+    """
+    Retomada de sessões após quedas transitórias de conexão.
+
+    No login, cada sessão no protocolo com framing recebe um token e passa a numerar as mensagens
+    de chat enviadas (ResumeBuffer, com as últimas buffer_size). Se a conexão cair sem -sair, a
+    sessão fica suspensa por grace_period segundos: o usuário segue online e as mensagens para ele
+    continuam sendo numeradas. Um cliente que reconecta com '-retomar usuário token sequência'
+    recebe apenas as mensagens posteriores à sequência informada, sem novo login e sem o replay
+    das mensagens offline. Se a janela expirar, as mensagens do intervalo vão para o armazenamento
+    offline e a sessão termina como uma desconexão normal.
+    """
+
+    def __init__(self, grace_period: float = DEFAULT_GRACE_PERIOD, buffer_size: int = DEFAULT_BUFFER_SIZE):
+        self.grace_period = grace_period
+        self.buffer_size = buffer_size
+        self.resumed = 0
+        self._tokens = {}  # {username: token}
+        self._suspended = {}  # {username: SuspendedConnection}
+
+    def open(self, connection: Connection, username: str) -> str:
+        """Inicia a numeração das mensagens da sessão e retorna o token de retomada."""
+        token = secrets.token_urlsafe(18)
+        connection.resume_buffer = ResumeBuffer(self.buffer_size)
+        self._tokens[username] = token
+        return token
+
+    def forget(self, username: str):
+        """Descarta o token de uma sessão encerrada."""
+        self._tokens.pop(username, None)
+
+    def suspended(self) -> int:
+        return len(self._suspended)
+
+    def suspend(self, registry, connection: Connection) -> bool:
+        """
+        Mantém a sessão da conexão perdida pela janela de retomada.
+        :return: False se a sessão não pode ser retomada e deve ser encerrada normalmente.
+        """
+        buffer = connection.resume_buffer
+        if buffer is None or buffer.broken or isinstance(connection, SuspendedConnection):
+            return False
+        username = registry.username_of(connection)
+        if username is None:
+            return False
+        placeholder = SuspendedConnection(username, buffer, time.monotonic() + self.grace_period)
+        with buffer.lock:
+            if registry.replace(connection, placeholder) is None:
+                return False
+            self._suspended[username] = placeholder
+        return True
+
+    def resume(self, registry, connection: Connection, username: str, token: str, last_seq: int,
+               on_resumed: Callable[[Connection, list[str]], None]) -> bool:
+        """
+        Transfere a sessão suspensa para a nova conexão. on_resumed é chamada com as mensagens
+        perdidas antes que qualquer outra mensagem possa ser enfileirada na nova conexão.
+        """
+        expected = self._tokens.get(username)
+        if expected is None or not secrets.compare_digest(expected, token):
+            return False
+        placeholder = self._suspended.get(username)
+        if placeholder is None:
+            # O servidor ainda não percebeu a queda da conexão anterior (ex.: o celular trocou de rede)
+            previous = registry.connection_of(username)
+            if previous is None or not self.suspend(registry, previous):
+                return False
+            previous.abort()
+            placeholder = self._suspended[username]
+        buffer = placeholder.resume_buffer
+        with buffer.lock:
+            missed = buffer.since(last_seq)
+            if missed is None or placeholder.closed:
+                return False
+            connection.resume_buffer = buffer
+            if registry.replace(placeholder, connection) is None:
+                connection.resume_buffer = None
+                return False
+            placeholder.target = connection
+            self._suspended.pop(username, None)
+            on_resumed(connection, missed)
+        self.resumed += 1
+        return True
+
+    def expired(self, force: bool = False) -> list[SuspendedConnection]:
+        """Sessões cuja janela terminou, ou que acumularam mais mensagens do que o buffer comporta."""
+        now = time.monotonic()
+        return [placeholder for placeholder in list(self._suspended.values())
+                if force or now >= placeholder.deadline or len(placeholder.gap) > self.buffer_size]
+
+    def end(self, placeholder: SuspendedConnection) -> list[str]:
+        """Encerra a sessão suspensa e retorna as mensagens enviadas durante a janela."""
+        with placeholder.resume_buffer.lock:
+            placeholder.closed = True
+            if self._suspended.get(placeholder.username) is placeholder:
+                del self._suspended[placeholder.username]
+            gap, placeholder.gap = placeholder.gap, []
+        return gap
@@ -0,0 +1,310 @@
+"""
+API programática do chat, para bots e integrações.
+
+    client = ChatClient('localhost', 50001)
+    await client.connect('bot')
+    await client.send_private('ana', 'olá')
+    async with client.batch() as batch:
+        for i in range(1000):
+            batch.send_group('equipe', f'mensagem {i}')
+    async for message in client.messages():
+        print(message.sender, message.text)
+
+Bots no mesmo host do servidor podem usar o socket Unix dele, se configurado (unix_paths):
+ChatClient('unix:/caminho/do/socket').
+
+Para acompanhar quem está online sem repetir -listarusuarios: assine a presença (on_presence recebe
+cada entrada e saída) e só então leia a lista, página a página, com iter_users().
+
+Se a conexão cair, resume() reconecta sem novo login e recebe só as mensagens perdidas.
+
+Após o login o cliente ativa as confirmações do servidor (-confirmar): todo comando recebe
+exatamente uma resposta, na ordem de envio, e cada chamada retorna o Response correspondente.
+"""
+import asyncio
+from collections import deque
+from typing import Callable, NamedTuple
+
+from client import Client
+from protocol import MORE_RESULTS, PRESENCE_HEADER
+
+# Comandos que o servidor sempre responde, mesmo sem as confirmações ativadas
+_ALWAYS_ANSWERED = frozenset(('-criargrupo', '-entrargrupo', '-sairgrupo', '-listarusuarios', '-listargrupos',
+                              '-listarusrgrupo', '-stats', '-confirmar', '-assinarpresenca',
+                              '-cancelarpresenca', '-historico'))
+DEFAULT_PAGE_SIZE = 500
+
+
+class ChatError(Exception):
+    """O servidor recusou o login ou a conexão foi encerrada com comandos aguardando resposta."""
+
+
+class Response(NamedTuple):
+    """Resposta do servidor a um comando."""
+    ok: bool
+    message: str
+
+    @property
+    def lines(self) -> list[str]:
+        """Itens de uma listagem (usuários, grupos), sem a linha de título."""
+        return self.message.splitlines()[1:]
+
+    @property
+    def more(self) -> bool:
+        """Em uma listagem paginada, indica que há outra página após o último item."""
+        return MORE_RESULTS in self.message.partition('\n')[0]
+
+
+class ChatMessage(NamedTuple):
+    """Mensagem de chat recebida."""
+    sender: str | None
+    group: str | None  # Preenchido em mensagens de grupo
+    timestamp: str | None
+    text: str
+    raw: str  # Texto como enviado pelo servidor
+
+    @classmethod
+    def parse(cls, raw: str) -> 'ChatMessage':
+        """Interpreta '(remetente, [grupo, ]data): texto'; outros formatos ficam apenas em text."""
+        if raw.startswith('(') and '): ' in raw:
+            header, text = raw[1:].split('): ', 1)
+            parts = header.split(', ')
+            if len(parts) == 2:
+                return cls(parts[0], None, parts[1], text, raw)
+            if len(parts) == 3:
+                return cls(parts[0], parts[1], parts[2], text, raw)
+        return cls(None, None, None, raw, raw)
+
+
+def _private(username: str, text: str) -> str:
+    return f'-msg U {username} {text}'
+
+
+def _group(group_name: str, text: str) -> str:
+    return f'-msg G {group_name} {text}'
+
+
+def _broadcast(text: str, tag: str) -> str:
+    return f'-msgt {tag} {text}'
+
+
+def _listing(command: str, prefix: str = None, after: str = None, limit: int = None) -> str:
+    options = {'prefixo': prefix, 'apos': after, 'limite': limit}
+    return ' '.join([command, *(f'{key}={value}' for key, value in options.items() if value is not None)])
+
+
+class ChatClient:
+    """
+    Cliente sem terminal com resultados tipados. As mensagens recebidas vão para on_message,
+    se informado, ou para uma fila consumida por messages().
+    """
+
+    def __init__(self, host: str, port: int = None, on_message: Callable[[ChatMessage], None] = None,
+                 on_response: Callable[[Response], None] = None, on_presence: Callable[[str, bool], None] = None):
+        self.on_message = on_message
+        # Chamado com (usuário, online) após subscribe_presence()
+        self.on_presence = on_presence
+        # Chamado com as respostas que não correspondem a nenhum comando aguardando
+        self.on_response = on_response
+        self.acknowledged = False
+        self._client = Client(host, port, on_message=self._receive)
+        self._pending = deque()  # Futures dos comandos aguardando resposta, na ordem de envio
+        self._inbox = asyncio.Queue() if on_message is None else None
+        self._watcher = None
+
+    async def connect(self, username: str) -> Response:
+        """:raises ChatError: Se o servidor recusar o usuário."""
+        if not await self._client.connect(username):
+            header, message = self._client.login_response
+            raise ChatError(message or 'Conexão encerrada pelo servidor')
+        self._watcher = asyncio.create_task(self._watch_connection())
+        # Servidores antigos não conhecem -confirmar: o envio de mensagens segue sem confirmação
+        self.acknowledged = (await self.request('-confirmar')).ok
+        return Response(True, self._client.login_response[1])
+
+    async def resume(self) -> bool:
+        """
+        Retoma a sessão após uma queda da conexão, se o servidor oferece a retomada: as mensagens
+        perdidas chegam em seguida, sem repetições. Os comandos sem resposta na queda falharam com
+        ChatError e devem ser reenviados; messages() termina na queda e pode ser iterado de novo.
+        :return: False se a sessão expirou ou não pode ser retomada; use connect() nesse caso.
+        """
+        if not await self._client.resume():
+            return False
+        if self._watcher is not None:
+            await self._watcher
+        self._watcher = asyncio.create_task(self._watch_connection())
+        # As confirmações valem por conexão
+        if self.acknowledged:
+            self.acknowledged = (await self.request('-confirmar')).ok
+        return True
+
+    async def close(self):
+        await self._client.close()
+
+    # Comandos
+
+    async def request(self, command: str) -> Response | None:
+        """Envia um comando e aguarda a resposta; None se o servidor não responde a esse comando."""
+        future = self._expect(command)
+        await self._client.send(command)
+        return await future if future is not None else None
+
+    async def send_private(self, username: str, text: str) -> Response | None:
+        return await self.request(_private(username, text))
+
+    async def send_group(self, group_name: str, text: str) -> Response | None:
+        return await self.request(_group(group_name, text))
+
+    async def broadcast(self, text: str, tag: str = 'C') -> Response | None:
+        """:param tag: C (conectados), D (desconectados) ou T (todos)."""
+        return await self.request(_broadcast(text, tag))
+
+    async def create_group(self, group_name: str) -> Response:
+        return await self.request(f'-criargrupo {group_name}')
+
+    async def join_group(self, group_name: str) -> Response:
+        return await self.request(f'-entrargrupo {group_name}')
+
+    async def leave_group(self, group_name: str) -> Response:
+        return await self.request(f'-sairgrupo {group_name}')
+
+    async def list_users(self, prefix: str = None, after: str = None, limit: int = None) -> list[str]:
+        """Sem argumentos, a lista completa; com eles, uma página (veja iter_users)."""
+        return (await self.request(_listing('-listarusuarios', prefix, after, limit))).lines
+
+    async def list_groups(self, prefix: str = None, after: str = None, limit: int = None) -> list[str]:
+        response = await self.request(_listing('-listargrupos', prefix, after, limit))
+        return response.lines if response.ok else []
+
+    async def list_group_members(self, group_name: str, prefix: str = None, after: str = None,
+                                 limit: int = None) -> list[str]:
+        response = await self.request(_listing(f'-listarusrgrupo {group_name}', prefix, after, limit))
+        return response.lines if response.ok else []
+
+    def iter_users(self, prefix: str = None, page_size: int = DEFAULT_PAGE_SIZE):
+        """Itera sobre os usuários online em ordem alfabética, uma página por requisição."""
+        return self._paginate('-listarusuarios', prefix, page_size)
+
+    def iter_groups(self, prefix: str = None, page_size: int = DEFAULT_PAGE_SIZE):
+        return self._paginate('-listargrupos', prefix, page_size)
+
+    def iter_group_members(self, group_name: str, prefix: str = None, page_size: int = DEFAULT_PAGE_SIZE):
+        return self._paginate(f'-listarusrgrupo {group_name}', prefix, page_size)
+
+    async def _paginate(self, command: str, prefix: str, page_size: int):
+        after = None
+        while True:
+            response = await self.request(_listing(command, prefix, after, page_size))
+            if not response.ok:
+                return
+            lines = response.lines
+            for line in lines:
+                yield line
+            if not response.more or not lines:
+                return
+            after = lines[-1]
+
+    async def history(self, group_name: str, since: int = None, limit: int = None) -> Response:
+        """
+        Pede as últimas mensagens do grupo (ou as posteriores à sequência since). As mensagens chegam
+        como as demais, por on_message ou messages(), antes da resposta, que informa a última sequência.
+        """
+        options = {'desde': since, 'limite': limit}
+        return await self.request(' '.join([f'-historico {group_name}', *(f'{key}={value}' for key, value
+                                                                          in options.items() if value is not None)]))
+
+    async def subscribe_presence(self) -> Response:
+        return await self.request('-assinarpresenca')
+
+    async def unsubscribe_presence(self) -> Response:
+        return await self.request('-cancelarpresenca')
+
+    def batch(self) -> 'Batch':
+        return Batch(self)
+
+    async def send_batch(self, commands: list[str]) -> list[Response | None]:
+        """Envia os comandos em uma única escrita e aguarda as respostas."""
+        futures = [self._expect(command) for command in commands]
+        await self._client.send_many(commands)
+        return [await future if future is not None else None for future in futures]
+
+    # Recebimento
+
+    async def messages(self):
+        """Itera sobre as mensagens recebidas até a conexão ser encerrada."""
+        if self._inbox is None:
+            raise ChatError('As mensagens estão sendo entregues ao callback on_message')
+        while (message := await self._inbox.get()) is not None:
+            yield message
+
+    def _expect(self, command: str) -> asyncio.Future | None:
+        if not self.acknowledged and command.partition(' ')[0] not in _ALWAYS_ANSWERED:
+            return None
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(future)
+        return future
+
+    def _receive(self, header: str | None, text: str):
+        if header is None:
+            message = ChatMessage.parse(text)
+            if self.on_message is not None:
+                self.on_message(message)
+            else:
+                self._inbox.put_nowait(message)
+            return
+        if header == PRESENCE_HEADER:
+            if self.on_presence is not None:
+                self.on_presence(text[1:], text.startswith('+'))
+            return
+        response = Response(header == 'OK', text)
+        if self._pending:
+            future = self._pending.popleft()
+            if not future.done():
+                future.set_result(response)
+        elif self.on_response is not None:
+            self.on_response(response)
+
+    async def _watch_connection(self):
+        """Quando a conexão é encerrada, libera quem aguarda respostas ou mensagens."""
+        await self._client.wait_closed()
+        while self._pending:
+            future = self._pending.popleft()
+            if not future.done():
+                future.set_exception(ChatError('Conexão encerrada antes da resposta'))
+        if self._inbox is not None:
+            self._inbox.put_nowait(None)
+
+
+class Batch:
+    """Acumula comandos para enviá-los em uma única escrita; as respostas ficam em results."""
+
+    def __init__(self, client: ChatClient):
+        self.client = client
+        self.commands = []
+        self.results = []
+
+    def send_private(self, username: str, text: str):
+        self.commands.append(_private(username, text))
+
+    def send_group(self, group_name: str, text: str):
+        self.commands.append(_group(group_name, text))
+
+    def broadcast(self, text: str, tag: str = 'C'):
+        self.commands.append(_broadcast(text, tag))
+
+    def command(self, command: str):
+        self.commands.append(command)
+
+    async def flush(self) -> list[Response | None]:
+        commands, self.commands = self.commands, []
+        if commands:
+            self.results += await self.client.send_batch(commands)
+        return self.results
+
+    async def __aenter__(self) -> 'Batch':
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            await self.flush()
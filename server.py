@@ -1,244 +1,759 @@
+import os
 import socket
-from datetime import datetime
-from threading import Thread
-
-from colorama import Fore, Style
-from utils import extract_command_parts
+import stat
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from threading import Event, Thread
+from typing import Sequence
+
+from admission import AdmissionControl
+from broadcast_log import BroadcastLog
+from commands import CommandDispatcher, ParsedCommand
+from connection import DEFAULT_QUEUE_SIZE, Connection, OverflowPolicy, SocketConnection
+from envelope import Envelope
+from compression import Compression
+from fanout import FanoutPool
+from group_history import GroupHistory
+from lifecycle import DEFAULT_LOGIN_TIMEOUT, ConnectionLifecycle
+from log import dropped_records, ensure_configured, logger, message_logger
+from metrics import Metrics, MetricsHTTPServer
+from offline_store import MemoryOfflineStore, OfflineStore, SegmentLogOfflineStore
+from protocol import MORE_RESULTS, MSG_PRESENCE, MSG_SESSION, RECV_BUFFER_SIZE, RESUME_COMMAND, encode_frame
+from registry import SessionRegistry
+from resumption import SessionResumption, SuspendedConnection
+from state_store import StateStore
+from utils import current_timestamp
+
+# Blocos de mensagens offline aguardando na fila de saída durante a entrega após o login
+REPLAY_MAX_INFLIGHT = 4
+# Listagens paginadas: opções aceitas e tamanho das páginas
+LISTING_OPTIONS = ('prefixo', 'apos', 'limite')
+LISTING_USAGE = '[prefixo=P] [apos=NOME] [limite=N]'
+HISTORY_OPTIONS = ('desde', 'limite')
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def remove_stale_socket(path: str):
+    """Remove o socket Unix deixado por uma execução anterior; qualquer outro arquivo no caminho é mantido."""
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f'{path} já existe e não é um socket Unix')
+    os.unlink(path)
 
 
 class Server:
-    def __init__(self, host, port):
+    def __init__(self, host, port, queue_size: int = DEFAULT_QUEUE_SIZE,
+                 overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST, offline_store: OfflineStore = None,
+                 idle_timeout: float = None, heartbeat_interval: float = None,
+                 login_timeout: float = DEFAULT_LOGIN_TIMEOUT, metrics: bool = False, metrics_port: int = None,
+                 state_store: StateStore = None, admission: AdmissionControl = None,
+                 group_history: GroupHistory = None, fanout: FanoutPool = None, unix_paths: Sequence[str] = (),
+                 resumption: SessionResumption = None, compression: Compression = None,
+                 broadcast_log: BroadcastLog = None):
         self.host = host
         self.port = port
-        self.clients = {}  # Armazena os clientes conectados: {socket: username, ...}
-        # Armazena os grupos: {group_name: [{socket1: username}, {socket2: username, ...]}
-        self.groups = {}
-        self.offline_messages = {}  # Armazena mensagens para usuários desconectados: {username: [mensagem1,
-        # mensagem2, ...]}
+        # Limite e política da fila de saída de cada conexão
+        self.queue_size = queue_size
+        self.overflow_policy = OverflowPolicy(overflow_policy)
+        # Índices de sessões e grupos; alterações em self.clients e self.groups devem passar pelo registry,
+        # e iterações devem usar seus snapshots (sessions(), members(), ...)
+        self.registry = SessionRegistry()
+        self.clients = self.registry.clients  # Clientes conectados: {conexão: username, ...}
+        self.groups = self.registry.groups  # Grupos: {group_name: {username: None, ...}}
+        # Armazena mensagens para usuários desconectados; por padrão em memória
+        self.offline_messages = offline_store if offline_store is not None else MemoryOfflineStore()
+        # Mensagens globais para desconectados, gravadas uma única vez e lidas por cursor de cada usuário;
+        # por padrão em memória
+        self.broadcast_log = broadcast_log if broadcast_log is not None else BroadcastLog()
         self.all_users = set()  # Armazena todos os usuários que já se conectaram
+        # Últimas mensagens de cada grupo, lidas com -historico; por padrão apenas em memória
+        self.group_history = group_history if group_history is not None else GroupHistory()
+        # Entrega paralela, em shards, para grupos grandes e mensagens globais
+        self.fanout = fanout if fanout is not None else FanoutPool()
+        # Persistência opcional de all_users e dos grupos, restaurados aqui em um reinício
+        self.state_store = state_store
+        if state_store is not None:
+            users, groups = state_store.load()
+            self.all_users.update(users)
+            self.registry.load_groups(groups)
+            # Ninguém está conectado ainda: todos os usuários restaurados leem as mensagens globais pelo log
+            self.broadcast_log.park_all(users)
+            state_store.start(self._export_state)
+        # Detecta e encerra conexões inativas (timeouts de login e de inatividade, heartbeats)
+        self.lifecycle = ConnectionLifecycle(idle_timeout, heartbeat_interval, login_timeout)
+        # Sessões suspensas após uma queda, retomadas com o token sem novo login; None desativa a retomada
+        self.resumption = resumption
+        # Compressão dos lotes grandes para clientes que a oferecem; None envia tudo sem compressão
+        self.compression = compression
+        self._stopping = Event()
+        # Instrumentação opcional; None quando desativada, para não custar nada no caminho das mensagens
+        self.metrics = Metrics() if metrics or metrics_port is not None else None
+        self.metrics_port = metrics_port
+        self._metrics_server = None
+        self.dropped_messages = 0  # Descartes por fila cheia nas conexões já encerradas
+        # Limites por usuário e recusa de comandos caros em sobrecarga; None aceita todos os comandos
+        self.admission = admission
+        if admission is not None:
+            admission.queue_depth = lambda: sum(self.queue_depths().values())
+        # Comandos aceitos, indexados pelo verbo; novos comandos podem ser registrados em self.commands
+        self.commands = CommandDispatcher(on_error=Server._send_error_response, metrics=self.metrics)
+        self._register_commands()
+        if self.metrics is not None:
+            self.fanout.metrics = self.metrics
+            if compression is not None:
+                compression.metrics = self.metrics
+            self._register_metrics()
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_socket.setsockopt(
             socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # Reutiliza a porta
+        # Endpoints adicionais em sockets Unix, para bots e gateways no mesmo host, com os mesmos handlers
+        self.unix_paths = list(unix_paths)
+        if self.unix_paths and not hasattr(socket, 'AF_UNIX'):
+            raise OSError('Sockets Unix não são suportados nesta plataforma')
+        self.unix_sockets = [socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) for _ in self.unix_paths]
 
     def run(self):
+        ensure_configured()
         self._start_server()
+        if self.lifecycle.enabled or self.resumption is not None:
+            Thread(target=self._reap_idle_connections, daemon=True).start()
         self._accept_connections()
 
+    def _reap_idle_connections(self):
+        while not self._stopping.wait(self._sweep_interval()):
+            self._sweep_connections()
+
+    def _sweep_interval(self) -> float:
+        interval = self.lifecycle.check_interval
+        if self.resumption is not None:
+            # As janelas de retomada expiram com a mesma precisão relativa dos demais prazos
+            interval = min(interval, max(self.resumption.grace_period / 4, 0.05))
+        return interval
+
+    def _sweep_connections(self):
+        for client_socket in self.lifecycle.sweep(self.registry.username_of):
+            username = self.registry.username_of(client_socket) or client_socket.address
+            client_socket.abort()
+            logger.warning("Conexão inativa com %s encerrada.", username, extra={'user': username})
+        if self.resumption is not None:
+            for placeholder in self.resumption.expired():
+                self._end_suspended_session(placeholder)
+
     def _start_server(self):
         try:
             self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen()
-            print(
-                Fore.GREEN + f"Servidor iniciado em {self.host}:{self.port}" + Style.RESET_ALL)
+            self.server_socket.listen(socket.SOMAXCONN)
+            logger.info("Servidor iniciado em %s:%s", self.host, self.port)
+            for path, unix_socket in zip(self.unix_paths, self.unix_sockets):
+                remove_stale_socket(path)
+                unix_socket.bind(path)
+                unix_socket.listen(socket.SOMAXCONN)
+                logger.info("Servidor iniciado em unix:%s", path)
+            if self.metrics_port is not None:
+                self._metrics_server = MetricsHTTPServer(self.metrics, self.host, self.metrics_port)
+                self._metrics_server.start()
+                logger.info("Métricas disponíveis em http://%s:%s/metrics", self.host, self.metrics_port)
         except OSError as e:
-            print(
-                Fore.RED + f"\nErro ao iniciar o servidor: {e}" + Style.RESET_ALL)
+            logger.error("Erro ao iniciar o servidor: %s", e)
             return
 
     def _accept_connections(self):
+        for path, unix_socket in zip(self.unix_paths, self.unix_sockets):
+            Thread(target=self._accept_unix_connections, args=(path, unix_socket), daemon=True).start()
         try:
             while True:
-                client_socket, address = self.server_socket.accept()
-                print(Fore.CYAN +
-                      f"Nova conexão de {address}" + Style.RESET_ALL)
-                Thread(target=self.
-                       _handle_new_client, args=(client_socket, address)).start()
+                self._accept_connection(self.server_socket)
         except KeyboardInterrupt:
-            print(
-                Fore.YELLOW + "\nServidor interrompido manualmente. Fechando conexões..." + Style.RESET_ALL)
+            logger.warning("Servidor interrompido manualmente. Fechando conexões...")
         finally:
             self._shutdown()
 
-    def _handle_new_client(self, client_socket: socket.socket, address: tuple):
+    def _accept_unix_connections(self, path: str, unix_socket: socket.socket):
         try:
-            username = self._receive_username(client_socket)
+            while True:
+                self._accept_connection(unix_socket)
+        except OSError as e:
+            # Esperado quando o socket é fechado pelo _shutdown()
+            if not self._stopping.is_set():
+                logger.error("Erro ao aceitar conexões em unix:%s: %s", path, e)
+
+    def _accept_connection(self, listener: socket.socket):
+        client_socket, address = listener.accept()
+        # Clientes de sockets Unix não têm endereço próprio: são identificados pelo caminho do socket
+        address = address or f'unix:{listener.getsockname()}'
+        logger.info("Nova conexão de %s", address, extra={'address': address})
+        connection = SocketConnection(client_socket, address, **self._connection_options())
+        self.lifecycle.track(connection)
+        Thread(target=self._handle_new_client, args=(connection, address)).start()
+
+    def _connection_options(self) -> dict:
+        return {'queue_size': self.queue_size, 'overflow_policy': self.overflow_policy,
+                'on_spill': self._spill_to_offline, 'compression': self.compression}
+
+    def _spill_to_offline(self, client_socket: Connection, message: str):
+        """Guarda como mensagem offline o que não coube na fila de saída de um cliente lento."""
+        username = self.registry.username_of(client_socket)
+        if username is None:
+            return
+        self.offline_messages.append(username, message)
+
+    def queue_depths(self) -> dict[str, int]:
+        """Quantidade de dados aguardando envio na fila de cada cliente: {username: profundidade}"""
+        return {username: client_socket.queue_depth for client_socket, username in self.registry.sessions()}
+
+    def _handle_new_client(self, client_socket: SocketConnection, address: tuple | str):
+        try:
+            username, pending = self._receive_username(client_socket)
             if not username:
                 return
-            Server._send_success_response(
-                client_socket, 'Conexão estabelecida com sucesso!')
-            self.clients[client_socket] = username
-            self.all_users.add(username)
-            print(
-                Fore.BLUE + f"{username} ({address}) conectou-se ao servidor." + Style.RESET_ALL)
-            # Envia mensagens armazenadas para o usuário, se houver
-            if username in self.offline_messages:
-                for msg in self.offline_messages[username]:
-                    Server.send_message_safe(client_socket, msg+'\n')
-                del self.offline_messages[username]  # Remove as mensagens após enviar
-
-            # Começa a tratar mensagens desse cliente
-            self._handle_client_messages(client_socket)
+            # Uma sessão retomada já está registrada e recebeu as mensagens perdidas
+            if self.registry.username_of(client_socket) is None:
+                if not self._register_client(client_socket, username, address):
+                    return
+                # Envia mensagens armazenadas para o usuário, se houver
+                self._replay_offline_messages(client_socket, username)
+            # Começa a tratar mensagens desse cliente, incluindo as enviadas junto com o nome de usuário
+            self._handle_client_messages(client_socket, pending)
         except Exception as e:
-            print(
-                Fore.RED + f"Erro ao lidar com o cliente {address}: {e}" + Style.RESET_ALL)
+            logger.error("Erro ao lidar com o cliente %s: %s", address, e, extra={'address': address})
+            # Falha antes do loop de mensagens (ex.: broker sem resposta no login): a conexão não pode ficar aberta
+            if self.registry.username_of(client_socket) is not None or not client_socket.closed:
+                self._remove_client(client_socket)
+        finally:
+            self.lifecycle.untrack(client_socket)
+
+    def _register_client(self, client_socket: Connection, username: str, address: tuple | str) -> bool:
+        """
+        Confirma a conexão e registra o usuário.
+        Compartilhado entre o servidor com threads e o AsyncServer.
+        :return: False se o nome de usuário foi registrado por outra conexão nesse meio tempo.
+        """
+        if not self.registry.connect(client_socket, username):
+            Server._send_error_response(client_socket, 'Usuário já conectado')
+            client_socket.close()
+            return False
+        Server._send_success_response(
+            client_socket, 'Conexão estabelecida com sucesso!')
+        if self.resumption is not None and client_socket.codec.framed:
+            client_socket.send(encode_frame(MSG_SESSION, self.resumption.open(client_socket, username)))
+        if self.state_store is not None and username not in self.all_users:
+            self.state_store.add_user(username)
+        self.all_users.add(username)
+        self._publish_presence(username, online=True)
+        logger.info("%s (%s) conectou-se ao servidor.", username, address, extra={'user': username})
+        return True
+
+    def _replay_offline_messages(self, client_socket: SocketConnection, username: str):
+        """
+        Envia as mensagens armazenadas em blocos, lendo o próximo bloco apenas quando o writer
+        esvaziou a fila, para que um backlog grande não seja carregado inteiro na memória.
+        """
+        chunks = self._pending_chunks(username)
+        try:
+            for chunk in chunks:
+                Server.send_messages_safe(client_socket, chunk)
+                client_socket.wait_for_capacity(REPLAY_MAX_INFLIGHT)
+                if client_socket.closed:
+                    break
+        finally:
+            chunks.close()
 
-    def _receive_username(self, client_socket: socket.socket) -> str:
-        username = client_socket.recv(1024).decode('utf-8').capitalize()
-        if not username:
+    def _pending_chunks(self, username: str):
+        """
+        Mensagens armazenadas para o usuário, seguidas das mensagens globais enviadas após sua saída.
+        As duas fontes não são intercaladas: todas as mensagens privadas e de grupo vêm antes das
+        globais (-msgt D/T), cada parte na ordem em que foi enviada.
+        """
+        yield from self.offline_messages.pop_chunks(username)
+        yield from self.broadcast_log.pop_chunks(username)
+
+    def _receive_username(self, client_socket: SocketConnection) -> tuple[str, list[str]]:
+        messages = []
+        while not messages:
+            data = client_socket.recv(RECV_BUFFER_SIZE)
+            if not data:
+                break
+            messages = client_socket.feed(data)
+        return self._validate_username(client_socket, messages)
+
+    def _validate_username(self, client_socket: Connection, messages: list[str]) -> tuple[str, list[str]]:
+        """
+        Valida o nome de usuário, primeira mensagem enviada pelo cliente.
+        :return: O nome de usuário (vazio se inválido) e os comandos recebidos logo em seguida.
+        """
+        if messages and self.resumption is not None and messages[0].startswith(RESUME_COMMAND + ' '):
+            return self._resume_session(client_socket, messages[0]), messages[1:]
+        username = messages[0].capitalize() if messages else ''
+        if not username or '\0' in username:
             client_socket.close()
-            return ''
-        if username in self.clients.values():
+            return '', []
+        previous = self.registry.connection_of(username)
+        if isinstance(previous, SuspendedConnection):
+            # Novo login em vez da retomada (ex.: o cliente perdeu o token): a sessão suspensa termina
+            self._end_suspended_session(previous)
+        elif previous is not None:
             Server._send_error_response(client_socket, 'Usuário já conectado')
             client_socket.close()
+            return '', []
+        return username, messages[1:]
+
+    def _resume_session(self, client_socket: Connection, request: str) -> str:
+        """
+        Retoma a sessão suspensa indicada em '-retomar usuário token sequência'.
+        :return: O nome do usuário, ou vazio se a sessão não pode ser retomada (o cliente faz um novo login).
+        """
+        parts = request.split(' ')
+        username = parts[1].capitalize() if len(parts) == 4 else ''
+        if (not username or not parts[3].isdigit() or not client_socket.codec.framed
+                or not self.resumption.resume(self.registry, client_socket, username, parts[2], int(parts[3]),
+                                              Server._send_missed_messages)):
+            Server._send_error_response(client_socket, 'Sessão expirada ou inválida. Faça login novamente.')
+            client_socket.close()
             return ''
+        logger.info("%s (%s) retomou a sessão.", username, client_socket.address, extra={'user': username})
         return username
 
-    def _handle_client_messages(self, client_socket: socket.socket):
+    @staticmethod
+    def _send_missed_messages(client_socket: Connection, messages: list[str]):
+        Server._send_success_response(client_socket, 'Sessão retomada.')
+        if messages:
+            # Já numeradas na sessão: enviadas sem passar de novo pelo ResumeBuffer
+            client_socket.send(client_socket.codec.encode_messages(messages))
+
+    def _handle_client_messages(self, client_socket: SocketConnection, pending: list[str] = ()):
         username = self.clients.get(client_socket, "Desconhecido")
         try:
-            while True:
-                message = client_socket.recv(1024).decode("utf-8").strip()
-                if not message:
-                    continue
-                match message:
-                    case '-sair':
-                        print(Fore.YELLOW + f"{username} solicitou desconexão." + Style.RESET_ALL)
-                        break
-                    case '-listarusuarios':
-                        self._send_user_list(client_socket)
-                        continue
-                if message.startswith('-msg'):
-                    self._handle_command_message(message, username, client_socket)
-                    continue
-                if 'grupo' in message:
-                    self._handle_command_group(message=message, username=username, client_socket=client_socket)
-                    continue
-                self._send_error_response(client_socket, "Comando desconhecido ou formato inválido.")
-                continue
+            messages = pending
+            while self._process_messages(client_socket, username, messages):
+                data = client_socket.recv(RECV_BUFFER_SIZE)
+                if not data:
+                    # EOF: o cliente fechou a conexão
+                    break
+                messages = client_socket.feed(data)
         except (ConnectionResetError, ConnectionAbortedError, BrokenPipeError):
-            print(Fore.RED + f"Conexão perdida com {username}." + Style.RESET_ALL)
-        except Exception as e:
-            print(Fore.RED + f"Erro inesperado com {username}: {e}" + Style.RESET_ALL)
+            logger.warning("Conexão perdida com %s.", username, extra={'user': username})
+        except Exception:
+            logger.exception("Erro inesperado com %s", username, extra={'user': username})
             self._send_error_response(client_socket, "Erro interno no servidor.")
         finally:
             self._remove_client(client_socket)
 
-    def _handle_command_group(self, message: str, username, client_socket):
+    def _process_messages(self, client_socket: Connection, username: str, messages: list[str]) -> bool:
+        """
+        Executa em ordem os comandos extraídos de uma leitura.
+        :return: False quando o cliente solicitou a desconexão, True caso contrário.
+        """
+        for message in messages:
+            if client_socket.queue_depth > self.queue_size // 2:
+                # O cliente envia comandos mais rápido do que lê as respostas: para de atendê-lo até a
+                # fila esvaziar, em vez de descartar respostas (que um cliente com -confirmar aguarda)
+                client_socket.wait_for_capacity(self.queue_size // 4)
+            if message and not self._process_message(client_socket, username, message):
+                return False
+        return True
+
+    def _register_commands(self):
+        self.commands.register('-sair', self._handle_exit)
+        self.commands.register('-listarusuarios', self._send_user_list, optional=len(LISTING_OPTIONS),
+                               usage=f'-listarusuarios {LISTING_USAGE}')
+        self.commands.register('-msg', self._handle_command_message, arity=3,
+                               usage='-msg tag <usuário|grupo> <mensagem>')
+        self.commands.register('-msgt', self._handle_command_broadcast, arity=2, usage='-msgt tag <mensagem>')
+        self.commands.register('-criargrupo', self._handle_create_group, arity=1,
+                               usage='-criargrupo NOME_DO_GRUPO')
+        self.commands.register('-entrargrupo', self._handle_enter_group, arity=1,
+                               usage='-entrargrupo NOME_DO_GRUPO')
+        self.commands.register('-listargrupos', self._send_group_list, optional=len(LISTING_OPTIONS),
+                               usage=f'-listargrupos {LISTING_USAGE}')
+        self.commands.register('-listarusrgrupo', self._handler_list_users_group, arity=1,
+                               usage=f'-listarusrgrupo NOME_DO_GRUPO {LISTING_USAGE}')
+        self.commands.register('-historico', self._handle_history, arity=1,
+                               usage='-historico NOME_DO_GRUPO [desde=SEQUÊNCIA] [limite=N]')
+        self.commands.register('-assinarpresenca', self._handle_subscribe_presence)
+        self.commands.register('-cancelarpresenca', self._handle_unsubscribe_presence)
+        self.commands.register('-sairgrupo', self._handle_exit_group, arity=1, usage='-sairgrupo NOME_DO_GRUPO')
+        self.commands.register('-confirmar', Server._handle_enable_acknowledge)
+        if self.metrics is not None:
+            self.commands.register('-stats', lambda client_socket, username, command: self._send_stats(client_socket))
+
+    def _register_metrics(self):
+        """Gauges e contadores avaliados apenas quando as métricas são lidas."""
+        metrics = self.metrics
+        metrics.describe('fanout_size', 'Destinatários conectados de cada mensagem de grupo ou global')
+        metrics.describe('fanout_duration_seconds', 'Tempo de entrega a todos os destinatários de cada mensagem')
+        metrics.gauge('connected_clients', lambda: len(self.clients), 'Clientes conectados')
+        metrics.gauge('known_users', lambda: len(self.all_users), 'Usuários que já se conectaram')
+        metrics.gauge('groups', lambda: len(self.groups), 'Grupos criados')
+        metrics.gauge('group_members_max', lambda: max(map(len, list(self.groups.values())), default=0),
+                      'Membros do maior grupo')
+        metrics.gauge('group_members_total', lambda: sum(map(len, list(self.groups.values()))),
+                      'Soma dos membros de todos os grupos')
+        metrics.gauge('offline_backlog_bytes', self.offline_messages.backlog_bytes,
+                      'Bytes armazenados para usuários desconectados')
+        metrics.gauge('broadcast_log_messages', lambda: self.broadcast_log.retained(),
+                      'Mensagens globais retidas para usuários desconectados')
+        metrics.gauge('outbound_queue_depth_sum', lambda: sum(self.queue_depths().values()),
+                      'Dados aguardando envio nas filas de saída')
+        metrics.gauge('outbound_queue_depth_max', lambda: max(self.queue_depths().values(), default=0),
+                      'Maior fila de saída')
+        metrics.counter('outbound_dropped_total', lambda: self.dropped_messages + sum(
+            client_socket.dropped for client_socket, _ in self.registry.sessions()),
+                        'Mensagens descartadas por filas cheias')
+        metrics.gauge('fanout_pending_shards', lambda: self.fanout.pending, 'Shards de fan-out aguardando entrega')
+        if self.resumption is not None:
+            metrics.gauge('suspended_sessions', self.resumption.suspended, 'Sessões aguardando retomada')
+            metrics.counter('resumed_sessions_total', lambda: self.resumption.resumed, 'Sessões retomadas')
+        if self.compression is not None:
+            compression = self.compression
+            metrics.describe('compression_batch_bytes', 'Tamanho original de cada lote comprimido')
+            metrics.describe('compression_duration_seconds', 'Tempo de CPU para comprimir cada lote')
+            metrics.counter('compression_raw_bytes_total', lambda: compression.raw_bytes,
+                            'Bytes dos lotes antes da compressão')
+            metrics.counter('compression_sent_bytes_total', lambda: compression.compressed_bytes,
+                            'Bytes enviados nos lotes comprimidos')
+            metrics.gauge('compression_ratio', lambda: round(compression.ratio, 2),
+                          'Bytes originais por byte enviado, nos lotes comprimidos')
+            metrics.counter('compression_cpu_seconds_total', lambda: compression.cpu_ns / 1e9,
+                            'Tempo de CPU gasto na compressão')
+        metrics.gauge('threads', threading.active_count, 'Threads em execução')
+        metrics.counter('log_dropped_total', dropped_records, 'Registros de log descartados com a fila cheia')
+        if self.admission is not None:
+            metrics.counter('admission_rejected_total', lambda: self.admission.rejected,
+                            'Comandos recusados pelo limite por usuário')
+            metrics.counter('admission_shed_total', lambda: self.admission.shed,
+                            'Comandos caros recusados em sobrecarga')
+            metrics.gauge('overloaded', lambda: int(self.admission.overloaded), 'Servidor em modo de sobrecarga')
+
+    def _send_stats(self, client_socket: Connection):
+        self._send_success_response(client_socket, f'Estatísticas do servidor:\n{self.metrics.render_text()}')
+
+    def _process_message(self, client_socket: Connection, username: str, message: str) -> bool:
+        """
+        Executa um comando recebido do cliente.
+        :return: False quando o cliente solicitou a desconexão, True caso contrário.
+        """
         try:
-            parts = message.split(' ', 1)
-            match parts[0]:
-                case '-criargrupo':
-                    self._handle_create_group(client_socket, username=username, data_group=message)
-                case '-entrargrupo':
-                    self._handle_enter_group(client_socket=client_socket, username=username, data_group=message)
-                case '-listargrupos':
-                    self._send_group_list(client_socket)
-                case '-listarusrgrupo':
-                    self._handler_list_users_group(client_socket=client_socket, username=username, data_grupo=message)
-                case '-sairgrupo':
-                    self._handle_exit_group(client_socket=client_socket, username=username, data_group=message)
-                case _:
-                    # Comando desconhecido
-                    self._send_error_response(client_socket, 'Comando de grupo desconhecido.')
+            if self.admission is None:
+                return self._dispatch(client_socket, username, message)
+            if rejection := self.admission.admit(username, message):
+                self._send_error_response(client_socket, rejection)
+                return True
+            started = time.perf_counter()
+            keep_open = self._dispatch(client_socket, username, message)
+            self.admission.observe(time.perf_counter() - started)
+            return keep_open
+        except ConnectionError:
+            raise
         except Exception as e:
-            print(Fore.RED + f"Erro ao processar comando de grupo: {e}" + Style.RESET_ALL)
+            logger.exception("Erro ao processar comando de %s: %s", username, e, extra={'user': username})
             self._send_error_response(client_socket, "Erro interno ao processar o comando.")
+            return True
+
+    def _dispatch(self, client_socket: Connection, username: str, message: str) -> bool:
+        if not client_socket.acknowledge:
+            return self.commands.dispatch(client_socket, username, message)
+        responses = client_socket.responses
+        keep_open = self.commands.dispatch(client_socket, username, message)
+        if client_socket.responses == responses:
+            # Comando concluído sem resposta própria (ex.: -msg entregue): confirma ao cliente
+            self._send_success_response(client_socket, '')
+        return keep_open
+
+    @staticmethod
+    def _handle_enable_acknowledge(client_socket: Connection, username: str, command: ParsedCommand):
+        """Passa a responder todos os comandos da conexão, para que o cliente associe cada resposta ao seu comando."""
+        client_socket.acknowledge = True
+        Server._send_success_response(client_socket, 'Confirmações ativadas.')
+
+    @staticmethod
+    def _handle_exit(client_socket: Connection, username: str, command: ParsedCommand) -> bool:
+        logger.info("%s solicitou desconexão.", username, extra={'user': username})
+        # Saída explícita: a sessão não fica aguardando retomada
+        client_socket.resume_buffer = None
+        return False
 
     def _handle_private_message(self, recipient_name: str, sender_username: str,
-                                sender_socket: socket.socket, message: str):
-        formatted_message = f'({sender_username}, {datetime.now().strftime("%d/%m/%Y %H:%M:%S")}): {message}'
+                                sender_socket: Connection, message: str):
+        formatted_message = Envelope(f'({sender_username}, {current_timestamp("%d/%m/%Y %H:%M:%S")}): {message}')
         self._send_private_message(sender_username, recipient_name,
                                    sender_socket=sender_socket, message=formatted_message)
 
-    def _send_private_message(self, sender_name: str, recipient_name: str, sender_socket: socket.socket, message: str):
+    def _send_private_message(self, sender_name: str, recipient_name: str, sender_socket: Connection,
+                              message: str | Envelope):
         """
            Envia uma mensagem privada para um usuário específico.
            Se o usuário estiver desconectado, armazena a mensagem para ele.
        """
         recipient_name = recipient_name.capitalize()
         # Verifica se o destinatário está conectado
-        for client_socket, client_name in self.clients.items():
-            if client_name == recipient_name:
-                try:
-                    Server.send_message_safe(client_socket, message)
-                    print(
-                        Fore.YELLOW
-                        + f'Mensagem privada de {sender_name} para {recipient_name}: {message}'
-                        + Style.RESET_ALL
-                    )
-                    return
-                except (ConnectionResetError, ConnectionAbortedError):
-                    self._remove_client(client_socket)
-                return
+        client_socket = self.registry.connection_of(recipient_name)
+        if client_socket is not None:
+            # Depois dos fan-outs do remetente ainda pendentes, para não chegar antes deles
+            self.fanout.after(sender_socket, self._deliver_private, client_socket, message)
+            message_logger.info('Mensagem privada de %s para %s: %s', sender_name, recipient_name, message,
+                                extra={'user': sender_name, 'recipient': recipient_name})
+            return
         # Se o destinatário não estiver conectado, verifica se ele já se conectou antes
         if recipient_name in self.all_users:
-            if recipient_name not in self.offline_messages:
-                self.offline_messages[recipient_name] = []
-            self.offline_messages[recipient_name].append(message)
-            print(
-                Fore.YELLOW
-                + f'Mensagem privada de {sender_name} para {recipient_name} armazenada (usuário desconectado).'
-                + Style.RESET_ALL
-            )
+            self.fanout.after(sender_socket, self.offline_messages.append, recipient_name, str(message))
+            message_logger.info('Mensagem privada de %s para %s armazenada (usuário desconectado).',
+                                sender_name, recipient_name, extra={'user': sender_name, 'recipient': recipient_name})
         else:
             # Se o destinatário nunca se conectou, envia uma mensagem de erro
             self._send_error_response(sender_socket, f'{recipient_name} não encontrado.')
 
-    def _broadcast(self, message: str, sender_socket: socket.socket = None):
-        for client_socket in list(self.clients.keys()):
+    def _deliver_private(self, client_socket: Connection, message: str | Envelope):
+        try:
+            Server.send_message_safe(client_socket, message)
+        except (ConnectionResetError, ConnectionAbortedError):
+            self._remove_client(client_socket)
+
+    def _broadcast(self, message: str | Envelope, sender_socket: Connection = None):
+        # Snapshot: conexões e desconexões durante o envio não afetam a iteração
+        recipients = self.registry.sessions()
+        self.fanout.deliver(recipients, lambda shard: self._deliver_to_sessions(shard, message, sender_socket),
+                            kind='broadcast', sender=sender_socket)
+
+    def _deliver_to_sessions(self, sessions, message: str | Envelope, sender_socket: Connection = None) -> int:
+        """Entrega a um shard de ((conexão, username), ...). Retorna quantos receberam a mensagem."""
+        delivered = 0
+        for client_socket, _ in sessions:
             if client_socket != sender_socket:
                 try:
                     Server.send_message_safe(client_socket, message)
+                    delivered += 1
                 except (ConnectionResetError, ConnectionAbortedError):
                     self._remove_client(client_socket)
+        return delivered
 
-    def _remove_client(self, client_socket: socket.socket):
-        username = self.clients.pop(client_socket, "Desconhecido")
+    def _remove_client(self, client_socket: Connection):
+        # outbound_dropped_total só cresce: os descartes da conexão encerrada passam para o total do servidor
+        self.dropped_messages += client_socket.dropped
+        client_socket.dropped = 0
+        if self.resumption is not None and self.resumption.suspend(self.registry, client_socket):
+            client_socket.close()
+            logger.info("Conexão de %s perdida; sessão aguardando retomada.", client_socket.address,
+                        extra={'address': client_socket.address})
+            return
+        username = self.registry.disconnect(client_socket)
+        if username is not None:
+            self._end_session(username)
+        else:
+            username = "Desconhecido"
         client_socket.close()
-        print(Fore.YELLOW + f"{username} desconectou-se do servidor." + Style.RESET_ALL)
+        logger.info("%s desconectou-se do servidor.", username, extra={'user': username})
+
+    def _end_session(self, username: str):
+        # A partir daqui o usuário passa a ler as mensagens globais pelo broadcast_log
+        self.broadcast_log.park(username)
+        if self.admission is not None:
+            self.admission.forget(username)
+        if self.resumption is not None:
+            self.resumption.forget(username)
+        self._publish_presence(username, online=False)
+
+    def _end_suspended_session(self, placeholder: SuspendedConnection):
+        """Encerra uma sessão que não foi retomada; as mensagens enviadas na janela ficam offline."""
+        gap = self.resumption.end(placeholder)
+        username = self.registry.disconnect(placeholder)
+        if username is None:
+            return
+        for message in gap:
+            self.offline_messages.append(username, message)
+        self._end_session(username)
+        logger.info("%s desconectou-se do servidor (sessão não retomada).", username, extra={'user': username})
 
     def _shutdown(self):
-        for client_socket in list(self.clients.keys()):
+        self._stopping.set()
+        if self.resumption is not None:
+            for placeholder in self.resumption.expired(force=True):
+                self._end_suspended_session(placeholder)
+        for client_socket, _ in self.registry.sessions():
             client_socket.close()
         self.server_socket.close()
-        print(Fore.RED + "Servidor fechado." + Style.RESET_ALL)
+        for path, unix_socket in zip(self.unix_paths, self.unix_sockets):
+            unix_socket.close()
+            try:
+                remove_stale_socket(path)
+            except FileExistsError:
+                pass  # O arquivo no caminho não é o socket deste servidor
+        if self._metrics_server is not None:
+            self._metrics_server.close()
+        self.fanout.close()
+        self.offline_messages.close()
+        self.broadcast_log.close()
+        self.group_history.close()
+        if self.state_store is not None:
+            self.state_store.close()
+        logger.warning("Servidor fechado.")
+
+    def _export_state(self) -> tuple[list[str], dict[str, tuple]]:
+        """Estado gravado nos snapshots do state_store."""
+        return list(self.all_users), self.registry.export_groups()
 
     @staticmethod
-    def _send_success_response(client_socket: socket.socket, message: str):
-        header = 'OK'.ljust(10)
-        client_socket.send((header + f'\n{message}').encode('utf-8'))
+    def _send_success_response(client_socket: Connection, message: str):
+        client_socket.send_response('OK', message)
 
     @staticmethod
-    def _send_error_response(client_socket: socket.socket, mensagem: str):
-        header = 'ERROR'.ljust(10)
-        client_socket.send((header + f'\n{mensagem}').encode('utf-8'))
+    def _send_error_response(client_socket: Connection, mensagem: str):
+        client_socket.send_response('ERROR', mensagem)
 
     @staticmethod
-    def send_message_safe(client_socket: socket.socket, message):
+    def send_message_safe(client_socket: Connection, message: str | Envelope):
         try:
-            client_socket.send(message.encode('utf-8'))
+            client_socket.send_message(message)
         except (BrokenPipeError, ConnectionResetError) as e:
-            print(Fore.RED + f"Erro ao enviar mensagem: {e}" + Style.RESET_ALL)
+            logger.warning("Erro ao enviar mensagem: %s", e)
             # Aqui você pode fechar a conexão ou remover o cliente da lista
             client_socket.close()
 
-    def _send_user_list(self, client_socket: socket.socket):
-        """Envia a lista de todos os usuários conectados para o cliente"""
-        users = '\n'.join(self.clients.values())
+    @staticmethod
+    def send_messages_safe(client_socket: Connection, messages: list[str]):
+        try:
+            client_socket.send_messages(messages)
+        except (BrokenPipeError, ConnectionResetError) as e:
+            logger.warning("Erro ao enviar mensagens: %s", e)
+            client_socket.close()
+
+    def _send_user_list(self, client_socket: Connection, username: str, command: ParsedCommand):
+        """Envia a lista dos usuários conectados para o cliente; com opções, apenas uma página"""
         try:
-            self._send_success_response(client_socket, f'Usuários online:\n{users}')
-            print(Fore.CYAN
-                  + f'Lista de usuários enviada para {self.clients.get(client_socket, "Desconhecido")}'
-                  + Style.RESET_ALL)
+            if command.args:
+                options = Server._parse_listing_options(command.args)
+                if options is None:
+                    self._send_error_response(client_socket, f'Formato inválido. Use: -listarusuarios {LISTING_USAGE}')
+                    return
+                if 'prefixo' in options:
+                    # Os nomes de usuário são armazenados com a inicial maiúscula
+                    options['prefixo'] = options['prefixo'].capitalize()
+                self._send_page(client_socket, 'Usuários online', self.registry.sorted_online_users(), options)
+            else:
+                users = '\n'.join(self.registry.online_users())
+                self._send_success_response(client_socket, f'Usuários online:\n{users}')
+            logger.debug('Lista de usuários enviada para %s', username)
         except (ConnectionResetError, ConnectionAbortedError):
             self._remove_client(client_socket)
 
-    def _handle_exit_group(self, client_socket: socket.socket, username, data_group: str):
+    @staticmethod
+    def _parse_listing_options(args, allowed: tuple = LISTING_OPTIONS) -> dict[str, str] | None:
+        """Interpreta opções chave=valor (ex.: prefixo=, apos=, limite=); None se alguma for inválida."""
+        options = {}
+        for arg in args:
+            key, separator, value = arg.partition('=')
+            if not separator or not value or key not in allowed:
+                return None
+            options[key] = value
+        if 'limite' in options and (not options['limite'].isdigit() or int(options['limite']) < 1):
+            return None
+        if 'desde' in options and not options['desde'].isdigit():
+            return None
+        return options
+
+    @staticmethod
+    def _split_listing_options(text: str, allowed: tuple = LISTING_OPTIONS) -> tuple[str, dict[str, str] | None]:
+        """Separa as opções no final de um texto que pode conter espaços (ex.: nome do grupo)."""
+        words = text.split(' ')
+        count = 0
+        while count < len(words) - 1 and words[-1 - count].partition('=')[0] in allowed:
+            count += 1
+        if not count:
+            return text, {}
+        return ' '.join(words[:-count]), Server._parse_listing_options(words[-count:], allowed)
+
+    @staticmethod
+    def _page(names: tuple, options: dict[str, str]) -> tuple[tuple, bool]:
+        """
+        Página de uma lista em ordem alfabética: os nomes com o prefixo, depois do cursor, até o limite.
+        Localizada por busca binária, sem percorrer a lista.
+        :return: A página e se há mais resultados depois dela.
+        """
+        prefix = options.get('prefixo', '')
+        start = bisect_left(names, prefix)
+        if 'apos' in options:
+            start = max(start, bisect_right(names, options['apos']))
+        # Na lista ordenada, os nomes com o prefixo são contíguos
+        end = bisect_left(names, prefix + '\U0010ffff') if prefix else len(names)
+        limit = min(int(options.get('limite', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+        return names[start:min(end, start + limit)], start + limit < end
+
+    def _send_page(self, client_socket: Connection, title: str, names: tuple, options: dict[str, str]):
+        page, more = Server._page(names, options)
+        if more:
+            # O cliente pede a próxima página com apos=<último nome desta>
+            title = f'{title} {MORE_RESULTS}'
+        self._send_success_response(client_socket, f'{title}:\n' + '\n'.join(page))
+
+    def _handle_history(self, client_socket: Connection, username: str, command: ParsedCommand):
+        """
+        Envia as últimas mensagens do grupo (ou as posteriores a desde=) em uma única escrita, seguidas
+        de uma resposta com a sequência da última enviada, a ser usada como desde= na próxima busca.
+        """
+        group_name, options = Server._split_listing_options(command.args[0], HISTORY_OPTIONS)
+        if options is None:
+            self._send_error_response(client_socket,
+                                      'Formato inválido. Use: -historico NOME_DO_GRUPO [desde=SEQUÊNCIA] [limite=N]')
+            return
+        if not self.registry.has_group(group_name):
+            self._send_error_response(client_socket, f"Erro: O grupo '{group_name}' não existe.")
+            return
+        if not self.registry.is_member(group_name, username):
+            self._send_error_response(client_socket,
+                                      f"Erro: Você ('{username}') não faz parte do grupo '{group_name}'!")
+            return
+        since = int(options['desde']) if 'desde' in options else None
+        limit = min(int(options.get('limite', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+        page = self.group_history.fetch(group_name, since, limit)
+        if page.messages:
+            Server.send_messages_safe(client_socket, page.messages)
+        summary = f'Histórico do grupo {group_name}: {len(page.messages)} mensagens, até a sequência {page.last_seq}.'
+        self._send_success_response(client_socket, f'{summary} {MORE_RESULTS}' if page.more else summary)
+
+    def _handle_subscribe_presence(self, client_socket: Connection, username: str, command: ParsedCommand):
+        """Passa a enviar ao cliente as entradas e saídas de usuários, em vez de ele repetir -listarusuarios."""
+        if not client_socket.codec.framed:
+            self._send_error_response(client_socket, 'A assinatura de presença requer o protocolo com framing.')
+            return
+        if not self.registry.subscribe_presence(client_socket):
+            self._send_error_response(client_socket, 'Presença já assinada.')
+            return
+        self._send_success_response(client_socket, 'Presença assinada.')
+
+    def _handle_unsubscribe_presence(self, client_socket: Connection, username: str, command: ParsedCommand):
+        if not self.registry.unsubscribe_presence(client_socket):
+            self._send_error_response(client_socket, 'Presença não assinada.')
+            return
+        self._send_success_response(client_socket, 'Assinatura de presença cancelada.')
+
+    def _publish_presence(self, username: str, online: bool):
+        """Envia '+usuário' ou '-usuário' aos assinantes, com o frame codificado uma única vez."""
+        subscribers = self.registry.presence_subscriptions()
+        if not subscribers:
+            return
+        frame = encode_frame(MSG_PRESENCE, ('+' if online else '-') + username)
+        for client_socket in subscribers:
+            try:
+                client_socket.send(frame)
+            except (ConnectionResetError, ConnectionAbortedError, BrokenPipeError):
+                client_socket.close()
+
+    def _handle_exit_group(self, client_socket: Connection, username, command: ParsedCommand):
         """
                 Remove o usuário do grupo com o nome fornecido.
                 :param client_socket: Socket do cliente que solicitou a criação do grupo.
                 :param username: Nome do usuário que está criando o grupo.
-                :param data_group: Comando completo enviado pelo cliente (ex: "-entrargrupo NOME_DO_GRUPO").
+                :param command: Comando recebido, com o nome do grupo como argumento (ex: "-sairgrupo NOME_DO_GRUPO").
                 """
-        # Divide o comando em partes: "-entrargrupo" e "NOME_DO_GRUPO"
-        parts = extract_command_parts(data_group, expected_parts=2)
-        if not parts:
-            self._send_error_response(client_socket, 'Formato inválido. Use: -sairgrupo NOME_DO_GRUPO')
-            return
-        _, group_name = parts
-        if group_name in self.groups:
-            if username in self.groups[group_name]:
-                self.groups[group_name].remove(username)
+        group_name = command.args[0]
+        if self.registry.has_group(group_name):
+            if self.registry.leave_group(group_name, username):
+                if self.state_store is not None:
+                    self.state_store.leave_group(group_name, username)
                 self._send_success_response(client_socket,
                                             f"Você('{username}') não faz mais parte do grupo {group_name}.")
                 return
@@ -247,179 +762,190 @@ class Server:
         self._send_error_response(client_socket, f"Erro: O grupo '{group_name}' não existe.")
         return
 
-    def _handle_enter_group(self, client_socket: socket.socket, username, data_group: str):
+    def _handle_enter_group(self, client_socket: Connection, username, command: ParsedCommand):
         """
         Adiciona o usuário ao grupo com o nome fornecido.
         :param client_socket: Socket do cliente que solicitou a criação do grupo.
         :param username: Nome do usuário que está criando o grupo.
-        :param data_group: Comando completo enviado pelo cliente (ex: "-entrargrupo NOME_DO_GRUPO").
+        :param command: Comando recebido, com o nome do grupo como argumento (ex: "-entrargrupo NOME_DO_GRUPO").
         """
-        # Divide o comando em partes: "-entrargrupo" e "NOME_DO_GRUPO"
-        parts = extract_command_parts(data_group, expected_parts=2)
-        if not parts:
-            self._send_error_response(client_socket, 'Formato inválido. Use: -entrargrupo NOME_DO_GRUPO')
-            return
-        _, group_name = parts
-        if group_name in self.groups:
-            if username in self.groups[group_name]:
+        group_name = command.args[0]
+        if self.registry.has_group(group_name):
+            if not self.registry.join_group(group_name, username):
                 self._send_error_response(client_socket,
                                           f"Erro: O usuário '{username}' já participa do grupo {group_name}.")
                 return
-            self.groups[group_name].append(username)
+            if self.state_store is not None:
+                self.state_store.join_group(group_name, username)
             self._send_success_response(client_socket,
                                         f"Você('{username}') entrou no grupo {group_name}.")
-            print(
-                Fore.YELLOW
-                + f'Usuário "{username}" adicionado ao grupo {group_name} com sucesso.'
-                + Style.RESET_ALL
-            )
+            logger.info('Usuário "%s" adicionado ao grupo %s com sucesso.', username, group_name,
+                        extra={'user': username, 'group': group_name})
             return
         self._send_error_response(client_socket, f"Erro: O grupo '{group_name}' não existe.")
         return
 
-    def _handle_create_group(self, client_socket: socket.socket, username, data_group: str):
+    def _handle_create_group(self, client_socket: Connection, username, command: ParsedCommand):
         """
         Cria um novo grupo com o nome fornecido.
         :param client_socket: Socket do cliente que solicitou a criação do grupo.
         :param username: Nome do usuário que está criando o grupo.
-        :param data_group: Comando completo enviado pelo cliente (ex: "-criargrupo NOME_DO_GRUPO").
+        :param command: Comando recebido, com o nome do grupo como argumento (ex: "-criargrupo NOME_DO_GRUPO").
         """
-        # Divide o comando em partes: "-criargrupo" e "NOME_DO_GRUPO"
-        parts = extract_command_parts(data_group, expected_parts=2)
-        if not parts:
-            self._send_error_response(client_socket, 'Formato inválido. Use: -criargrupo NOME_DO_GRUPO')
+        group_name = command.args[0]
+        if '\0' in group_name:
+            # Separador dos nomes no StateStore
+            self._send_error_response(client_socket, 'Nome de grupo inválido.')
             return
-        _, group_name = parts
-        if group_name in self.groups:
+        if not self.registry.create_group(group_name, username):
             self._send_error_response(client_socket, f"Erro: O grupo '{group_name}' já existe.")
             return
-        self.groups[group_name] = [username]
+        if self.state_store is not None:
+            self.state_store.create_group(group_name, username)
         self._send_success_response(client_socket, f'Grupo "{group_name}" criado com sucesso.')
-        print(Fore.GREEN + f"Grupo '{group_name}' criado por {username}." + Style.RESET_ALL)
-
-    def _send_group_list(self, client_socket: socket.socket):
-        """"Envia a lista de grupos para o cliente"""
-        if not self.groups:
+        logger.info("Grupo '%s' criado por %s.", group_name, username, extra={'user': username, 'group': group_name})
+
+    def _send_group_list(self, client_socket: Connection, username: str, command: ParsedCommand):
+        """"Envia a lista de grupos para o cliente; com opções, apenas uma página"""
+        if command.args:
+            options = Server._parse_listing_options(command.args)
+            if options is None:
+                self._send_error_response(client_socket, f'Formato inválido. Use: -listargrupos {LISTING_USAGE}')
+                return
+            self._send_page(client_socket, 'Grupos', self.registry.sorted_group_names(), options)
+            return
+        group_names = self.registry.group_names()
+        if not group_names:
             self._send_error_response(client_socket, 'Nenhum grupo cadastrado')
             return
-        print(self.groups)
-        groups = '\n'.join(self.groups.keys())
+        groups = '\n'.join(group_names)
         try:
             self._send_success_response(client_socket, f'Grupos:\n{groups}')
-            print(Fore.CYAN
-                  + f"Lista de grupos enviada para {self.clients.get(client_socket, 'Desconhecido')}."
-                  + Style.RESET_ALL)
+            logger.debug("Lista de %d grupos enviada para %s.", len(group_names),
+                         self.clients.get(client_socket, 'Desconhecido'))
         except (ConnectionResetError, ConnectionAbortedError):
             self._remove_client(client_socket)
 
-    def _handler_list_users_group(self, client_socket: socket.socket, username: str, data_grupo: str):
-
-        parts = extract_command_parts(data_grupo, 2)
-        if not parts:
-            self._send_error_response(client_socket, 'Formato inválido. Use: -listarusrgrupo NOME_DO_GRUPO')
+    def _handler_list_users_group(self, client_socket: Connection, username: str, command: ParsedCommand):
+        group_name, options = Server._split_listing_options(command.args[0])
+        if options is None:
+            self._send_error_response(client_socket,
+                                      f'Formato inválido. Use: -listarusrgrupo NOME_DO_GRUPO {LISTING_USAGE}')
             return
-        _, group_name = parts
-        if group_name not in self.groups:
+        if not self.registry.has_group(group_name):
             self._send_error_response(client_socket, f'Grupo "{group_name}" não cadastrado')
             return
-        users = self.groups[group_name]
+        if options:
+            if 'prefixo' in options:
+                options['prefixo'] = options['prefixo'].capitalize()
+            self._send_page(client_socket, 'Usuários do grupo', self.registry.sorted_members(group_name), options)
+            return
+        users = self.registry.members(group_name)
         if not users:
             self._send_error_response(client_socket, f"Nenhum usuário no grupo '{group_name}'.")
             return
         users = '\n'.join(users)
         self._send_success_response(client_socket, f'Usuários do grupo: \n{users}')
-        print(Fore.CYAN
-              + f"Lista de usuários do grupo {group_name} enviada para {username}."
-              + Style.RESET_ALL)
-
-    def _handle_command_message(self, message: str, username: str, client_socket: socket.socket):
-        if parts := extract_command_parts(message, 4):
-            command, tag, recipient_name, msg = parts
-            if command == '-msg':
-                if (tag := tag.upper()) not in ('U', 'G'):
-                    self._send_error_response(client_socket, "Tag inválida. Use U (usuário) ou G (grupo).")
-                    return
-                if tag == 'U':
-                    self._handle_private_message(recipient_name, sender_username=username,
-                                                 sender_socket=client_socket, message=msg)
-                    return
-                self._handle_group_message(group_name=recipient_name, sender_username=username,
-                                           sender_socket=client_socket, message=msg)
-        if parts := extract_command_parts(message, 3):
-            command, tag, msg = parts
-            if command == '-msgt':
-                match tag.upper():
-                    case 'C':
-                        self.handle_message_logged_in_users(sender_socket=client_socket, sender_client=username,
-                                                            message=msg)
-                        return
-                    case 'D':
-                        self.handle_message_disconnected_users(sender_username=username, message=msg)
-                    case 'T':
-                        self.handle_message_all_users(sender_socket=client_socket, sender_username=username,
-                                                      message=msg)
-                    case _:
-                        # Comando desconhecido
-                        self._send_error_response(client_socket, 'Tag inválida. Use C (conectados),'
-                                                                 ' D (desconectados) ou T (todos).')
-
-    def handle_message_logged_in_users(self, sender_socket: socket.socket, sender_client: str, message: str):
-        formatted_message = (f'({sender_client}, {datetime.now().strftime("%d/%m/%Y - %H:%M:%S")}):'
-                             f' {message}')
-        self._broadcast(message=formatted_message, sender_socket=sender_socket)
-        print(Fore.YELLOW + f"Mensagem envida para todos os conectados ao servidor" + Style.RESET_ALL)
+        logger.debug("Lista de usuários do grupo %s enviada para %s.", group_name, username)
+
+    def _handle_command_message(self, client_socket: Connection, username: str, command: ParsedCommand):
+        tag, recipient_name, msg = command.args
+        if (tag := tag.upper()) not in ('U', 'G'):
+            self._send_error_response(client_socket, "Tag inválida. Use U (usuário) ou G (grupo).")
+            return
+        if tag == 'U':
+            self._handle_private_message(recipient_name, sender_username=username,
+                                         sender_socket=client_socket, message=msg)
+            return
+        self._handle_group_message(group_name=recipient_name, sender_username=username,
+                                   sender_socket=client_socket, message=msg)
+
+    def _handle_command_broadcast(self, client_socket: Connection, username: str, command: ParsedCommand):
+        tag, msg = command.args
+        match tag.upper():
+            case 'C':
+                self.handle_message_logged_in_users(sender_socket=client_socket, sender_client=username,
+                                                    message=msg)
+            case 'D':
+                self.handle_message_disconnected_users(sender_username=username, message=msg)
+            case 'T':
+                self.handle_message_all_users(sender_socket=client_socket, sender_username=username,
+                                              message=msg)
+            case _:
+                # Comando desconhecido
+                self._send_error_response(client_socket, 'Tag inválida. Use C (conectados),'
+                                                         ' D (desconectados) ou T (todos).')
+
+    @staticmethod
+    def _format_broadcast(sender_username: str, message: str) -> Envelope:
+        return Envelope(f'({sender_username}, {current_timestamp()}): {message}')
+
+    def handle_message_logged_in_users(self, sender_socket: Connection, sender_client: str, message: str):
+        self._broadcast(message=Server._format_broadcast(sender_client, message), sender_socket=sender_socket)
+        message_logger.info("Mensagem de %s enviada para todos os conectados ao servidor", sender_client,
+                            extra={'user': sender_client})
 
-    def _handle_group_message(self, group_name: str, sender_username: str, sender_socket: socket.socket, message: str):
-        if group_name not in self.groups:
+    def _handle_group_message(self, group_name: str, sender_username: str, sender_socket: Connection, message: str):
+        if not self.registry.has_group(group_name):
             self._send_error_response(sender_socket, f"Erro: O grupo '{group_name}' não existe.")
             return
-        if sender_username not in self.groups[group_name]:
+        if not self.registry.is_member(group_name, sender_username):
             self._send_error_response(sender_socket,
                                       f"Erro: Você ('{sender_username}') não faz parte do grupo '{group_name}'!")
             return
-        formatted_message = (f'({sender_username}, {group_name}, {datetime.now().strftime("%d/%m/%Y - %H:%M:%S")}): '
-                             f'{message}')
+        # Formatada e codificada uma única vez para todos os membros
+        formatted_message = Envelope(f'({sender_username}, {group_name}, {current_timestamp()}): {message}')
+        self.group_history.append(group_name, formatted_message.text)
+        members = self.registry.members(group_name)
+        self.fanout.deliver(members, lambda shard: self._deliver_to_members(shard, formatted_message, sender_username),
+                            kind='group', sender=sender_socket)
+        message_logger.info("Mensagem enviada para o grupo '%s' por %s.", group_name, sender_username,
+                            extra={'user': sender_username, 'group': group_name})
+
+    def _deliver_to_members(self, members, message: Envelope, sender_username: str) -> int:
+        """Entrega a um shard de membros do grupo. Retorna quantos conectados receberam a mensagem."""
         offline_members = []
-        for member in self.groups[group_name]:
-            member_found = False
-            for client_socket, username in self.clients.items():
-                if member == username and client_socket != sender_socket:  # Não envia para o próprio remetente
-                    try:
-                        self.send_message_safe(client_socket, formatted_message)
-                        member_found = True
-                    except (ConnectionResetError, ConnectionAbortedError):
-                        self._remove_client(client_socket)
-            if not member_found and member != sender_username:
+        delivered = 0
+        for member in members:
+            if member == sender_username:  # Não envia para o próprio remetente
+                continue
+            client_socket = self.registry.connection_of(member)
+            if client_socket is None:
                 offline_members.append(member)
-       
-        for offline_member in offline_members:
-            if offline_member not in self.offline_messages:
-                self.offline_messages[offline_member] = []
-            self.offline_messages[offline_member].append(formatted_message)
+                continue
+            try:
+                self.send_message_safe(client_socket, message)
+                delivered += 1
+            except (ConnectionResetError, ConnectionAbortedError):
+                self._remove_client(client_socket)
 
-        print(Fore.YELLOW + f"Mensagem enviada para o grupo '{group_name}' por {sender_username}." + Style.RESET_ALL)
+        for offline_member in offline_members:
+            self.offline_messages.append(offline_member, message.text)
+        return delivered
 
     def handle_message_disconnected_users(self, sender_username: str, message: str, suppress_print: bool = False):
         """
         Envia uma mensagem para todos os usuários desconectados.
         """
-        formatted_message = f'({sender_username}, {datetime.now().strftime("%d/%m/%Y - %H:%M:%S")}): {message}'
-        disconnected_users = self.all_users - set(self.clients.values())
-        for username in disconnected_users:
-            if username not in self.clients.values():  # Verifica se o usuário está desconectado
-                if username not in self.offline_messages:
-                    self.offline_messages[username] = []
-                self.offline_messages[username].append(formatted_message)
+        # Uma única gravação, independente do número de usuários desconectados
+        self.broadcast_log.append(Server._format_broadcast(sender_username, message).text)
         if not suppress_print:
-            print(Fore.YELLOW + f"Mensagem enviada para todos os usuários desconectados." + Style.RESET_ALL)
+            message_logger.info("Mensagem de %s enviada para todos os usuários desconectados.", sender_username,
+                                extra={'user': sender_username})
 
-    def handle_message_all_users(self, sender_socket: socket.socket, sender_username: str, message: str):
-        self.handle_message_disconnected_users(sender_username=sender_username, message=message, suppress_print=True)
-        formatted_message = f'({sender_username}, {datetime.now().strftime("%d/%m/%Y - %H:%M:%S")}): {message}'
+    def handle_message_all_users(self, sender_socket: Connection, sender_username: str, message: str):
+        # A mesma mensagem formatada vai para o log dos desconectados e para os conectados
+        formatted_message = Server._format_broadcast(sender_username, message)
+        self.broadcast_log.append(formatted_message.text)
         self._broadcast(message=formatted_message, sender_socket=sender_socket)
-        print(Fore.YELLOW + f"Mensagem enviada para todos os usuários (conectados e desconectados)." + Style.RESET_ALL)
+        message_logger.info("Mensagem de %s enviada para todos os usuários (conectados e desconectados).",
+                            sender_username, extra={'user': sender_username})
 
 
 if __name__ == '__main__':
-    server = Server('localhost', 50001)
+    server = Server('localhost', 50001, offline_store=SegmentLogOfflineStore('offline_data'),
+                    idle_timeout=90, heartbeat_interval=30, state_store=StateStore('state_data'),
+                    admission=AdmissionControl(), group_history=GroupHistory(directory='history_data'),
+                    resumption=SessionResumption(), compression=Compression(),
+                    broadcast_log=BroadcastLog(directory='broadcast_data'))
     server.run()
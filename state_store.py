@@ -0,0 +1,219 @@
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from typing import Callable
+
+# Cabeçalho do snapshot: assinatura, versão do formato, geração do journal a partir da qual o
+# snapshot deve ser complementado e os tamanhos das seções que o seguem
+SNAPSHOT_HEADER = struct.Struct('!4sHQQQQQ')
+SNAPSHOT_MAGIC = b'PSDS'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_NAME = 'state.snapshot'
+# Cabeçalho de cada registro do journal: operação e tamanho dos campos
+JOURNAL_HEADER = struct.Struct('!cI')
+JOURNAL_PREFIX = 'journal-'
+JOURNAL_SUFFIX = '.log'
+# Separador dos nomes nas seções do snapshot e dos campos no journal
+SEPARATOR = '\0'
+
+USER_ADDED = b'U'
+GROUP_CREATED = b'G'
+GROUP_JOINED = b'J'
+GROUP_LEFT = b'L'
+
+
+class StateStore:
+    """
+    Persistência do estado que não cabe no OfflineStore: usuários conhecidos e grupos com seus
+    membros, para que um reinício não esqueça quem já se conectou.
+
+    - Snapshot: arquivo binário compacto com todos os nomes em blocos contínuos; a leitura mapeia
+      o arquivo em memória e separa cada bloco de uma vez, sem um laço por registro no disco.
+    - Journal: cada alteração posterior ao snapshot é acrescentada a um log append-only. Um novo
+      snapshot inicia outra geração de journal e remove as anteriores.
+
+    As operações do journal são idempotentes, então reaplicar uma alteração já contida no
+    snapshot não muda o resultado.
+    """
+
+    def __init__(self, directory: str, snapshot_interval: float = 300.0):
+        self.directory = directory
+        self.snapshot_interval = snapshot_interval
+        self._export = None  # Função que devolve (usuários, {grupo: membros}) para o snapshot
+        self._generation = 0
+        self._journal = None
+        self._changes = 0  # Registros no journal desde o último snapshot
+        self._lock = threading.Lock()  # Protege o journal
+        self._snapshot_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._snapshotter = None
+        os.makedirs(directory, exist_ok=True)
+
+    def load(self) -> tuple[set[str], dict[str, list[str]]]:
+        """Lê o snapshot e reaplica o journal; em seguida abre uma nova geração do journal."""
+        generation, users, groups = self._read_snapshot()
+        generations = self._journal_generations()
+        for journal_generation in generations:
+            if journal_generation >= generation:
+                StateStore._replay(self._journal_path(journal_generation), users, groups)
+        self._generation = max([generation, *generations]) + 1
+        self._journal = open(self._journal_path(self._generation), 'ab')
+        return users, {group_name: list(members) for group_name, members in groups.items()}
+
+    def start(self, export: Callable[[], tuple[list[str], dict[str, tuple]]]):
+        """Inicia os snapshots periódicos. export é chamada a cada snapshot e no close()."""
+        self._export = export
+        if self.snapshot_interval:
+            self._snapshotter = threading.Thread(target=self._snapshot_loop, daemon=True)
+            self._snapshotter.start()
+
+    # Journal
+
+    def add_user(self, username: str):
+        self._append(USER_ADDED, username)
+
+    def create_group(self, group_name: str, owner: str):
+        self._append(GROUP_CREATED, group_name, owner)
+
+    def join_group(self, group_name: str, username: str):
+        self._append(GROUP_JOINED, group_name, username)
+
+    def leave_group(self, group_name: str, username: str):
+        self._append(GROUP_LEFT, group_name, username)
+
+    def _append(self, operation: bytes, *fields: str):
+        if any(SEPARATOR in field for field in fields):
+            raise ValueError('Nomes com o caractere nulo não podem ser persistidos')
+        payload = SEPARATOR.join(fields).encode('utf-8')
+        with self._lock:
+            if self._journal is None:
+                return
+            self._journal.write(JOURNAL_HEADER.pack(operation, len(payload)) + payload)
+            # Sem fsync: sobrevive a uma queda do processo; o snapshot é sincronizado com o disco
+            self._journal.flush()
+            self._changes += 1
+
+    def _journal_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f'{JOURNAL_PREFIX}{generation:08d}{JOURNAL_SUFFIX}')
+
+    def _journal_generations(self) -> list[int]:
+        return sorted(int(name[len(JOURNAL_PREFIX):-len(JOURNAL_SUFFIX)]) for name in os.listdir(self.directory)
+                      if name.startswith(JOURNAL_PREFIX) and name.endswith(JOURNAL_SUFFIX))
+
+    @staticmethod
+    def _replay(path: str, users: set[str], groups: dict[str, dict]):
+        with open(path, 'rb') as journal:
+            data = journal.read()
+        offset = 0
+        while offset + JOURNAL_HEADER.size <= len(data):
+            operation, length = JOURNAL_HEADER.unpack_from(data, offset)
+            offset += JOURNAL_HEADER.size
+            if offset + length > len(data):
+                # Registro incompleto deixado por uma queda do servidor
+                return
+            fields = data[offset:offset + length].decode('utf-8').split(SEPARATOR)
+            offset += length
+            if operation == USER_ADDED:
+                users.add(fields[0])
+            elif operation in (GROUP_CREATED, GROUP_JOINED):
+                # Uma entrada gravada antes da criação do grupo, por outra thread, também o cria
+                groups.setdefault(fields[0], {})[fields[1]] = None
+            elif operation == GROUP_LEFT:
+                groups.get(fields[0], {}).pop(fields[1], None)
+
+    # Snapshot
+
+    def snapshot(self):
+        """Grava o estado atual e descarta os journals que ele torna desnecessários."""
+        if self._export is None:
+            return
+        with self._snapshot_lock:
+            with self._lock:
+                # Alterações a partir daqui vão para a nova geração, que complementa este snapshot
+                if self._journal is not None:
+                    self._journal.close()
+                    self._generation += 1
+                    self._journal = open(self._journal_path(self._generation), 'ab')
+                generation = self._generation
+                self._changes = 0
+            users, groups = self._export()
+            self._write_snapshot(generation, users, groups)
+            for journal_generation in self._journal_generations():
+                if journal_generation < generation:
+                    os.remove(self._journal_path(journal_generation))
+
+    def _write_snapshot(self, generation: int, users: list[str], groups: dict[str, tuple]):
+        users_data = SEPARATOR.join(users).encode('utf-8')
+        names_data = SEPARATOR.join(groups).encode('utf-8')
+        counts = array('I', map(len, groups.values()))
+        members_data = SEPARATOR.join(member for members in groups.values() for member in members).encode('utf-8')
+        if sys.byteorder == 'big':
+            counts.byteswap()  # Contagens gravadas sempre em little-endian
+        path = os.path.join(self.directory, SNAPSHOT_NAME)
+        with open(path + '.tmp', 'wb') as snapshot:
+            snapshot.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, generation, len(users_data),
+                                                len(names_data), len(counts), len(members_data)))
+            snapshot.write(users_data)
+            snapshot.write(names_data)
+            snapshot.write(counts.tobytes())
+            snapshot.write(members_data)
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        os.replace(path + '.tmp', path)
+
+    def _read_snapshot(self) -> tuple[int, set[str], dict[str, dict]]:
+        """:return: A geração do journal que complementa o snapshot, os usuários e os grupos."""
+        path = os.path.join(self.directory, SNAPSHOT_NAME)
+        if not os.path.exists(path) or os.path.getsize(path) < SNAPSHOT_HEADER.size:
+            return 0, set(), {}
+        with open(path, 'rb') as snapshot, mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            magic, version, generation, users_size, names_size, group_count, members_size = \
+                SNAPSHOT_HEADER.unpack_from(view)
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                raise ValueError(f'Snapshot de estado inválido: {path}')
+            offset = SNAPSHOT_HEADER.size
+            users = StateStore._split(view[offset:offset + users_size])
+            offset += users_size
+            names = StateStore._split(view[offset:offset + names_size])
+            offset += names_size
+            counts = array('I')
+            counts.frombytes(view[offset:offset + group_count * counts.itemsize])
+            offset += group_count * counts.itemsize
+            members = StateStore._split(view[offset:offset + members_size])
+        if sys.byteorder == 'big':
+            counts.byteswap()
+        groups = {}
+        start = 0
+        for group_name, count in zip(names, counts):
+            groups[group_name] = dict.fromkeys(members[start:start + count])
+            start += count
+        return generation, set(users), groups
+
+    @staticmethod
+    def _split(data: bytes) -> list[str]:
+        return data.decode('utf-8').split(SEPARATOR) if data else []
+
+    def _snapshot_loop(self):
+        while not self._closed.wait(self.snapshot_interval):
+            if self._changes:
+                try:
+                    self.snapshot()
+                except OSError:
+                    pass
+
+    def close(self):
+        """Grava um último snapshot e fecha o journal."""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        if self._snapshotter is not None:
+            self._snapshotter.join()
+        if self._changes:
+            self.snapshot()
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+# Os módulos do projeto ficam na raiz do repositório, sem pacote
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server import Server  # noqa: E402
+
+
+@pytest.fixture
+def server():
+    """Server sem sockets abertos, para chamar os handlers diretamente."""
+    instance = Server('localhost', 0)
+    yield instance
+    instance.server_socket.close()
+    instance.fanout.close()
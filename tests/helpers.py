@@ -0,0 +1,40 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from async_server import AsyncServer
+from connection import Connection
+from protocol import MessageCodec
+
+
+class FakeConnection(Connection):
+    """Conexão sem socket: o que o writer escreveria fica na fila de saída, lido com received()."""
+
+    def __init__(self, address: tuple = ('127.0.0.1', 0), **options):
+        super().__init__(address, **options)
+        self.codec.framed = True
+        self._client_codec = MessageCodec(framed=True)
+
+    def _wake_writer(self):
+        pass
+
+    def abort(self):
+        self.closed = True
+
+    def received(self) -> list[tuple[str | None, str]]:
+        """Esvazia a fila de saída e retorna o que o cliente receberia: [(cabeçalho, mensagem), ...]."""
+        data = self._take_batch()
+        return self._client_codec.decode(data) if data else []
+
+
+@asynccontextmanager
+async def serving(**options):
+    """AsyncServer em uma porta livre, no event loop do teste. Produz (servidor, porta)."""
+    server = AsyncServer('localhost', 0, **options)
+    task = asyncio.create_task(server._serve())
+    while not server.server_socket.getsockname()[1]:
+        await asyncio.sleep(0.01)
+    try:
+        yield server, server.server_socket.getsockname()[1]
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
@@ -0,0 +1,49 @@
+from admission import AdmissionControl, RateLimit, TokenBucket
+
+
+def test_bucket_allows_the_burst_then_refills_at_the_rate():
+    bucket = TokenBucket(RateLimit(rate=2, burst=3), now=0.0)
+    assert [bucket.take(0.0) for _ in range(4)] == [True, True, True, False]
+    assert bucket.retry_after() == 0.5
+    assert not bucket.take(0.25)
+    assert bucket.take(0.5)
+    # Parado, o bucket volta a encher, mas nunca acima do burst
+    assert bucket.full(100.0)
+    assert bucket.tokens == 3
+
+
+def test_limits_are_per_user_and_per_class():
+    admission = AdmissionControl(limits={'mensagem': RateLimit(0.001, 2), 'global': RateLimit(0.001, 1)})
+    assert admission.admit('Ana', '-msg U Bob oi') is None
+    assert admission.admit('Ana', '-msg U Bob oi') is None
+    error = admission.admit('Ana', '-msg U Bob oi')
+    assert error.startswith('Limite de comandos -msg excedido')
+    assert admission.rejected == 1
+
+    assert admission.admit('Bob', '-msg U Ana oi') is None  # Outro usuário
+    assert admission.admit('Ana', '-msgt C oi') is None  # Outra classe
+    assert admission.admit('Ana', '-sair') is None  # Comandos sem classe não são limitados
+    assert admission.admit('Ana', '-listarusuarios') is None  # Classe sem limite configurado
+
+
+def test_expensive_commands_are_shed_while_overloaded():
+    admission = AdmissionControl(overload_queue_depth=10, check_interval=0)
+    depth = 0
+    admission.queue_depth = lambda: depth
+    assert admission.admit('Ana', '-listarusuarios') is None
+
+    depth = 11
+    assert admission.admit('Ana', '-listarusuarios').startswith('Servidor sobrecarregado')
+    assert admission.admit('Ana', '-msg U Bob oi') is None  # Mensagens continuam aceitas
+    assert admission.shed == 1
+
+    depth = 0
+    assert admission.admit('Ana', '-listarusuarios') is None
+
+
+def test_forget_keeps_users_that_are_still_limited():
+    admission = AdmissionControl(limits={'global': RateLimit(0.001, 1)})
+    admission.admit('Ana', '-msgt C oi')
+    admission.forget('Ana')
+    # Sair e entrar de novo não renova o limite
+    assert admission.admit('Ana', '-msgt C oi') is not None
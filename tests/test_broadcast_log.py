@@ -0,0 +1,67 @@
+from broadcast_log import BroadcastLog
+
+
+def _drain(log, username):
+    return [message for chunk in log.pop_chunks(username) for message in chunk]
+
+
+def test_messages_and_cursors_survive_restart(tmp_path):
+    log = BroadcastLog(segment_size=3, directory=str(tmp_path))
+    log.append('antes')
+    log.park('Ana')
+    for index in range(5):
+        log.append(f'global {index}')
+    log.park('Bob')
+    log.append('depois de Bob')
+    log.close()
+
+    reopened = BroadcastLog(segment_size=3, directory=str(tmp_path))
+    assert reopened.last_seq == 7
+    reopened.append('após o reinício')
+    assert _drain(reopened, 'Ana') == [f'global {index}' for index in range(5)] + ['depois de Bob',
+                                                                                    'após o reinício']
+    assert _drain(reopened, 'Bob') == ['depois de Bob', 'após o reinício']
+    reopened.close()
+
+    # Cursores consumidos também são persistidos
+    again = BroadcastLog(segment_size=3, directory=str(tmp_path))
+    assert _drain(again, 'Ana') == []
+    assert again.last_seq == 8
+
+
+def test_park_all_keeps_existing_cursors(tmp_path):
+    log = BroadcastLog(directory=str(tmp_path))
+    log.park('Ana')
+    log.append('para Ana')
+    log.park_all(['Ana', 'Bob'])
+    log.append('para os dois')
+    log.close()
+
+    reopened = BroadcastLog(directory=str(tmp_path))
+    assert _drain(reopened, 'Ana') == ['para Ana', 'para os dois']
+    assert _drain(reopened, 'Bob') == ['para os dois']
+
+
+def test_retention_limits_messages_without_readers():
+    log = BroadcastLog(segment_size=10, max_messages=25)
+    log.park('Ausente')
+    for index in range(100):
+        log.append(str(index))
+    assert log.retained() <= 25
+    assert _drain(log, 'Ausente')[-1] == '99'
+
+
+def test_interrupted_replay_keeps_the_rest(tmp_path):
+    for directory in (None, str(tmp_path)):
+        log = BroadcastLog(directory=directory)
+        log.park('Ana')
+        for index in range(10):
+            log.append(str(index))
+        chunks = log.pop_chunks('Ana', chunk_size=4)
+        assert next(chunks) == ['0', '1', '2', '3']
+        chunks.close()  # Cliente caiu no meio do replay
+        log.park('Ana')  # _end_session da conexão que caiu
+        log.append('depois')
+
+        assert _drain(log, 'Ana') == ['4', '5', '6', '7', '8', '9', 'depois']
+        log.close()
@@ -0,0 +1,53 @@
+from commands import CommandDispatcher, ParsedCommand
+
+
+def build_dispatcher():
+    errors, calls = [], []
+    dispatcher = CommandDispatcher(on_error=lambda client_socket, message: errors.append(message))
+
+    def handler(client_socket, username, command):
+        calls.append(command)
+        return command.verb != '-sair'
+
+    dispatcher.register('-sair', handler)
+    dispatcher.register('-msg', handler, arity=3, usage='-msg tag <usuário|grupo> <mensagem>')
+    dispatcher.register('-entrargrupo', handler, arity=1, usage='-entrargrupo NOME_DO_GRUPO')
+    dispatcher.register('-listar', handler, optional=2, usage='-listar [opções]')
+    return dispatcher, errors, calls
+
+
+def test_the_last_argument_takes_the_rest_of_the_text():
+    dispatcher, errors, calls = build_dispatcher()
+    assert dispatcher.dispatch(None, 'Ana', '-msg U Bob olá, tudo bem?')
+    assert dispatcher.dispatch(None, 'Ana', '-entrargrupo grupo com espaço')
+    assert dispatcher.dispatch(None, 'Ana', '-listar a=1')
+    assert calls[0] == ParsedCommand('-msg', ['U', 'Bob', 'olá, tudo bem?'])
+    assert list(calls[1].args) == ['grupo com espaço']
+    assert list(calls[2].args) == ['a=1']
+    assert not errors
+
+
+def test_missing_or_blank_arguments_get_the_usage():
+    dispatcher, errors, calls = build_dispatcher()
+    for message in ('-msg U Bob', '-msg U  olá', '-msg U Bob  ', '-entrargrupo', '-entrargrupo   ',
+                    '-listar a b c'):
+        assert dispatcher.dispatch(None, 'Ana', message)
+    assert not calls
+    assert errors == ['Formato inválido. Use: -msg tag <usuário|grupo> <mensagem>'] * 3 \
+        + ['Formato inválido. Use: -entrargrupo NOME_DO_GRUPO'] * 2 + ['Formato inválido. Use: -listar [opções]']
+
+
+def test_commands_without_arguments_reject_extra_text():
+    dispatcher, errors, calls = build_dispatcher()
+    assert dispatcher.dispatch(None, 'Ana', '-sair agora')
+    assert errors == ['Formato inválido. Use: -sair']
+    assert not dispatcher.dispatch(None, 'Ana', '-sair')
+    assert calls == [ParsedCommand('-sair', ())]
+
+
+def test_unknown_verbs_are_reported():
+    dispatcher, errors, calls = build_dispatcher()
+    assert dispatcher.parse('-desconhecido x') is None
+    assert dispatcher.dispatch(None, 'Ana', '-msgx U Bob oi')
+    assert errors == ['Comando desconhecido ou formato inválido.']
+    assert not calls
@@ -0,0 +1,16 @@
+from compression import Compression
+from protocol import MSG_TEXT, MessageCodec, encode_frames
+
+
+def test_context_is_created_on_the_first_large_batch():
+    compressor = Compression(threshold=256).compressor()
+    small = encode_frames(MSG_TEXT, ['oi'])
+    assert compressor.compress(small) == small
+    assert compressor._context is None
+
+    messages = [f'(Ana, 18/10/2026 - 11:00:{index:02d}): mensagem {index}' for index in range(40)]
+    client = MessageCodec(framed=True, compression=True)
+    for _ in range(2):
+        assert client.decode(compressor.compress(encode_frames(MSG_TEXT, messages))) == \
+            [(None, message) for message in messages]
+    assert compressor._context is not None
@@ -0,0 +1,83 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from connection import Connection, OverflowPolicy, SocketConnection
+from helpers import FakeConnection
+
+
+def test_drop_oldest_keeps_the_newest_messages():
+    connection = FakeConnection(queue_size=2, overflow_policy=OverflowPolicy.DROP_OLDEST)
+    for text in ('a', 'b', 'c'):
+        connection.send_message(text)
+
+    assert connection.dropped == 1
+    assert [message for _, message in connection.received()] == ['b', 'c']
+    assert not connection.closed
+
+
+def test_disconnect_aborts_the_slow_client():
+    connection = FakeConnection(queue_size=2, overflow_policy=OverflowPolicy.DISCONNECT)
+    connection.send_message('a')
+    connection.send_message('b')
+
+    with pytest.raises(BrokenPipeError):
+        connection.send_message('c')
+    assert connection.closed
+    assert connection.queue_depth == 0
+    with pytest.raises(BrokenPipeError):
+        connection.send_message('d')
+
+
+def test_spill_diverts_chat_messages_but_not_responses():
+    spilled = []
+    connection = FakeConnection(queue_size=1, overflow_policy=OverflowPolicy.SPILL,
+                                on_spill=lambda conn, message: spilled.append((conn, message)))
+    connection.send_message('a')
+    connection.send_message('b')
+
+    assert spilled == [(connection, 'b')]
+    assert connection.queue_depth == 1
+    # Respostas do servidor não podem ir para o armazenamento offline: o cliente é desconectado
+    with pytest.raises(BrokenPipeError):
+        connection.send_response('OK', 'feito')
+    assert connection.closed
+
+
+def test_senders_do_not_block_on_a_slow_client():
+    server_side, client_side = socket.socketpair()
+    client_side.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    connection = SocketConnection(server_side, queue_size=4096)
+    connection.codec.framed = True
+    try:
+        # O cliente não lê: o writer fica preso no sendall de uma mensagem maior que os buffers do socket
+        connection.send_message('x' * 4 * 1024 * 1024)
+        while connection.queue_depth:
+            time.sleep(0.01)
+        # Os envios seguintes só enfileiram, sem esperar pelo cliente
+        for _ in range(100):
+            connection.send_message('y' * 1000)
+        assert connection.queue_depth == 100
+
+        # Com o cliente lendo, a fila é esvaziada e quem espera por capacidade é liberado
+        reader = threading.Thread(target=lambda: [None for _ in iter(lambda: client_side.recv(65536), b'')],
+                                  daemon=True)
+        reader.start()
+        connection.wait_for_capacity(0)
+        assert connection.queue_depth == 0
+        connection.abort()
+        reader.join(timeout=5)
+    finally:
+        connection.abort()
+        client_side.close()
+
+
+def test_transports_must_provide_the_writer():
+    class WithoutWriter(Connection):
+        def abort(self):
+            self.closed = True
+
+    with pytest.raises(TypeError):
+        WithoutWriter()
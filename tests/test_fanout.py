@@ -0,0 +1,67 @@
+import asyncio
+import threading
+
+from fanout import FanoutPool
+
+
+def test_sender_is_not_blocked_and_keeps_its_order():
+    pool = FanoutPool(workers=2, threshold=3, shard_size=2)
+    release = threading.Event()
+    delivered = []
+
+    def deliver_shard(shard):
+        release.wait(5)
+        delivered.extend(shard)
+        return len(shard)
+
+    # Acima do threshold: o remetente retorna com a entrega ainda presa no worker
+    pool.deliver(['a1', 'a2', 'a3'], deliver_shard, 'group', sender='Ana')
+    assert pool.pending == 2
+    # Abaixo do threshold, mas com um fan-out anterior na fila: entra na mesma fila
+    pool.deliver(['a4'], delivered.extend, 'group', sender='Ana')
+    pool.after('Ana', delivered.append, 'privada de Ana')
+    # Outros remetentes não esperam pelo fan-out de Ana
+    pool.deliver(['b1'], lambda shard: delivered.extend(shard) or len(shard), 'group', sender='Bob')
+    pool.after('Bob', delivered.append, 'privada de Bob')
+    assert delivered == ['b1', 'privada de Bob']
+
+    release.set()
+    pool.close()
+    assert delivered[2:] == ['a1', 'a2', 'a3', 'a4', 'privada de Ana']
+    assert pool.pending == 0
+    # Sem entregas pendentes, after() volta a executar inline
+    pool.after('Ana', delivered.append, 'inline')
+    assert delivered[-1] == 'inline'
+
+
+def test_failed_shard_does_not_stall_the_sender():
+    pool = FanoutPool(workers=1, threshold=1, shard_size=1)
+    delivered = []
+
+    def deliver_shard(shard):
+        if shard == ['erro']:
+            raise RuntimeError('falha na entrega')
+        delivered.extend(shard)
+        return 1
+
+    pool.deliver(['erro', 'ok'], deliver_shard, 'broadcast', sender='Ana')
+    pool.after('Ana', delivered.append, 'depois')
+    pool.close()
+    assert delivered == ['ok', 'depois']
+
+
+def test_event_loop_keeps_the_order_per_sender():
+    async def scenario():
+        pool = FanoutPool(threshold=2, shard_size=1)
+        pool.use_loop(asyncio.get_running_loop())
+        delivered = []
+        pool.deliver(['a1', 'a2'], lambda shard: delivered.extend(shard) or len(shard), 'group', sender='Ana')
+        pool.after('Ana', delivered.append, 'privada')
+        # Sem remetente (ex.: repassada pelo cluster), a entrega é inline
+        pool.deliver(['x1', 'x2'], lambda shard: delivered.extend(shard) or len(shard), 'broadcast')
+        assert delivered == ['x1', 'x2']
+        await asyncio.sleep(0)
+        assert delivered == ['x1', 'x2', 'a1', 'a2', 'privada']
+        assert pool.pending == 0
+
+    asyncio.run(scenario())
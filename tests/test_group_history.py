@@ -0,0 +1,53 @@
+import pytest
+
+from group_history import GroupHistory, HistoryPage
+
+
+@pytest.fixture(params=['memória', 'disco'])
+def history(request, tmp_path):
+    directory = str(tmp_path) if request.param == 'disco' else None
+    # Com disco, as mensagens que saem do ring continuam disponíveis
+    instance = GroupHistory(capacity=4, directory=directory, segment_size=64)
+    yield instance
+    instance.close()
+
+
+def test_latest_messages_without_since(history):
+    for index in range(1, 4):
+        history.append('equipe', f'm{index}')
+    assert history.fetch('equipe', limit=2) == HistoryPage(['m2', 'm3'], 3, False)
+    assert history.fetch('equipe') == HistoryPage(['m1', 'm2', 'm3'], 3, False)
+    assert history.fetch('outro') == HistoryPage([], 0, False)
+
+
+def test_pages_after_since(history):
+    for index in range(1, 4):
+        history.append('equipe', f'm{index}')
+    assert history.fetch('equipe', since=0, limit=2) == HistoryPage(['m1', 'm2'], 2, True)
+    assert history.fetch('equipe', since=2, limit=2) == HistoryPage(['m3'], 3, False)
+    # Nada novo: a sequência informada é mantida para a próxima busca
+    assert history.fetch('equipe', since=3, limit=2) == HistoryPage([], 3, False)
+
+
+def test_messages_older_than_the_ring(history):
+    for index in range(1, 11):
+        history.append('equipe', f'm{index}')
+    page = history.fetch('equipe', since=0, limit=5)
+    if history.directory is None:
+        # Só as últimas capacity mensagens ficam em memória
+        assert page == HistoryPage([], 5, True)
+        assert history.fetch('equipe', since=5, limit=10) == HistoryPage(['m7', 'm8', 'm9', 'm10'], 10, False)
+    else:
+        assert page == HistoryPage([f'm{index}' for index in range(1, 6)], 5, True)
+        assert history.fetch('equipe', since=5, limit=10).messages == [f'm{index}' for index in range(6, 11)]
+
+
+def test_history_survives_restart(tmp_path):
+    history = GroupHistory(capacity=4, directory=str(tmp_path))
+    for index in range(1, 7):
+        history.append('equipe', f'm{index}')
+    history.close()
+
+    reopened = GroupHistory(capacity=4, directory=str(tmp_path))
+    assert reopened.append('equipe', 'm7') == 7
+    assert reopened.fetch('equipe', since=3, limit=10) == HistoryPage(['m4', 'm5', 'm6', 'm7'], 7, False)
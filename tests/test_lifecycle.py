@@ -0,0 +1,67 @@
+import socket
+import threading
+import time
+
+from connection import SocketConnection
+from helpers import FakeConnection
+from lifecycle import ConnectionLifecycle
+
+
+def idle_connection(seconds: float, framed: bool = True) -> FakeConnection:
+    connection = FakeConnection()
+    connection.codec.framed = framed
+    connection.last_seen = time.monotonic() - seconds
+    return connection
+
+
+def test_idle_and_unauthenticated_connections_are_reaped():
+    lifecycle = ConnectionLifecycle(idle_timeout=10, login_timeout=2)
+    active, idle, anonymous, closed = idle_connection(1), idle_connection(11), idle_connection(3), idle_connection(60)
+    closed.closed = True
+    for connection in (active, idle, anonymous, closed):
+        lifecycle.track(connection)
+
+    reaped = lifecycle.sweep(lambda connection: connection is not anonymous)
+    assert reaped == [idle, anonymous]
+
+    lifecycle.untrack(idle)
+    assert idle not in lifecycle.connections
+
+
+def test_heartbeat_pings_only_framed_connections_once_per_interval():
+    lifecycle = ConnectionLifecycle(heartbeat_interval=5, login_timeout=None)
+    framed, legacy = idle_connection(6), idle_connection(6, framed=False)
+    lifecycle.track(framed)
+    lifecycle.track(legacy)
+
+    assert lifecycle.sweep(lambda connection: True) == []
+    assert framed.queue_depth == 1
+    assert legacy.queue_depth == 0
+    # O ping já enviado não é repetido antes do próximo intervalo
+    lifecycle.sweep(lambda connection: True)
+    assert framed.queue_depth == 1
+
+
+def test_reaper_aborts_idle_sessions(server):
+    server.lifecycle = ConnectionLifecycle(idle_timeout=10)
+    connection = idle_connection(11)
+    server.lifecycle.track(connection)
+    server.registry.connect(connection, 'Ana')
+
+    server._sweep_connections()
+    assert connection.closed
+
+
+def test_eof_ends_the_session(server):
+    server_side, client_side = socket.socketpair()
+    connection = SocketConnection(server_side)
+    server.registry.connect(connection, 'Ana')
+    handler = threading.Thread(target=server._handle_client_messages, args=(connection,), daemon=True)
+    handler.start()
+
+    # O cliente fecha a conexão: o loop termina em vez de girar sobre recv() vazio
+    client_side.close()
+    handler.join(timeout=5)
+    assert not handler.is_alive()
+    assert server.registry.connection_of('Ana') is None
+    assert connection.closed
@@ -0,0 +1,103 @@
+import os
+
+import pytest
+
+from offline_store import RECORD_HEADER, MemoryOfflineStore, OfflineStore, SegmentLogOfflineStore, scan_records
+
+
+def _store(directory, **options):
+    return SegmentLogOfflineStore(str(directory), compaction_interval=0, **options)
+
+
+def _drain(store, username, chunk_size=256):
+    return [message for chunk in store.pop_chunks(username, chunk_size) for message in chunk]
+
+
+def test_segment_records_round_trip(tmp_path):
+    store = _store(tmp_path, segment_size=64)
+    messages = [f'mensagem {index} çãõ' for index in range(20)]
+    for message in messages:
+        store.append('Ana', message)
+    store.close()
+
+    directory = tmp_path / 'Ana'.encode('utf-8').hex()
+    segments = sorted(os.listdir(directory))
+    assert len(segments) > 1
+    stored = [message for name in segments for _, message in scan_records(str(directory / name))]
+    assert stored == messages
+
+    reopened = _store(tmp_path, segment_size=64)
+    assert reopened.pending('Ana') == len(messages)
+    assert _drain(reopened, 'Ana', chunk_size=7) == messages
+    assert reopened.pending('Ana') == 0
+
+
+def test_quota_survives_restart(tmp_path):
+    store = _store(tmp_path, quota=5)
+    for index in range(12):
+        store.append('Ana', str(index))
+    store.close()
+
+    reopened = _store(tmp_path, quota=5)
+    assert reopened.pending('Ana') == 5
+    assert _drain(reopened, 'Ana') == ['7', '8', '9', '10', '11']
+
+
+def test_interrupted_replay_keeps_the_rest(tmp_path):
+    store = _store(tmp_path)
+    for index in range(10):
+        store.append('Ana', str(index))
+    chunks = store.pop_chunks('Ana', chunk_size=4)
+    assert next(chunks) == ['0', '1', '2', '3']
+    chunks.close()  # Cliente caiu no meio do replay
+
+    reopened = _store(tmp_path)
+    assert _drain(reopened, 'Ana') == ['4', '5', '6', '7', '8', '9']
+
+
+def test_torn_record_is_ignored(tmp_path):
+    store = _store(tmp_path)
+    store.append('Ana', 'inteira')
+    store.close()
+    directory = tmp_path / 'Ana'.encode('utf-8').hex()
+    segment = directory / os.listdir(directory)[0]
+    with open(segment, 'ab') as file:
+        file.write(RECORD_HEADER.pack(0.0, 100) + b'cortada')
+
+    assert _drain(_store(tmp_path), 'Ana') == ['inteira']
+
+
+def test_failed_compaction_keeps_the_segments(tmp_path, monkeypatch):
+    store = _store(tmp_path, segment_size=64, quota=15)
+    messages = [f'mensagem {index}' for index in range(20)]
+    for message in messages:
+        store.append('Ana', message)
+
+    def interrupted(source, destination):
+        raise OSError('queda durante a compactação')
+
+    monkeypatch.setattr(os, 'replace', interrupted)
+    try:
+        store.compact()
+    except OSError:
+        pass
+    monkeypatch.undo()
+    store.close()
+
+    assert _drain(_store(tmp_path, segment_size=64, quota=15), 'Ana') == messages[5:]
+
+
+def test_stores_must_implement_the_whole_interface():
+    class WithoutReplay(OfflineStore):
+        def append(self, username, message):
+            pass
+
+        def pending(self, username):
+            return 0
+
+        def backlog_bytes(self):
+            return 0
+
+    with pytest.raises(TypeError):
+        WithoutReplay()
+    assert MemoryOfflineStore().pending('Ana') == 0
@@ -0,0 +1,54 @@
+import pytest
+
+from protocol import (HANDSHAKE, MSG_COMMAND, MSG_OK, MSG_PING, MSG_PONG, MSG_TEXT, FrameDecoder, MessageCodec,
+                      ProtocolError, encode_frame, encode_frames)
+
+
+def test_split_frames_are_reassembled():
+    data = encode_frame(MSG_TEXT, 'olá, mundo')
+    decoder = FrameDecoder()
+    frames = []
+    for index in range(len(data)):
+        frames += decoder.feed(data[index:index + 1])
+    assert frames == [(MSG_TEXT, 'olá, mundo'.encode('utf-8'))]
+
+
+def test_merged_frames_are_split():
+    data = encode_frames(MSG_COMMAND, ['-listarusuarios', '-msg U Ana oi', '']) + encode_frame(MSG_OK, 'ok')
+    decoder = FrameDecoder()
+    # Três frames inteiros e o começo do quarto na mesma leitura
+    assert decoder.feed(data[:-2]) == [(MSG_COMMAND, b'-listarusuarios'), (MSG_COMMAND, b'-msg U Ana oi'),
+                                       (MSG_COMMAND, b'')]
+    assert decoder.feed(data[-2:]) == [(MSG_OK, b'ok')]
+
+
+def test_unknown_version_is_rejected():
+    frame = bytearray(encode_frame(MSG_TEXT, 'x'))
+    frame[0] = 99
+    with pytest.raises(ProtocolError):
+        FrameDecoder().feed(bytes(frame))
+
+
+def test_framed_handshake_and_pipelined_commands():
+    client = MessageCodec(framed=True)
+    data = client.handshake('Ana') + client.encode_commands(['-listarusuarios', '-sair'])
+    server = MessageCodec()
+    # Handshake fragmentado: nada é interpretado até ele estar completo
+    assert server.decode_commands(data[:2]) == []
+    assert server.decode_commands(data[2:]) == ['Ana', '-listarusuarios', '-sair']
+    assert server.framed
+
+
+def test_legacy_client_falls_back_to_plain_text():
+    server = MessageCodec()
+    assert server.decode_commands('Ana'.encode('utf-8')) == ['Ana']
+    assert server.framed is False
+    assert server.decode_commands(b'-listarusuarios') == ['-listarusuarios']
+    assert server.encode_response('OK', 'pronto') == b'OK        \npronto'
+
+
+def test_ping_is_answered_and_hidden():
+    server = MessageCodec()
+    server.decode_commands(HANDSHAKE)
+    assert server.decode_commands(encode_frame(MSG_PING, b'') + encode_frame(MSG_COMMAND, '-sair')) == ['-sair']
+    assert server.take_replies() == encode_frame(MSG_PONG, b'')
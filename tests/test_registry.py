@@ -0,0 +1,71 @@
+from registry import SessionRegistry
+
+
+def test_indexes_stay_consistent():
+    registry = SessionRegistry()
+    first, second = object(), object()
+    assert registry.connect(first, 'Ana')
+    assert not registry.connect(second, 'Ana')  # Nome já usado por outra conexão
+    assert registry.connection_of('Ana') is first
+    assert registry.username_of(first) == 'Ana'
+
+    assert registry.disconnect(first) == 'Ana'
+    assert registry.connection_of('Ana') is None
+    assert registry.disconnect(first) is None
+
+
+def test_session_snapshots_are_rebuilt_after_changes():
+    registry = SessionRegistry()
+    ana, bob = object(), object()
+    registry.connect(ana, 'Ana')
+    sessions = registry.sessions()
+    assert sessions == ((ana, 'Ana'),)
+    assert registry.sessions() is sessions  # Reaproveitado enquanto nada muda
+
+    registry.connect(bob, 'Bob')
+    assert sessions == ((ana, 'Ana'),)  # Quem já tinha o snapshot não o vê mudar
+    assert registry.sessions() == ((ana, 'Ana'), (bob, 'Bob'))
+    assert registry.sorted_online_users() == ('Ana', 'Bob')
+
+    registry.disconnect(ana)
+    assert registry.sessions() == ((bob, 'Bob'),)
+    assert registry.online_users() == ('Bob',)
+    assert registry.sorted_online_users() == ('Bob',)
+
+
+def test_group_snapshots_are_rebuilt_after_changes():
+    registry = SessionRegistry()
+    assert registry.create_group('equipe', 'Bob')
+    assert not registry.create_group('equipe', 'Ana')
+    members = registry.members('equipe')
+    assert members == ('Bob',)
+    assert registry.group_names() == ('equipe',)
+
+    assert registry.join_group('equipe', 'Ana')
+    assert not registry.join_group('equipe', 'Ana')
+    assert members == ('Bob',)
+    assert registry.members('equipe') == ('Bob', 'Ana')  # Ordem de entrada
+    assert registry.sorted_members('equipe') == ('Ana', 'Bob')
+
+    assert registry.leave_group('equipe', 'Bob')
+    assert registry.members('equipe') == ('Ana',)
+    assert registry.sorted_members('equipe') == ('Ana',)
+
+    registry.create_group('amigos', 'Ana')
+    assert registry.sorted_group_names() == ('amigos', 'equipe')
+    registry.load_groups({'novo': ['Caio']})
+    assert registry.group_names() == ('novo',)
+    assert registry.members('novo') == ('Caio',)
+
+
+def test_replace_moves_the_session_and_the_subscription():
+    registry = SessionRegistry()
+    old, new = object(), object()
+    registry.connect(old, 'Ana')
+    assert registry.subscribe_presence(old)
+    assert registry.presence_subscriptions() == (old,)
+
+    assert registry.replace(old, new) == 'Ana'
+    assert registry.connection_of('Ana') is new
+    assert registry.sessions() == ((new, 'Ana'),)
+    assert registry.presence_subscriptions() == (new,)
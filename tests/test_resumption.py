@@ -0,0 +1,85 @@
+import asyncio
+
+from helpers import FakeConnection, serving
+from registry import SessionRegistry
+from resumption import SessionResumption
+from sdk import ChatClient
+
+
+def open_session(resumption, registry, username='Ana'):
+    connection = FakeConnection()
+    registry.connect(connection, username)
+    token = resumption.open(connection, username)
+    return connection, token
+
+
+def test_resume_replays_only_the_missed_messages():
+    resumption, registry = SessionResumption(), SessionRegistry()
+    connection, token = open_session(resumption, registry)
+    for text in ('m1', 'm2', 'm3'):
+        connection.send_message(text)
+    assert resumption.suspend(registry, connection)
+
+    # Durante a janela o usuário segue online: as mensagens são numeradas e guardadas
+    registry.connection_of('Ana').send_message('m4')
+    assert registry.online_users() == ('Ana',)
+
+    new_connection, replayed = FakeConnection(), []
+    assert resumption.resume(registry, new_connection, 'Ana', token, 1,
+                             lambda connection, missed: replayed.extend(missed))
+    assert replayed == ['m2', 'm3', 'm4']
+    assert registry.connection_of('Ana') is new_connection
+    assert resumption.suspended() == 0
+
+
+def test_resume_is_refused_with_a_bad_token_or_lost_messages():
+    resumption, registry = SessionResumption(buffer_size=2), SessionRegistry()
+    connection, token = open_session(resumption, registry)
+    for text in ('m1', 'm2', 'm3'):
+        connection.send_message(text)
+    resumption.suspend(registry, connection)
+    on_resumed = lambda connection, missed: None  # noqa: E731
+
+    assert not resumption.resume(registry, FakeConnection(), 'Ana', 'outro', 3, on_resumed)
+    # A mensagem 1 já saiu do buffer
+    assert not resumption.resume(registry, FakeConnection(), 'Ana', token, 0, on_resumed)
+    assert resumption.resume(registry, FakeConnection(), 'Ana', token, 1, on_resumed)
+
+
+def test_expired_session_returns_the_gap():
+    resumption, registry = SessionResumption(grace_period=0), SessionRegistry()
+    connection, token = open_session(resumption, registry)
+    resumption.suspend(registry, connection)
+    registry.connection_of('Ana').send_message('na janela')
+
+    [placeholder] = resumption.expired()
+    assert resumption.end(placeholder) == ['na janela']
+    assert not resumption.resume(registry, FakeConnection(), 'Ana', token, 0, lambda connection, missed: None)
+
+
+def test_client_resumes_after_a_dropped_connection():
+    async def scenario():
+        async with serving(resumption=SessionResumption()) as (server, port):
+            received = []
+            ana = ChatClient('localhost', port, on_message=lambda message: received.append(message.text))
+            bob = ChatClient('localhost', port)
+            await ana.connect('ana')
+            await bob.connect('bob')
+            await bob.send_private('ana', 'antes')
+            while not received:
+                await asyncio.sleep(0.01)
+
+            ana._client.writer.transport.abort()
+            while server.resumption.suspended() == 0:
+                await asyncio.sleep(0.01)
+            await bob.send_private('ana', 'durante')
+
+            assert await ana.resume()
+            await bob.send_private('ana', 'depois')
+            while len(received) < 3:
+                await asyncio.sleep(0.01)
+            assert received == ['antes', 'durante', 'depois']
+            await ana.close()
+            await bob.close()
+
+    asyncio.run(asyncio.wait_for(scenario(), 10))
@@ -0,0 +1,55 @@
+import asyncio
+
+from helpers import serving
+from sdk import ChatClient, Response
+
+
+def test_responses_are_matched_to_commands_in_order():
+    async def scenario():
+        client = ChatClient('localhost', 0)
+        client.acknowledged = True
+        first, second = client._expect('-msg U Bob oi'), client._expect('-entrargrupo equipe')
+        client._receive('OK', '')
+        client._receive(None, '(Bob, 01/01/2026 - 10:00:00): olá')  # Mensagens de chat não consomem respostas
+        client._receive('ERROR', 'Grupo não encontrado.')
+        assert await first == Response(True, '')
+        assert await second == Response(False, 'Grupo não encontrado.')
+        assert (await client._inbox.get()).sender == 'Bob'
+
+    asyncio.run(scenario())
+
+
+def test_unanswered_commands_are_not_awaited_without_acknowledge():
+    async def scenario():
+        unmatched = []
+        client = ChatClient('localhost', 0, on_response=unmatched.append)
+        assert client._expect('-msg U Bob oi') is None
+        listing = client._expect('-listarusuarios')
+        client._receive('OK', 'Usuários online:\nAna')
+        client._receive('ERROR', 'Usuário não encontrado.')
+        assert (await listing).lines == ['Ana']
+        assert unmatched == [Response(False, 'Usuário não encontrado.')]
+
+    asyncio.run(scenario())
+
+
+def test_every_command_gets_its_own_response():
+    async def scenario():
+        async with serving() as (server, port):
+            ana, bob = ChatClient('localhost', port), ChatClient('localhost', port)
+            await ana.connect('ana')
+            await bob.connect('bob')
+            assert ana.acknowledged
+            async with ana.batch() as batch:
+                batch.send_private('bob', 'oi')
+                batch.send_private('ninguem', 'oi')
+                batch.command('-entrargrupo inexistente')
+                batch.command('-criargrupo equipe')
+                batch.send_group('equipe', 'olá')
+            assert [response.ok for response in batch.results] == [True, False, False, True, True]
+            assert (await anext(bob.messages())).text == 'oi'
+
+            await ana.close()
+            await bob.close()
+
+    asyncio.run(scenario())
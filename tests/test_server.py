@@ -0,0 +1,100 @@
+import socket
+
+import pytest
+
+from helpers import FakeConnection
+from protocol import MORE_RESULTS, PRESENCE_HEADER
+from server import LISTING_USAGE, Server, remove_stale_socket
+
+
+def test_stale_socket_is_removed(tmp_path):
+    path = str(tmp_path / 'chat.sock')
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.close()
+
+    remove_stale_socket(path)
+    assert not (tmp_path / 'chat.sock').exists()
+    remove_stale_socket(path)  # Nada no caminho
+
+
+def test_regular_file_is_kept(tmp_path):
+    path = tmp_path / 'chat.sock'
+    path.write_text('dados')
+
+    with pytest.raises(FileExistsError):
+        remove_stale_socket(str(path))
+    assert path.read_text() == 'dados'
+
+
+def test_group_name_with_nul_is_rejected(server):
+    connection = FakeConnection()
+    server.registry.connect(connection, 'Ana')
+
+    server._process_message(connection, 'Ana', '-criargrupo a\0b')
+    assert connection.received() == [('ERROR', 'Nome de grupo inválido.')]
+    assert not server.registry.has_group('a\0b')
+
+
+def test_page_by_prefix_cursor_and_limit():
+    names = ('Ana', 'Andre', 'Antonio', 'Bia', 'Bruno')
+    assert Server._page(names, {'prefixo': 'An'}) == (('Ana', 'Andre', 'Antonio'), False)
+    assert Server._page(names, {'prefixo': 'An', 'limite': '2'}) == (('Ana', 'Andre'), True)
+    assert Server._page(names, {'prefixo': 'An', 'apos': 'Andre', 'limite': '2'}) == (('Antonio',), False)
+    assert Server._page(names, {'apos': 'Antonio'}) == (('Bia', 'Bruno'), False)
+    assert Server._page(names, {'prefixo': 'C'}) == ((), False)
+
+
+def test_user_listing_pages(server):
+    connection = FakeConnection()
+    for name in ('Ana', 'Andre', 'Bia'):
+        server.registry.connect(FakeConnection(), name)
+
+    server._process_message(connection, 'Ana', '-listarusuarios prefixo=an limite=1')
+    server._process_message(connection, 'Ana', '-listarusuarios prefixo=an apos=Ana')
+    server._process_message(connection, 'Ana', '-listarusuarios limite=0')
+    assert connection.received() == [
+        ('OK', f'Usuários online {MORE_RESULTS}:\nAna'),
+        ('OK', 'Usuários online:\nAndre'),
+        ('ERROR', f'Formato inválido. Use: -listarusuarios {LISTING_USAGE}'),
+    ]
+
+
+def test_presence_events_reach_only_subscribers(server):
+    subscriber, other = FakeConnection(), FakeConnection()
+    server.registry.connect(subscriber, 'Ana')
+    server.registry.connect(other, 'Bob')
+    server._process_message(subscriber, 'Ana', '-assinarpresenca')
+    assert subscriber.received() == [('OK', 'Presença assinada.')]
+
+    newcomer = FakeConnection()
+    server._register_client(newcomer, 'Caio', newcomer.address)
+    server._remove_client(newcomer)
+    assert subscriber.received() == [(PRESENCE_HEADER, '+Caio'), (PRESENCE_HEADER, '-Caio')]
+    assert other.received() == []
+
+    # Quem sai deixa de receber os eventos
+    server._remove_client(subscriber)
+    server._register_client(FakeConnection(), 'Davi', None)
+    assert subscriber.received() == []
+
+
+def test_monotonic_metrics_are_exported_as_counters():
+    server = Server('localhost', 0, metrics=True)
+    try:
+        connection = FakeConnection(queue_size=1)
+        server.registry.connect(connection, 'Ana')
+        connection.send_message('a')
+        connection.send_message('b')
+        exposition = server.metrics.render_prometheus()
+        assert 'TYPE psd_outbound_dropped_total counter' in exposition
+        assert 'TYPE psd_log_dropped_total counter' in exposition
+        assert 'TYPE psd_outbound_queue_depth_sum gauge' in exposition
+        assert 'psd_outbound_dropped_total 1' in exposition
+
+        # Os descartes de uma conexão encerrada continuam somados
+        server._remove_client(connection)
+        assert 'psd_outbound_dropped_total 1' in server.metrics.render_prometheus()
+    finally:
+        server.server_socket.close()
+        server.fanout.close()
@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from state_store import JOURNAL_HEADER, SNAPSHOT_NAME, StateStore
+
+
+def _reopen(directory):
+    store = StateStore(str(directory), snapshot_interval=0)
+    return store, store.load()
+
+
+def test_journal_replay_restores_users_and_groups(tmp_path):
+    store, _ = _reopen(tmp_path)
+    store.add_user('Ana')
+    store.add_user('Bob')
+    store.create_group('equipe', 'Ana')
+    store.join_group('equipe', 'Bob')
+    store.create_group('vazio', 'Bob')
+    store.leave_group('vazio', 'Bob')
+    store.close()  # Sem start(): nenhum snapshot, apenas o journal
+
+    _, (users, groups) = _reopen(tmp_path)
+    assert users == {'Ana', 'Bob'}
+    assert groups == {'equipe': ['Ana', 'Bob'], 'vazio': []}
+
+
+def test_snapshot_round_trip_with_later_journal(tmp_path):
+    store, _ = _reopen(tmp_path)
+    state = (['Ana', 'Bob', 'Çécile'], {'equipe': ('Ana', 'Bob'), 'grupo com espaço': ('Çécile',)})
+    store.start(lambda: state)
+    store.snapshot()
+    # Alterações posteriores ao snapshot ficam apenas no journal da nova geração
+    store.add_user('Dan')
+    store.join_group('equipe', 'Dan')
+    store._changes = 0  # close() não grava outro snapshot
+    store.close()
+    assert os.path.exists(tmp_path / SNAPSHOT_NAME)
+
+    _, (users, groups) = _reopen(tmp_path)
+    assert users == {'Ana', 'Bob', 'Çécile', 'Dan'}
+    assert groups == {'equipe': ['Ana', 'Bob', 'Dan'], 'grupo com espaço': ['Çécile']}
+
+
+def test_empty_snapshot_round_trip(tmp_path):
+    store, _ = _reopen(tmp_path)
+    store.start(lambda: ([], {}))
+    store.snapshot()
+    store.close()
+
+    _, (users, groups) = _reopen(tmp_path)
+    assert users == set()
+    assert groups == {}
+
+
+def test_journal_replay_ignores_torn_record(tmp_path):
+    store, _ = _reopen(tmp_path)
+    store.add_user('Ana')
+    store.close()
+    journal = max(name for name in os.listdir(tmp_path) if name.startswith('journal-'))
+    with open(tmp_path / journal, 'ab') as file:
+        # Registro cortado por uma queda: o cabeçalho anuncia mais bytes do que foram gravados
+        file.write(JOURNAL_HEADER.pack(b'U', 10) + b'Bo')
+
+    _, (users, _) = _reopen(tmp_path)
+    assert users == {'Ana'}
+
+
+def test_names_with_the_separator_are_rejected(tmp_path):
+    store, _ = _reopen(tmp_path)
+    with pytest.raises(ValueError):
+        store.create_group('a\0b', 'Ana')
+    store.create_group('equipe', 'Ana')
+    store.close()
+
+    _, (_, groups) = _reopen(tmp_path)
+    assert groups == {'equipe': ['Ana']}
@@ -1,3 +1,5 @@
+import time
+
 
 def extract_command_parts(command: str, expected_parts: int) -> list[str] | None:
     """
@@ -17,3 +19,24 @@ def extract_command_parts(command: str, expected_parts: int) -> list[str] | None
     if len(parts) != expected_parts or not all(part.strip() for part in parts):
         return None
     return parts
+
+
+_timestamp_cache = {}  # {formato: (segundo, texto formatado)}
+
+
+def current_timestamp(fmt: str = "%d/%m/%Y - %H:%M:%S") -> str:
+    """
+    Retorna a data e hora atuais no formato pedido. O texto é formatado no máximo uma vez
+    por segundo para cada formato; as demais chamadas no mesmo segundo reutilizam o resultado.
+
+    Args:
+        fmt (str): Formato aceito por time.strftime.
+
+    Returns:
+        str: A data e hora formatadas.
+    """
+    second = int(time.time())
+    cached = _timestamp_cache.get(fmt)
+    if cached is None or cached[0] != second:
+        cached = _timestamp_cache[fmt] = (second, time.strftime(fmt, time.localtime(second)))
+    return cached[1]